@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Variables del archivo .env, una sola vez y antes de que los módulos lean su configuración
+load_dotenv()
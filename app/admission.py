@@ -0,0 +1,290 @@
+"""
+Control de admisión de las rutas que consultan MongoDB.
+
+1. Límite de tasa por cliente (token bucket): la clave es el `sub` del JWT si la petición
+   trae un token válido, o la IP en otro caso. Cada petición consume fichas según su costo:
+   una búsqueda por id cuesta poco; búsquedas de texto, filtros con regex y páginas grandes
+   cuestan más. Sin fichas se responde 429 con `Retry-After`.
+2. Límite global de concurrencia: como mucho `MAX_CONCURRENT_DB_REQUESTS` peticiones usan la
+   base a la vez; si una espera turno más de `MAX_QUEUE_WAIT_SECONDS` se descarta con 503.
+
+El estado de los buckets vive en memoria del proceso; con varias réplicas puede usarse un
+backend compartido (`RATE_LIMIT_BACKEND=mongo`) o uno propio con `set_backend`.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Optional, Protocol, Tuple, Union
+
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from pymongo import ReturnDocument
+
+from .security import ALGORITHM, SECRET_KEY
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Fichas máximas por cliente (ráfaga) y fichas que se recuperan por segundo
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "60"))
+RATE_LIMIT_REFILL_PER_SECOND = float(os.getenv("RATE_LIMIT_REFILL_PER_SECOND", "10"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+MAX_CONCURRENT_DB_REQUESTS = int(os.getenv("MAX_CONCURRENT_DB_REQUESTS", "32"))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("MAX_QUEUE_WAIT_SECONDS", "0.5"))
+
+# Costo en fichas de cada tipo de operación
+COSTS = {
+    "id": 1.0,        # búsqueda por _id
+    "list": 2.0,      # listado con filtros de igualdad
+    "text": 5.0,      # adicional por búsqueda de texto (`q`)
+    "text_sort": 3.0, # adicional por ordenar una búsqueda de texto (top-k en memoria)
+    "regex": 3.0,     # adicional por filtros de prefijo (regex)
+    "per_100": 2.0,   # adicional por cada 100 resultados pedidos
+}
+
+# Clientes distintos que se recuerdan en memoria (los más antiguos se olvidan)
+MAX_TRACKED_CLIENTS = 100_000
+
+
+class RateLimitBackend(Protocol):
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        """Intenta consumir `cost` fichas. Devuelve `(admitida, segundos hasta tener fichas)`."""
+        ...
+
+
+class InMemoryBackend:
+    """Buckets en memoria del proceso (LRU acotado a `MAX_TRACKED_CLIENTS`)."""
+
+    def __init__(self, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class MongoBackend:
+    """
+    Buckets compartidos entre réplicas en una colección de MongoDB. Cada petición es una
+    sola actualización atómica (pipeline) que recarga el bucket y descuenta el costo.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._ready = False
+
+    async def take(self, key: str, cost: float, capacity: float, rate: float) -> Tuple[bool, float]:
+        if not self._ready:
+            # Los buckets inactivos se borran solos cuando ya estarían llenos
+            await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+            self._ready = True
+        now = time.time()
+        expires = datetime.now(timezone.utc) + timedelta(seconds=capacity / rate)
+        refilled = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updatedAt", now]}]}, rate]},
+        ]}]}
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"available": refilled}},
+                {"$set": {
+                    "allowed": {"$gte": ["$available", cost]},
+                    "tokens": {"$cond": [
+                        {"$gte": ["$available", cost]}, {"$subtract": ["$available", cost]}, "$available",
+                    ]},
+                    "updatedAt": now,
+                    "expiresAt": expires,
+                }},
+                {"$unset": "available"},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        allowed = bucket["allowed"]
+        return allowed, 0.0 if allowed else (cost - bucket["tokens"]) / rate
+
+
+_backend: Optional[RateLimitBackend] = None
+
+
+def set_backend(backend: RateLimitBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> RateLimitBackend:
+    global _backend
+    if _backend is None:
+        if RATE_LIMIT_BACKEND == "mongo":
+            from .database import get_database
+            _backend = MongoBackend(get_database().get_collection("rate_limits"))
+        else:
+            _backend = InMemoryBackend()
+    return _backend
+
+
+# --- Identificación del cliente ---
+
+@lru_cache(maxsize=4096)
+def _token_claims(token: str) -> Tuple[Optional[str], Optional[float]]:
+    # Solo se cachean los tokens válidos (una excepción no queda en la caché)
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    return claims.get("sub"), claims.get("exp")
+
+
+def _token_subject(token: str) -> Optional[str]:
+    try:
+        subject, expires = _token_claims(token)
+    except JWTError:
+        return None
+    # La firma se verifica una vez por token, pero el vencimiento en cada petición
+    if expires is not None and expires <= time.time():
+        return None
+    return subject
+
+
+def client_key(request: Request) -> str:
+    """`sub` del JWT si la petición trae un token válido; si no, la IP del cliente."""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        subject = _token_subject(authorization[7:].strip())
+        if subject:
+            return f"sub:{subject}"
+    return f"ip:{request.client.host if request.client else 'desconocido'}"
+
+
+# --- Costos ---
+
+def list_cost(request: Request) -> float:
+    """Costo del listado según los filtros y el tamaño de página pedidos."""
+    params = request.query_params
+    cost = COSTS["list"]
+    if params.get("q"):
+        cost += COSTS["text"] + (COSTS["text_sort"] if params.get("sort") else 0)
+    if params.get("subscription_level"):
+        cost += COSTS["regex"]
+    try:
+        limit = int(params.get("limit", 20))
+    except ValueError:
+        limit = 20
+    # Las páginas muy grandes (streaming) pueden vaciar el bucket, pero no superarlo
+    return min(cost + COSTS["per_100"] * max(limit, 0) / 100, RATE_LIMIT_CAPACITY)
+
+
+# --- Concurrencia ---
+
+_db_slots: Optional[asyncio.Semaphore] = None
+
+metrics: Dict[str, int] = {"admitted": 0, "rateLimited": 0, "shed": 0, "inUse": 0}
+
+
+def _slots() -> asyncio.Semaphore:
+    global _db_slots
+    if _db_slots is None:
+        _db_slots = asyncio.Semaphore(MAX_CONCURRENT_DB_REQUESTS)
+    return _db_slots
+
+
+class _Slot:
+    """Cupo de concurrencia de una petición; se libera una sola vez."""
+
+    def __init__(self, slots: asyncio.Semaphore):
+        self._slots = slots
+        self.held = True
+        self.handed_off = False
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            metrics["inUse"] -= 1
+            self._slots.release()
+
+
+def admit(cost: Union[float, Callable[[Request], float]] = COSTS["id"]):
+    """
+    Dependencia de FastAPI que aplica el límite de tasa con el costo dado (fijo o calculado
+    a partir de la petición) y reserva un cupo de concurrencia mientras dura el handler
+    (o mientras dura el cuerpo, si el handler lo pasa a `hold_slot`).
+    """
+
+    async def dependency(request: Request):
+        if RATE_LIMIT_ENABLED:
+            weight = cost(request) if callable(cost) else cost
+            allowed, retry_after = await get_backend().take(
+                client_key(request), weight, RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL_PER_SECOND
+            )
+            if not allowed:
+                metrics["rateLimited"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Demasiadas solicitudes, intente más tarde",
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+                )
+
+        slots = _slots()
+        if slots.locked():
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=MAX_QUEUE_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                metrics["shed"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Servicio saturado, intente más tarde",
+                    headers={"Retry-After": "1"},
+                )
+        else:
+            await slots.acquire()
+        metrics["admitted"] += 1
+        metrics["inUse"] += 1
+        slot = request.state.db_slot = _Slot(slots)
+        try:
+            yield
+        finally:
+            if not slot.handed_off:
+                slot.release()
+
+    return dependency
+
+
+def hold_slot(request: Request, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Conserva el cupo de la petición hasta que `body` termina o se cierra. La salida de una
+    dependencia con `yield` ocurre antes de enviar el cuerpo de un `StreamingResponse`, así
+    que sin esto el streaming leería el cursor sin cupo.
+    """
+    slot: Optional[_Slot] = getattr(request.state, "db_slot", None)
+    if slot is None:
+        return body
+    slot.handed_off = True
+
+    async def held() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            slot.release()
+
+    return held()
+
+
+def release_slot(request: Request) -> None:
+    """Libera el cupo pasado a `hold_slot` (tarea de fondo por si el cuerpo nunca empezó)."""
+    slot: Optional[_Slot] = getattr(request.state, "db_slot", None)
+    if slot is not None:
+        slot.release()
+
+
+def stats() -> Dict[str, int]:
+    return {**metrics, "capacity": MAX_CONCURRENT_DB_REQUESTS}
@@ -0,0 +1,169 @@
+"""
+Registro de auditoría de las escrituras del catálogo (write-behind).
+
+Cada alta, edición o borrado de la API (también los masivos) deja una entrada con quién
+la hizo (`sub` y rol del JWT), qué convocatoria tocó y la diferencia campo por campo entre
+antes y después. La ruta no escribe la entrada: la deja en una cola en memoria y sigue.
+Una tarea de fondo la vacía con `insert_many` por lotes, al juntar `AUDIT_BATCH_SIZE`
+entradas o cada `AUDIT_FLUSH_SECONDS`, y al apagar se escribe lo que quede.
+
+La cola tiene un tamaño máximo: si la base no da abasto y se llena, las escrituras esperan
+un cupo (contrapresión) hasta `AUDIT_ENQUEUE_TIMEOUT` segundos; pasado ese tiempo la
+entrada se descarta y se cuenta en `GET /metrics`, para que la auditoría nunca deje a la
+API sin responder.
+
+Las entradas se guardan en la colección `audit_log` (solo con el backend `mongo`).
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+AUDIT_COLLECTION = "audit_log"
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", "0.5"))
+
+AUDIT_INDEXES = [
+    IndexModel([("convocatoriaId", ASCENDING), ("at", DESCENDING)], name="convocatoriaId_at_index"),
+    IndexModel([("actor", ASCENDING), ("at", DESCENDING)], name="actor_at_index"),
+    IndexModel([("at", DESCENDING)], name="at_index"),
+]
+
+# Campos que no se auditan: el id va aparte y `norm` se deriva de los demás
+_SKIPPED_FIELDS = {"_id", "norm"}
+
+
+def diff(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Campos que cambian entre dos versiones de un documento, con su valor anterior y nuevo."""
+    before, after = before or {}, after or {}
+    changes = {}
+    for field in before.keys() | after.keys():
+        if field in _SKIPPED_FIELDS or before.get(field) == after.get(field):
+            continue
+        changes[field] = {"before": before.get(field), "after": after.get(field)}
+    return changes
+
+
+def entry(user, action: str, before: Optional[Dict[str, Any]] = None, after: Optional[Dict[str, Any]] = None,
+          **extra: Any) -> Dict[str, Any]:
+    """Entrada de auditoría de una escritura de `user` (`TokenData`)."""
+    document = before if before is not None else after
+    return {
+        "at": datetime.now(timezone.utc),
+        "actor": user.sub,
+        "role": user.role,
+        "action": action,
+        "convocatoriaId": str(document["_id"]) if document is not None else None,
+        "changes": diff(before, after),
+        **extra,
+    }
+
+
+class AuditLog:
+    """Cola acotada de entradas pendientes y escritor por lotes."""
+
+    def __init__(self, batch_size: int = AUDIT_BATCH_SIZE, max_queue: int = AUDIT_QUEUE_SIZE,
+                 enqueue_timeout: float = AUDIT_ENQUEUE_TIMEOUT):
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # Lote tomado de la cola que todavía no se pudo escribir
+        self._batch: List[Dict[str, Any]] = []
+        self.enabled = False
+        self.written = 0
+        self.waited = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._queue.qsize() + len(self._batch)
+
+    async def record(self, item: Dict[str, Any]) -> bool:
+        """Encola una entrada; solo espera si la cola está llena. Devuelve False si se descartó."""
+        if not self.enabled:
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self.waited += 1
+        try:
+            await asyncio.wait_for(self._queue.put(item), timeout=self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            return False
+
+    def _take(self) -> None:
+        while len(self._batch) < self.batch_size:
+            try:
+                self._batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _write(self, collection) -> int:
+        if not self._batch:
+            return 0
+        await collection.insert_many(self._batch, ordered=False)
+        written, self._batch = len(self._batch), []
+        self.written += written
+        return written
+
+    async def flush(self, collection) -> int:
+        """Escribe todo lo pendiente (al apagar)."""
+        written = await self._write(collection)
+        while not self._queue.empty():
+            self._take()
+            written += await self._write(collection)
+        return written
+
+    async def run(self, collection, interval: float = AUDIT_FLUSH_SECONDS) -> None:
+        """Tarea de fondo: escribe un lote cuando se llena o `interval` segundos después de su primera entrada."""
+        self.enabled = True
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._batch:
+                self._batch.append(await self._queue.get())
+            deadline = loop.time() + interval
+            while True:
+                self._take()
+                remaining = deadline - loop.time()
+                if len(self._batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(collection)
+            except Exception as e:
+                # El lote se conserva; mientras tanto la cola se llena y aplica contrapresión
+                print(f"⚠️  No se pudo escribir el registro de auditoría ({len(self._batch)} entradas): {e}")
+                await asyncio.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "pending": len(self), "written": self.written,
+                "waited": self.waited, "dropped": self.dropped}
+
+
+log = AuditLog()
+
+
+async def record(user, action: str, before: Optional[Dict[str, Any]] = None, after: Optional[Dict[str, Any]] = None,
+                 **extra: Any) -> bool:
+    """Registra una escritura de la API en el log de auditoría (sin esperar a la base)."""
+    if not log.enabled:
+        return False
+    return await log.record(entry(user, action, before, after, **extra))
+
+
+async def prepare(database) -> None:
+    await database.get_collection(AUDIT_COLLECTION).create_indexes(AUDIT_INDEXES)
+
+
+def stats() -> Dict[str, Any]:
+    return log.stats()
@@ -0,0 +1,322 @@
+"""
+Versión activa del catálogo de convocatorias.
+
+El catálogo vive en una colección versionada; un documento puntero en `catalog_meta`
+indica cuál es la activa. Las recargas completas construyen una colección nueva y al final
+mueven el puntero, así que los lectores siempre ven un catálogo completo.
+
+Cada proceso guarda en memoria el nombre de la colección activa, lo refresca
+periódicamente (`watch`) y avisa a los suscriptores (`on_switch`) cuando cambia, para que
+las cachés en memoria se reconstruyan sobre la nueva versión. Las escrituras puntuales de la
+API se anuncian con `publish_change` para que esas cachés se actualicen sin reconstruirse;
+las ediciones y borrados masivos, con un solo `publish_bulk_change` por operación.
+
+Mientras se construye una versión nueva (`begin_build`), el puntero lo indica en `building`
+y las escrituras sobre la versión activa se rechazan: lo que se escribiera en la versión
+activa después de copiarla se perdería al mover el puntero. Cada escritura toma antes un
+permiso en el mismo documento (`write_lease`), con una actualización condicionada a que no
+haya construcción en curso; la recarga, después de marcar el puntero, espera a que se
+devuelvan los permisos vigentes antes de copiar (`wait_for_writers`). Así ninguna escritura
+queda entre la copia y el cambio de puntero aunque un proceso tarde en refrescar su copia
+local de la marca (`writes_blocked`, que solo evita ir a la base cuando ya se sabe).
+`publish` quita la marca en la misma actualización que mueve el puntero.
+
+Las escrituras masivas hechas desde otro proceso (scripts de carga, tareas) incrementan
+`revision` en el puntero; al refrescarlo, cada proceso lo anuncia a sus suscriptores de
+`on_bulk_change` para reconstruir sus cachés.
+"""
+import asyncio
+import inspect
+import os
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+BASE_COLLECTION = "convocatorias"
+META_COLLECTION = "catalog_meta"
+POINTER_ID = BASE_COLLECTION
+
+# Intervalo (segundos) con el que cada proceso revisa el puntero
+WATCH_INTERVAL = 5.0
+# Una marca de construcción más antigua se considera abandonada (el proceso que recargaba murió)
+CATALOG_BUILD_TIMEOUT_SECONDS = float(os.getenv("CATALOG_BUILD_TIMEOUT_SECONDS", "3600"))
+# Vigencia de un permiso de escritura sin renovar (el proceso que escribía murió); se renueva cada tercio
+CATALOG_WRITE_LEASE_SECONDS = float(os.getenv("CATALOG_WRITE_LEASE_SECONDS", "120"))
+
+SwitchListener = Callable[[str, int], Union[None, Awaitable[None]]]
+Document = Optional[Dict[str, Any]]
+ChangeListener = Callable[[Document, Document], Union[None, Awaitable[None]]]
+BulkChangeListener = Callable[[str, int], Union[None, Awaitable[None]]]
+
+_active_name = BASE_COLLECTION
+_version = 0
+# Marca de construcción del puntero: (colección en construcción, inicio) o None
+_building: Optional[Dict[str, Any]] = None
+# Última `revision` del puntero vista por este proceso (None antes de leerlo)
+_revision: Optional[int] = None
+_listeners: List[SwitchListener] = []
+_change_listeners: List[ChangeListener] = []
+_bulk_change_listeners: List[BulkChangeListener] = []
+
+
+def active_collection_name() -> str:
+    return _active_name
+
+
+def active_version() -> int:
+    return _version
+
+
+def _is_stale(started: datetime) -> bool:
+    started = started if started.tzinfo else started.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - started > timedelta(seconds=CATALOG_BUILD_TIMEOUT_SECONDS)
+
+
+def building() -> Optional[str]:
+    """Colección que se está construyendo como próxima versión, o None."""
+    if _building is None or _is_stale(_building["startedAt"]):
+        return None
+    return _building["name"]
+
+
+def writes_blocked() -> bool:
+    """Si este proceso ya sabe que hay una construcción en curso (sin consultar la base)."""
+    return building() is not None
+
+
+class WritesBlocked(RuntimeError):
+    """Hay una versión nueva en construcción: la escritura se perdería al activarla."""
+
+
+def on_switch(listener: SwitchListener) -> SwitchListener:
+    """Registra una función (sync o async) que se llama con `(nombre, versión)` al cambiar de versión."""
+    _listeners.append(listener)
+    return listener
+
+
+def on_change(listener: ChangeListener) -> ChangeListener:
+    """
+    Registra una función (sync o async) que se llama con `(antes, después)` en cada escritura
+    de la API: `antes` es None en una inserción y `después` es None en un borrado.
+    """
+    _change_listeners.append(listener)
+    return listener
+
+
+def on_bulk_change(listener: BulkChangeListener) -> BulkChangeListener:
+    """
+    Registra una función (sync o async) que se llama con `(operación, cantidad)` tras una
+    edición (`update`) o un borrado (`delete`) masivo por filtros.
+    """
+    _bulk_change_listeners.append(listener)
+    return listener
+
+
+async def _notify(listeners: List[Callable], *args) -> None:
+    for listener in list(listeners):
+        try:
+            result = listener(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f"⚠️  Error en suscriptor de cambio de catálogo: {e}")
+
+
+def _set_building(pointer: Dict[str, Any]) -> None:
+    global _building
+    _building = ({"name": pointer["building"], "startedAt": pointer["buildStartedAt"]}
+                 if pointer.get("building") else None)
+
+
+async def _apply(name: str, version: int) -> bool:
+    global _active_name, _version
+    if name == _active_name and version == _version:
+        return False
+    _active_name, _version = name, version
+    await _notify(_listeners, name, version)
+    return True
+
+
+async def publish_change(before: Document, after: Document) -> None:
+    """Anuncia una escritura sobre la versión activa a los suscriptores de `on_change`."""
+    await _notify(_change_listeners, before, after)
+
+
+async def publish_bulk_change(operation: str, count: int, database=None) -> None:
+    """
+    Anuncia una escritura masiva sobre la versión activa (una vez, no por documento). Con
+    `database` también la registra en el puntero para que los demás procesos la vean.
+    """
+    global _revision
+    if database is not None:
+        pointer = await database.get_collection(META_COLLECTION).find_one_and_update(
+            {"_id": POINTER_ID},
+            {"$inc": {"revision": 1}, "$setOnInsert": {"active": _active_name, "version": _version}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        # Este proceso se avisa ahora; no de nuevo al refrescar
+        if _revision is not None and pointer["revision"] == _revision + 1:
+            _revision = pointer["revision"]
+    await _notify(_bulk_change_listeners, operation, count)
+
+
+async def refresh(database) -> bool:
+    """Lee el puntero de la base de datos. Devuelve True si la versión activa cambió."""
+    global _revision
+    pointer = await database.get_collection(META_COLLECTION).find_one({"_id": POINTER_ID})
+    if not pointer:
+        _revision = _revision if _revision is not None else 0
+        return False
+    _set_building(pointer)
+    switched = await _apply(pointer["active"], pointer["version"])
+    revision, seen = pointer.get("revision", 0), _revision
+    _revision = revision
+    # Un cambio de versión ya reconstruye todo; si no, se anuncian las escrituras masivas de otros procesos
+    if seen is not None and revision > seen and not switched:
+        await _notify(_bulk_change_listeners, "remote", revision - seen)
+    return switched
+
+
+async def watch(database, interval: float = WATCH_INTERVAL) -> None:
+    """Tarea de fondo que mantiene sincronizado el puntero en este proceso."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh(database)
+        except Exception as e:
+            print(f"⚠️  No se pudo refrescar la versión del catálogo: {e}")
+
+
+async def publish(database, name: str) -> int:
+    """Activa la colección `name` como nueva versión del catálogo y devuelve su número."""
+    pointer = await database.get_collection(META_COLLECTION).find_one_and_update(
+        {"_id": POINTER_ID},
+        {
+            "$set": {"active": name, "switchedAt": datetime.now(timezone.utc)},
+            "$unset": {"building": "", "buildStartedAt": ""},
+            "$inc": {"version": 1},
+            "$push": {"history": {"$each": [name], "$slice": -10}},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _set_building(pointer)
+    await _apply(pointer["active"], pointer["version"])
+    return pointer["version"]
+
+
+async def begin_build(database, name: str) -> None:
+    """
+    Marca en el puntero que `name` se está construyendo; desde ahí no se dan permisos de
+    escritura (falta esperar los ya dados: `wait_for_writers`). RuntimeError si ya hay otra
+    construcción en curso.
+    """
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=CATALOG_BUILD_TIMEOUT_SECONDS)
+    try:
+        pointer = await database.get_collection(META_COLLECTION).find_one_and_update(
+            {"_id": POINTER_ID, "$or": [{"building": {"$exists": False}}, {"buildStartedAt": {"$lt": stale}}]},
+            {"$set": {"building": name, "buildStartedAt": now},
+             "$pull": {"writers": {"at": {"$lt": now - timedelta(seconds=CATALOG_WRITE_LEASE_SECONDS)}}},
+             "$setOnInsert": {"active": _active_name, "version": _version}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        pointer = await database.get_collection(META_COLLECTION).find_one({"_id": POINTER_ID})
+        raise RuntimeError(f"Ya hay una recarga en curso ({pointer.get('building') if pointer else '?'})")
+    _set_building(pointer)
+
+
+async def wait_for_writers(database, timeout: float = CATALOG_WRITE_LEASE_SECONDS, interval: float = 0.2) -> None:
+    """
+    Espera a que se devuelvan los permisos de escritura tomados antes de `begin_build`
+    (los que no se renuevan en `CATALOG_WRITE_LEASE_SECONDS` se dan por abandonados).
+    RuntimeError si pasado `timeout` sigue habiendo escrituras en curso.
+    """
+    meta = database.get_collection(META_COLLECTION)
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        expired = datetime.now(timezone.utc) - timedelta(seconds=CATALOG_WRITE_LEASE_SECONDS)
+        pointer = await meta.find_one({"_id": POINTER_ID}, {"writers": 1}) or {}
+        live = [lease for lease in pointer.get("writers", []) if not _before(lease["at"], expired)]
+        if not live:
+            return
+        if asyncio.get_running_loop().time() >= deadline:
+            raise RuntimeError(f"Hay {len(live)} escrituras en curso sobre la versión activa; se cancela la recarga")
+        await asyncio.sleep(interval)
+
+
+def _before(moment: datetime, limit: datetime) -> bool:
+    return (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)) < limit
+
+
+@asynccontextmanager
+async def write_lease(database):
+    """
+    Permiso para escribir en la versión activa mientras dura el bloque. Se toma con una sola
+    actualización condicionada a que no haya construcción en curso; WritesBlocked si la hay.
+    """
+    meta = database.get_collection(META_COLLECTION)
+    now = datetime.now(timezone.utc)
+    lease_id = uuid.uuid4().hex
+    for attempt in range(2):
+        try:
+            pointer = await meta.find_one_and_update(
+                {"_id": POINTER_ID, "$or": [{"building": {"$exists": False}},
+                                            {"buildStartedAt": {"$lt": now - timedelta(seconds=CATALOG_BUILD_TIMEOUT_SECONDS)}}]},
+                {"$push": {"writers": {"id": lease_id, "at": now}},
+                 "$setOnInsert": {"active": _active_name, "version": _version}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            # El puntero existe pero no cumple la condición (construcción en curso), o lo creó
+            # otro proceso al mismo tiempo: en ese caso se vuelve a intentar una vez
+            _set_building(await meta.find_one({"_id": POINTER_ID}) or {})
+            if writes_blocked() or attempt:
+                raise WritesBlocked(f"Hay una recarga blue/green en curso ({building()})")
+    _set_building(pointer)
+
+    async def renew():
+        while True:
+            await asyncio.sleep(CATALOG_WRITE_LEASE_SECONDS / 3)
+            await meta.update_one({"_id": POINTER_ID, "writers.id": lease_id},
+                                  {"$set": {"writers.$.at": datetime.now(timezone.utc)}})
+
+    renewal = asyncio.create_task(renew())
+    try:
+        yield
+    finally:
+        renewal.cancel()
+        await meta.update_one({"_id": POINTER_ID}, {"$pull": {"writers": {"id": lease_id}}})
+
+
+async def end_build(database) -> None:
+    """Quita la marca de construcción sin mover el puntero (recarga fallida)."""
+    pointer = await database.get_collection(META_COLLECTION).find_one_and_update(
+        {"_id": POINTER_ID},
+        {"$unset": {"building": "", "buildStartedAt": ""}},
+        return_document=ReturnDocument.AFTER,
+    )
+    _set_building(pointer or {})
+
+
+async def previous_versions(database) -> List[str]:
+    """Colecciones de versiones anteriores según el historial del puntero (más reciente al final)."""
+    pointer = await database.get_collection(META_COLLECTION).find_one({"_id": POINTER_ID})
+    if not pointer:
+        return []
+    history = pointer.get("history", [])
+    return [name for name in history if name != pointer["active"]]
+
+
+def new_version_name(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"{BASE_COLLECTION}_{now.strftime('%Y%m%d%H%M%S')}"
@@ -0,0 +1,166 @@
+"""
+Circuit breaker de MongoDB y respuestas con la última versión conocida ("stale").
+
+Las lecturas del catálogo pasan por `mongo_breaker`: cada llamada tiene un tiempo máximo
+(`DB_CALL_TIMEOUT_SECONDS`) y los errores o llamadas lentas consecutivas abren el circuito.
+Mientras está abierto no se consulta la base; pasado `CIRCUIT_OPEN_SECONDS` se deja pasar
+una sola petición de prueba (semiabierto) que lo cierra si responde bien.
+
+Cada respuesta correcta se guarda en `snapshots`; si la base falla o el circuito está
+abierto, se responde esa copia marcada con `X-Stale` y `Warning`. El catálogo cambia poco,
+así que un dato algo viejo es preferible a esperar un timeout.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from pymongo.errors import PyMongoError
+
+DB_CALL_TIMEOUT_SECONDS = float(os.getenv("DB_CALL_TIMEOUT_SECONDS", "3"))
+# Llamadas fallidas (o más lentas que SLOW_CALL_SECONDS) seguidas que abren el circuito
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+SLOW_CALL_SECONDS = float(os.getenv("SLOW_CALL_SECONDS", "1.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15"))
+# Respuestas guardadas para servir mientras la base no responde
+SNAPSHOT_MAX_ENTRIES = int(os.getenv("SNAPSHOT_MAX_ENTRIES", "2000"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: no se intenta la llamada."""
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        slow_call_seconds: float = SLOW_CALL_SECONDS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        timeout: float = DB_CALL_TIMEOUT_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.timeout = timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def _before_call(self) -> bool:
+        """Decide si la llamada puede hacerse; devuelve True si es la prueba del estado semiabierto."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                raise CircuitOpenError(self.name)
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError(self.name)
+            self._probing = True
+            return True
+        return False
+
+    def _record(self, ok: bool, probe: bool) -> None:
+        if probe:
+            self._probing = False
+        if ok:
+            self.failures = 0
+            self.state = CLOSED
+            return
+        self.failures += 1
+        if probe or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+                print(f"⚠️  Circuito '{self.name}' abierto tras {self.failures} fallos")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        probe = self._before_call()
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(), timeout=self.timeout)
+        except (PyMongoError, asyncio.TimeoutError, OSError):
+            self._record(False, probe)
+            raise
+        except BaseException:
+            # Errores que no son de la base (p. ej. cancelación) no cuentan, pero liberan la prueba
+            if probe:
+                self._probing = False
+            raise
+        # Una llamada lenta devuelve su resultado pero cuenta como fallo
+        self._record(time.monotonic() - started < self.slow_call_seconds, probe)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "timesOpened": self.times_opened}
+
+
+class SnapshotStore:
+    """Últimas respuestas correctas por clave (LRU acotado)."""
+
+    def __init__(self, max_entries: int = SNAPSHOT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self.served = 0
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.time())
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Valor guardado y su antigüedad en segundos."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0], time.time() - entry[1]
+
+
+mongo_breaker = CircuitBreaker("mongodb")
+snapshots = SnapshotStore()
+
+DB_ERRORS = (CircuitOpenError, PyMongoError, asyncio.TimeoutError, OSError)
+
+
+async def with_snapshot(key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[float]]:
+    """
+    Ejecuta `fetch` y guarda su resultado. Si la base no responde devuelve la última copia
+    guardada con su antigüedad; sin copia responde 503.
+    """
+    try:
+        result = await fetch()
+    except DB_ERRORS as e:
+        snapshot = snapshots.get(key)
+        if snapshot is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="La base de datos no está disponible, intente más tarde",
+                headers={"Retry-After": str(int(mongo_breaker.open_seconds))},
+            ) from e
+        snapshots.served += 1
+        return snapshot
+    snapshots.put(key, result)
+    return result, None
+
+
+def mark_stale(response: Response, age: Optional[float]) -> Response:
+    """Agrega las cabeceras de respuesta desactualizada si `age` no es None."""
+    if age is not None:
+        response.headers["X-Stale"] = "true"
+        response.headers["Warning"] = '110 - "Response is Stale"'
+        response.headers["Age"] = str(int(age))
+    return response
+
+
+def stats() -> Dict[str, Any]:
+    return {**mongo_breaker.stats(), "snapshots": len(snapshots._entries), "staleServed": snapshots.served}
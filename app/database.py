@@ -1,16 +1,61 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
 
-load_dotenv() # Carga las variables desde el archivo .env
+from . import catalog
 
+# Las variables del archivo .env se cargan al importar el paquete (app/__init__.py)
 MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
-# Se crea una única instancia del cliente para ser reutilizada
-client = AsyncIOMotorClient(MONGO_URI)
-database = client[DATABASE_NAME]
+# Una única instancia del cliente por proceso, creada en el primer uso (el arranque de la
+# API o el script) y no al importar: importar la app no abre conexiones ni importa Motor, y
+# con `--preload` cada worker crea su propio cliente después del fork
+_client = None
+_database = None
 
-# Función para obtener la colección de convocatorias
+
+def get_client():
+    global _client
+    if _client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        _client = AsyncIOMotorClient(MONGO_URI)
+    return _client
+
+
+def get_database():
+    global _database
+    if _database is None:
+        _database = get_client()[DATABASE_NAME]
+    return _database
+
+
+def close_client() -> None:
+    global _client, _database
+    if _client is not None:
+        _client.close()
+    _client = _database = None
+
+# Función para obtener la colección de convocatorias.
+# Devuelve la versión activa del catálogo, así que debe llamarse en cada uso y no guardarse.
 def get_convocatoria_collection():
-    return database.get_collection("convocatorias")
\ No newline at end of file
+    return get_database().get_collection(catalog.active_collection_name())
+
+# Igual que la anterior pero leyendo antes el puntero de versión (para scripts sin `catalog.watch`)
+async def get_active_convocatoria_collection():
+    await catalog.refresh(get_database())
+    return get_convocatoria_collection()
+
+# Búsquedas guardadas y su bandeja de avisos (no dependen de la versión del catálogo)
+def get_saved_search_collection():
+    return get_database().get_collection("saved_searches")
+
+def get_saved_search_outbox_collection():
+    return get_database().get_collection("saved_search_outbox")
+
+# Registro de auditoría de las escrituras (app/audit.py)
+def get_audit_collection():
+    return get_database().get_collection("audit_log")
+
+# Tareas administrativas en segundo plano (app/jobs.py)
+def get_job_collection():
+    return get_database().get_collection("jobs")
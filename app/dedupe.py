@@ -0,0 +1,323 @@
+"""
+Detección de convocatorias casi duplicadas con MinHash y LSH.
+
+El archivo de la DRE repite la misma institución con variantes de escritura ("Universidade
+de São Paulo (USP)" / "Universidad de Sao Paulo") y el mismo convenio en varios años. Dos
+convocatorias se consideran duplicadas si son del mismo país y
+
+    0.8 · similitud(institución) + 0.2 · similitud(Props) >= DUPLICATE_THRESHOLD
+
+donde cada similitud es el índice de Jaccard entre conjuntos: trigramas de caracteres del
+nombre normalizado de la institución y términos (líneas y palabras) de las `Props`. La institución pesa más
+porque las `Props` se repiten entre instituciones distintas del mismo tipo.
+
+Las similitudes se estiman con firmas MinHash (la fracción de posiciones iguales entre
+dos firmas). Para no comparar todos los pares, la firma de la institución se divide en
+bandas (LSH): dos convocatorias solo se comparan si coinciden en alguna banda completa y
+en el país, lo que ocurre casi siempre que la institución es parecida y casi nunca si no.
+Dentro de cada grupo de claves iguales se comparan todos los pares, o cada convocatoria con
+las `BUCKET_WINDOW` siguientes en los grupos grandes, así que el costo sigue siendo lineal en
+el tamaño del catálogo. Las convocatorias sin nombre de institución no
+entran en las bandas: todas tendrían la misma firma y quedarían agrupadas entre sí.
+
+La tabla se calcula en segundo plano como la de similares (`app/similarity.py`) y sirve
+tanto para agrupar el catálogo (`GET /convocatorias/duplicates`) como para marcar posibles
+duplicados al crear una convocatoria (`possibleDuplicateOf`).
+
+Uso como script:
+    python -m app.dedupe report [--min-size 2]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import zlib
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .lazy import lazy_import
+from .normalization import fold, institution_key
+from .recommender import text_terms
+
+np = lazy_import("numpy")
+sparse = lazy_import("scipy.sparse")
+csgraph = lazy_import("scipy.sparse.csgraph")
+
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.75"))
+INSTITUTION_WEIGHT = 0.8
+
+# Permutaciones por firma; la de la institución se divide en BANDS bandas de ROWS filas.
+# Con 16 x 4, dos instituciones con similitud 0.7 quedan como candidatas con probabilidad 0.98
+NUM_PERM = 64
+BANDS, ROWS = 16, 4
+# Dentro de un grupo de claves LSH iguales cada convocatoria se compara con las siguientes
+# BUCKET_WINDOW (todos los pares en los grupos de hasta BUCKET_WINDOW + 1)
+BUCKET_WINDOW = 32
+# Convocatorias por bloque al calcular firmas (acota la memoria de la matriz de hashes)
+SIGNATURE_BLOCK = 2000
+# Espera para agrupar ráfagas de escrituras antes de recalcular
+REBUILD_DELAY = 30.0
+
+PROJECTION = {"institution": 1, "country": 1, "Props": 1}
+
+
+@lru_cache(maxsize=None)
+def _hash_parameters() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Coeficientes fijos de las funciones de hash (se generan en el primer uso)."""
+    rng = np.random.default_rng(20240611)
+    # Familia multiplicar-desplazar: h(x) = (a·x + b) mod 2^64, se toman los 32 bits altos
+    a = rng.integers(1, 2**63, size=(2, NUM_PERM, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, size=(2, NUM_PERM, 1), dtype=np.uint64)
+    band_mix = rng.integers(1, 2**63, size=ROWS, dtype=np.uint64)
+    return a, b, band_mix
+
+
+@lru_cache(maxsize=None)
+def _empty() -> np.ndarray:
+    """Conjunto vacío: un valor cualquiera para que `reduceat` tenga qué reducir; se reconoce por identidad."""
+    return np.zeros(1, dtype=np.uint64)
+
+
+@lru_cache(maxsize=65536)
+def institution_hashes(name: str) -> np.ndarray:
+    """Trigramas de caracteres del nombre normalizado, cada uno como entero de 24 bits."""
+    data = np.frombuffer(f" {institution_key(name)} ".encode(), dtype=np.uint8).astype(np.uint64)
+    return (data[:-2] << np.uint64(16)) | (data[1:-1] << np.uint64(8)) | data[2:] if len(data) > 2 else _empty()
+
+
+@lru_cache(maxsize=65536)
+def props_hashes(text: str) -> np.ndarray:
+    """Términos de las `Props` (los mismos del recomendador: líneas y palabras)."""
+    # CRC32 y no `hash`: así todos los procesos (y el reporte) calculan los mismos grupos
+    values = np.fromiter({zlib.crc32(term.encode()) for term in text_terms(text)}, dtype=np.uint64)
+    return values if len(values) else _empty()
+
+
+def _institution(document: Dict[str, Any]) -> np.ndarray:
+    return institution_hashes(str(document.get("institution") or ""))
+
+
+def _props(document: Dict[str, Any]) -> np.ndarray:
+    return props_hashes(str(document.get("Props") or ""))
+
+
+def _has_terms(documents: List[Dict[str, Any]], hashes: Callable[[Dict[str, Any]], np.ndarray]) -> np.ndarray:
+    """Por convocatoria, si el campo tiene algún término (las vacías comparten la firma de `_empty`)."""
+    return np.fromiter((hashes(doc) is not _empty() for doc in documents), dtype=bool, count=len(documents))
+
+
+def signatures(documents: List[Dict[str, Any]], part: int, hashes: Callable[[Dict[str, Any]], np.ndarray]) -> np.ndarray:
+    """Firmas MinHash (n x NUM_PERM, uint32) de un campo, calculadas por bloques."""
+    a, b, _ = _hash_parameters()
+    result = np.empty((len(documents), NUM_PERM), dtype=np.uint32)
+    for start in range(0, len(documents), SIGNATURE_BLOCK):
+        block = [hashes(doc) for doc in documents[start:start + SIGNATURE_BLOCK]]
+        offsets = np.cumsum([0] + [len(values) for values in block[:-1]])
+        values = np.concatenate(block)
+        hashed = ((a[part] * values + b[part]) >> np.uint64(32)).astype(np.uint32)
+        result[start:start + len(block)] = np.minimum.reduceat(hashed, offsets, axis=1).T
+    return result
+
+
+def band_keys(institution: np.ndarray, countries: np.ndarray) -> np.ndarray:
+    """Clave de 64 bits por convocatoria y banda (n x BANDS), que incluye el país."""
+    bands = institution.astype(np.uint64).reshape(len(institution), BANDS, ROWS)
+    return (bands * _hash_parameters()[2]).sum(axis=2) ^ countries[:, None]
+
+
+def _country_hash(document: Dict[str, Any]) -> int:
+    return zlib.crc32(fold(document.get("country")).encode())
+
+
+def score(institution_a: np.ndarray, props_a: np.ndarray, institution_b: np.ndarray, props_b: np.ndarray) -> np.ndarray:
+    """Similitud ponderada estimada entre las firmas de `a` (una o varias filas) y `b`."""
+    institution = (institution_a == institution_b).mean(axis=-1)
+    props = (props_a == props_b).mean(axis=-1)
+    return INSTITUTION_WEIGHT * institution + (1 - INSTITUTION_WEIGHT) * props
+
+
+class DuplicateIndex:
+    """Firmas del catálogo, claves LSH ordenadas por banda y grupos de duplicados."""
+
+    def __init__(self):
+        self.ready = False
+        self.ids: List[str] = []
+        self.clusters: List[Dict[str, Any]] = []
+        # Los arreglos se crean con el primer cálculo (`install`)
+        self._institution: Optional[np.ndarray] = None
+        self._props: Optional[np.ndarray] = None
+        self._countries: Optional[np.ndarray] = None
+        self._sorted_keys: Optional[np.ndarray] = None
+        self._order: Optional[np.ndarray] = None
+        # Escrituras posteriores al último cálculo (se comparan una por una)
+        self._recent: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        self._removed: set = set()
+
+    @staticmethod
+    def compute(documents: List[Dict[str, Any]], threshold: float = DUPLICATE_THRESHOLD) -> Dict[str, Any]:
+        """Calcula firmas, claves y grupos (CPU; se ejecuta fuera del event loop)."""
+        n = len(documents)
+        institution = signatures(documents, 0, _institution)
+        props = signatures(documents, 1, _props)
+        countries = np.fromiter((_country_hash(doc) for doc in documents), dtype=np.uint64, count=n)
+        keys = band_keys(institution, countries) if n else np.empty((0, BANDS), dtype=np.uint64)
+        named = _has_terms(documents, _institution)
+
+        order = np.argsort(keys, axis=0, kind="stable").T
+        sorted_keys = np.take_along_axis(keys, order.T, axis=0).T
+        rows, cols = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for band in range(BANDS if n else 0):
+            members, values = order[band], sorted_keys[band]
+            keep = named[members]
+            members, values = members[keep], values[keep]
+            # Número de grupo de claves iguales de cada posición; se comparan los pares del mismo
+            # grupo a distancia 1, 2, ... hasta agotar el grupo más grande o la ventana
+            group = np.cumsum(np.r_[True, values[1:] != values[:-1]])
+            for distance in range(1, min(BUCKET_WINDOW, len(members) - 1) + 1):
+                same = group[distance:] == group[:-distance]
+                if not same.any():
+                    break
+                a, b = members[distance:][same], members[:-distance][same]
+                similar = score(institution[a], props[a], institution[b], props[b]) >= threshold
+                rows.append(a[similar])
+                cols.append(b[similar])
+        rows_all, cols_all = np.concatenate(rows), np.concatenate(cols)
+        graph = sparse.coo_matrix((np.ones(len(rows_all), dtype=np.int8), (rows_all, cols_all)), shape=(n, n))
+        labels = csgraph.connected_components(graph, directed=False)[1] if n else []
+
+        groups: Dict[int, List[int]] = {}
+        for row, label in enumerate(labels):
+            groups.setdefault(label, []).append(row)
+        clusters = [
+            {
+                "size": len(members),
+                "country": documents[members[0]].get("country"),
+                "institutions": sorted({str(documents[i].get("institution")) for i in members}),
+                "ids": [str(documents[i]["_id"]) for i in members],
+            }
+            for members in groups.values()
+            if len(members) > 1
+        ]
+        clusters.sort(key=lambda cluster: (-cluster["size"], str(cluster["country"])))
+        return {
+            "ids": [str(doc["_id"]) for doc in documents],
+            "institution": institution,
+            "props": props,
+            "countries": countries,
+            "sorted_keys": sorted_keys,
+            "order": order,
+            "clusters": clusters,
+        }
+
+    def install(self, state: Dict[str, Any]) -> None:
+        self.ids = state["ids"]
+        self._institution, self._props = state["institution"], state["props"]
+        self._countries = state["countries"]
+        self._sorted_keys, self._order = state["sorted_keys"], state["order"]
+        self.clusters = state["clusters"]
+        self._recent, self._removed = {}, set()
+        self.ready = True
+
+    def build(self, documents: List[Dict[str, Any]]) -> None:
+        self.install(self.compute(documents))
+
+    def find(self, document: Dict[str, Any], limit: int = 10, threshold: float = DUPLICATE_THRESHOLD) -> List[Tuple[str, float]]:
+        """Convocatorias que probablemente duplican a `document`, de la más parecida a la menos."""
+        if not _has_terms([document], _institution)[0]:
+            return []
+        institution = signatures([document], 0, _institution)
+        props = signatures([document], 1, _props)
+        country = _country_hash(document)
+        keys = band_keys(institution, np.array([country], dtype=np.uint64))[0]
+
+        candidates = set()
+        for band in range(BANDS):
+            values = self._sorted_keys[band]
+            lo, hi = np.searchsorted(values, keys[band], side="left"), np.searchsorted(values, keys[band], side="right")
+            candidates.update(self._order[band][lo:hi].tolist())
+        found: Dict[str, float] = {}
+        if candidates:
+            rows = np.fromiter(candidates, dtype=np.int64)
+            scores = score(self._institution[rows], self._props[rows], institution[0], props[0])
+            for row, value in zip(rows.tolist(), scores.tolist()):
+                doc_id = self.ids[row]
+                if value >= threshold and doc_id not in self._removed:
+                    found[doc_id] = value
+        for doc_id, (recent_institution, recent_props, recent_country) in self._recent.items():
+            if recent_country == country:
+                value = float(score(recent_institution, recent_props, institution[0], props[0]))
+                if value >= threshold:
+                    found[doc_id] = value
+        own_id = str(document.get("_id")) if document.get("_id") is not None else None
+        found.pop(own_id, None)
+        return sorted(found.items(), key=lambda item: -item[1])[:limit]
+
+    def apply_change(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        """Refleja una escritura hasta el próximo cálculo completo."""
+        if before is not None:
+            doc_id = str(before["_id"])
+            self._recent.pop(doc_id, None)
+            self._removed.add(doc_id)
+        if after is not None:
+            doc_id = str(after["_id"])
+            self._recent[doc_id] = (
+                signatures([after], 0, _institution)[0],
+                signatures([after], 1, _props)[0],
+                _country_hash(after),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "documents": len(self.ids),
+            "clusters": len(self.clusters),
+            "duplicates": sum(cluster["size"] - 1 for cluster in self.clusters),
+        }
+
+
+index = DuplicateIndex()
+
+
+async def rebuild(repository, duplicates: DuplicateIndex = index) -> None:
+    """Recalcula firmas y grupos; la parte de CPU corre en un hilo para no bloquear el event loop."""
+    documents = await repository.scan(PROJECTION)
+    state = await asyncio.to_thread(duplicates.compute, documents)
+    duplicates.install(state)
+    print(f"🧬 Duplicados: {len(state['clusters'])} grupos en {len(documents)} convocatorias")
+
+
+def find_clusters(documents: List[Dict[str, Any]], threshold: float = DUPLICATE_THRESHOLD) -> List[Dict[str, Any]]:
+    """Solo los grupos, sin las firmas (para calcularlos en otro proceso: tarea `dedupe` de app/jobs.py)."""
+    return DuplicateIndex.compute(documents, threshold)["clusters"]
+
+
+async def _main(min_size: int) -> int:
+    from .repository import MongoRepository, STORAGE_BACKEND, get_repository
+
+    if STORAGE_BACKEND == "mongo":
+        from .database import get_active_convocatoria_collection
+
+        collection = await get_active_convocatoria_collection()
+        repository = MongoRepository(lambda: collection)
+    else:
+        repository = get_repository()
+    duplicates = DuplicateIndex()
+    await rebuild(repository, duplicates)
+    for cluster in duplicates.clusters:
+        if cluster["size"] < min_size:
+            continue
+        print(f"🔁 {cluster['size']} · {cluster['country']} · {' | '.join(cluster['institutions'])}")
+    stats = duplicates.stats()
+    print(f"✅ {stats['clusters']} grupos, {stats['duplicates']} convocatorias sobrantes")
+    await repository.close()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convocatorias casi duplicadas (MinHash + LSH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Lista los grupos de duplicados del catálogo activo")
+    report.add_argument("--min-size", type=int, default=2)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.min_size)))
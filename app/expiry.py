@@ -0,0 +1,120 @@
+"""
+Vencimiento programado de convenios.
+
+`validUntil` se calcula al escribir (a partir de `validity`), así que el estado derivado
+solo cambia cuando pasa la fecha. Una tarea de fondo marca como "No Vigente" los convenios
+que vencieron desde la última ejecución con un solo `update_many`, resuelto con el índice
+`norm_state_validUntil_index`.
+
+Uso como script:
+    python -m app.expiry run        # ejecuta una corrida ahora
+    python -m app.expiry backfill   # calcula validUntil/estado en documentos existentes
+"""
+import asyncio
+import os
+import sys
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from . import catalog, stats
+from .normalization import NORM_PREFIX, fold, normalized_update, validity_fields
+
+# Cada cuánto (segundos) se revisan vencimientos; la granularidad de `validity` es mensual
+EXPIRY_INTERVAL_SECONDS = float(os.getenv("EXPIRY_INTERVAL_SECONDS", "3600"))
+
+EXPIRED_STATE = "No Vigente"
+
+
+async def expire_agreements(collection, today: Optional[date] = None, database=None) -> int:
+    """
+    Marca como vencidos los convenios vigentes cuyo `validUntil` ya pasó.
+
+    Cada réplica corre el vencimiento al arrancar: las estadísticas se ajustan solo con lo
+    que modificó esta llamada, así que si dos réplicas vencen los mismos documentos el `$inc`
+    se aplica una sola vez. El `update_many` (un pipeline) guarda en `expiry` el estado
+    anterior y el id de la corrida; los conteos por estado anterior salen de agrupar los
+    documentos de esa corrida. Con `database` el cambio se registra en el puntero del
+    catálogo para los demás procesos.
+    """
+    today = today or date.today()
+    before = {"validUntil": {"$lt": datetime(today.year, today.month, today.day)}}
+    run = ObjectId()
+    result = await collection.update_many(
+        {**before, f"{NORM_PREFIX}.state": fold("Vigente")},
+        [{"$set": {
+            # El estado anterior puede variar en mayúsculas o tildes y las estadísticas lo cuentan tal cual
+            "expiry": {"run": run, "previousState": "$state", "at": datetime.now(timezone.utc)},
+            "state": EXPIRED_STATE,
+            f"{NORM_PREFIX}.state": fold(EXPIRED_STATE),
+        }}],
+    )
+    modified = result.modified_count
+    if modified:
+        increments: Counter = Counter()
+        async for group in collection.aggregate([
+            {"$match": {**before, "expiry.run": run}},
+            {"$group": {"_id": "$expiry.previousState", "count": {"$sum": 1}}},
+        ]):
+            for path, n in stats.delta({"state": group["_id"]}, {"state": EXPIRED_STATE}).items():
+                increments[path] += n * group["count"]
+        await stats.apply_counts(collection, dict(increments))
+        # Las cachés (recomendaciones `only_active`, similares) dejan de ofrecer los vencidos
+        await catalog.publish_bulk_change("expire", modified, database)
+    return modified
+
+
+async def run_scheduler(get_collection, interval: float = EXPIRY_INTERVAL_SECONDS) -> None:
+    """Tarea de fondo: una corrida al arrancar y luego cada `interval` segundos."""
+    while True:
+        try:
+            collection = get_collection()
+            async with catalog.write_lease(collection.database):
+                expired = await expire_agreements(collection, database=collection.database)
+            if expired:
+                print(f"📅 {expired} convenios marcados como {EXPIRED_STATE}")
+        except catalog.WritesBlocked:
+            # Durante una recarga blue/green se espera a la versión nueva (la copia ya está hecha)
+            pass
+        except Exception as e:
+            print(f"⚠️  Error revisando vencimientos: {e}")
+        await asyncio.sleep(interval)
+
+
+async def backfill_validity(collection, batch_size: int = 500) -> int:
+    """Calcula `validUntil` (y el estado derivado) para los documentos que aún no lo tienen."""
+    updated = 0
+    batch = []
+    async for doc in collection.find({"validUntil": {"$exists": False}}, {"validity": 1}):
+        fields = validity_fields({"validity": doc.get("validity")})
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {**fields, **normalized_update(fields)}}))
+        if len(batch) >= batch_size:
+            updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+
+async def _main(command: str) -> int:
+    from .database import get_active_convocatoria_collection
+
+    collection = await get_active_convocatoria_collection()
+    if command == "backfill":
+        updated = await backfill_validity(collection)
+        if updated:
+            await stats.rebuild(collection)
+        print(f"✅ {updated} documentos actualizados con la vigencia interpretada")
+    else:
+        async with catalog.write_lease(collection.database):
+            expired = await expire_agreements(collection, database=collection.database)
+        print(f"✅ {expired} convenios marcados como {EXPIRED_STATE}")
+    return 0
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    sys.exit(asyncio.run(_main(command)))
@@ -0,0 +1,175 @@
+"""
+Registro declarativo de los índices de la colección de convocatorias.
+
+Es la única fuente de verdad sobre los índices: la app los aplica al arrancar y los
+scripts de carga reutilizan `ensure_indexes`, así que la latencia de las consultas
+no depende de qué script de configuración se haya ejecutado.
+
+Uso como script:
+    python -m app.indexes apply [--prune]   # crea/corrige índices (y elimina los no registrados)
+    python -m app.indexes report            # muestra índices sin uso según $indexStats
+"""
+import asyncio
+import sys
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, TEXT, IndexModel
+
+from .normalization import NORM_PREFIX
+from .sorting import ID, SORT_FIELDS, SORT_ORDERS
+
+INDEXES: List[IndexModel] = [
+    # Búsqueda libre (`q`). Solo puede existir un índice de texto por colección.
+    IndexModel(
+        [("institution", TEXT), ("country", TEXT), ("Props", TEXT), ("agreementType", TEXT)],
+        name="search_index",
+    ),
+    # Filtros individuales sobre campos normalizados
+    IndexModel([(f"{NORM_PREFIX}.country", ASCENDING)], name="norm_country_index"),
+    IndexModel([(f"{NORM_PREFIX}.agreementType", ASCENDING)], name="norm_agreementType_index"),
+    IndexModel([(f"{NORM_PREFIX}.languages", ASCENDING)], name="norm_languages_index"),
+    IndexModel([(f"{NORM_PREFIX}.subscriptionLevel", ASCENDING)], name="norm_subscriptionLevel_index"),
+    IndexModel([(f"{NORM_PREFIX}.state", ASCENDING)], name="norm_state_index"),
+    # Combinaciones de filtros frecuentes en el frontend
+    IndexModel(
+        [(f"{NORM_PREFIX}.state", ASCENDING), (f"{NORM_PREFIX}.country", ASCENDING)],
+        name="norm_state_country_index",
+    ),
+    IndexModel(
+        [(f"{NORM_PREFIX}.languages", ASCENDING), (f"{NORM_PREFIX}.state", ASCENDING)],
+        name="norm_languages_state_index",
+    ),
+    # Rangos de vigencia (valid_after / expiring_before) y vencimiento programado (app/expiry.py).
+    # Con `_id` al final también da el orden `sort=validUntil` de las vigentes (o no vigentes)
+    IndexModel([("validUntil", ASCENDING)], name="validUntil_index"),
+    IndexModel(
+        [(f"{NORM_PREFIX}.state", ASCENDING), ("validUntil", ASCENDING), (ID, ASCENDING)],
+        name="norm_state_validUntil_index",
+    ),
+    # Enlaces rotos según el verificador (app/links.py)
+    IndexModel([("hasBrokenLinks", ASCENDING)], name="hasBrokenLinks_index"),
+    # Clave de origen usada por el cargador incremental (app/loader.py)
+    IndexModel(
+        [("sourceKey", ASCENDING)],
+        name="sourceKey_index",
+        unique=True,
+        partialFilterExpression={"sourceKey": {"$exists": True}},
+    ),
+    # Un índice por cada orden del listado (app/sorting.py), con el id como desempate
+    *(
+        IndexModel(
+            [(SORT_FIELDS[field], direction) for field, direction in order] + [(ID, ASCENDING)],
+            name=f"sort_{'_'.join(field for field, _ in order)}_index",
+        )
+        for order in SORT_ORDERS
+    ),
+]
+
+
+def _is_text(keys: Dict[str, Any]) -> bool:
+    return any(direction == TEXT for direction in keys.values())
+
+
+def _spec_keys(index: IndexModel) -> Dict[str, Any]:
+    return dict(index.document["key"])
+
+
+def _same_keys(info: Dict[str, Any], keys: Dict[str, Any]) -> bool:
+    # MongoDB describe los índices de texto como {_fts: "text", _ftsx: 1} + pesos,
+    # así que se comparan los campos; en el resto importa el orden de las claves.
+    if "weights" in info:
+        return _is_text(keys) and set(info["weights"]) == set(keys)
+    return list(info["key"]) == list(keys.items())
+
+
+# Opciones que cambian qué documentos entran en el índice o cuánto duran
+INDEX_OPTIONS = {"unique": False, "partialFilterExpression": None, "expireAfterSeconds": None}
+
+
+def _same_options(info: Dict[str, Any], index: IndexModel) -> bool:
+    return all(
+        info.get(option, default) == index.document.get(option, default)
+        for option, default in INDEX_OPTIONS.items()
+    )
+
+
+def filter_indexes() -> List[IndexModel]:
+    """Índices que el planificador puede sugerir como `hint` (todos menos el de texto)."""
+    return [index for index in INDEXES if not _is_text(_spec_keys(index))]
+
+
+async def ensure_indexes(collection, prune: bool = False) -> Dict[str, List[str]]:
+    """
+    Aplica el registro de forma idempotente.
+    Recrea los índices cuyo nombre coincide pero con otras claves (p. ej. el antiguo
+    `search_index` de `load_data.py`) u otras opciones (`INDEX_OPTIONS`) y, con `prune`,
+    elimina los no registrados.
+    """
+    existing = await collection.index_information()
+    wanted = {index.document["name"]: index for index in INDEXES}
+    report = {"created": [], "recreated": [], "unchanged": [], "unmanaged": [], "dropped": []}
+
+    to_create = []
+    for name, index in wanted.items():
+        keys = _spec_keys(index)
+        if name not in existing:
+            # Solo puede haber un índice de texto: se elimina el anterior aunque tenga otro nombre
+            if _is_text(keys):
+                for other, info in existing.items():
+                    if other not in wanted and "weights" in info:
+                        await collection.drop_index(other)
+                        report["dropped"].append(other)
+            to_create.append(index)
+            report["created"].append(name)
+        elif not _same_keys(existing[name], keys) or not _same_options(existing[name], index):
+            await collection.drop_index(name)
+            to_create.append(index)
+            report["recreated"].append(name)
+        else:
+            report["unchanged"].append(name)
+
+    if to_create:
+        await collection.create_indexes(to_create)
+
+    for name in existing:
+        if name == "_id_" or name in wanted or name in report["dropped"]:
+            continue
+        if prune:
+            await collection.drop_index(name)
+            report["dropped"].append(name)
+        else:
+            report["unmanaged"].append(name)
+    return report
+
+
+async def unused_indexes(collection) -> List[Dict[str, Any]]:
+    """Índices sin accesos desde el último reinicio de mongod, según `$indexStats`."""
+    unused = []
+    async for stats in collection.aggregate([{"$indexStats": {}}]):
+        if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+            unused.append({"name": stats["name"], "key": stats["key"], "since": stats["accesses"]["since"]})
+    return unused
+
+
+async def _main(args: List[str]) -> int:
+    from .database import get_active_convocatoria_collection
+
+    collection = await get_active_convocatoria_collection()
+    command = args[0] if args else "apply"
+    if command == "report":
+        unused = await unused_indexes(collection)
+        for stats in unused:
+            print(f"⚠️  {stats['name']} {dict(stats['key'])} sin uso desde {stats['since']}")
+        if not unused:
+            print("✅ Todos los índices tienen accesos registrados")
+        return 0
+
+    report = await ensure_indexes(collection, prune="--prune" in args)
+    for action, names in report.items():
+        if names:
+            print(f"🔍 {action}: {', '.join(names)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
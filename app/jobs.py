@@ -0,0 +1,479 @@
+"""
+Tareas administrativas en segundo plano: recargas del catálogo, índices, estadísticas,
+duplicados y exportaciones.
+
+Un administrador encola una tarea con `POST /jobs` y consulta su estado con
+`GET /jobs/{id}`. Cada tarea es un documento de la colección `jobs` con su estado
+(`queued`, `running`, `succeeded`, `failed`), el avance y el resultado o el error, así que
+el seguimiento sobrevive a reinicios y se ve desde cualquier proceso de la API.
+
+Cada proceso corre hasta `JOB_CONCURRENCY` tareas a la vez. Una tarea se reclama con un
+`find_one_and_update` atómico, así que con varios procesos corre una sola vez; las que se
+encolan en otro proceso se toman en la siguiente consulta (`JOB_POLL_SECONDS`). Nada que
+bloquee corre en el event loop de las peticiones: las consultas a MongoDB son asíncronas,
+la E/S síncrona (escribir una exportación) va a un pool de hilos (`JOB_THREAD_WORKERS`) y
+el cálculo pesado (validación del archivo, firmas MinHash) a un pool de procesos
+(`JOB_PROCESS_WORKERS`).
+
+Mientras corre, una tarea renueva `heartbeatAt`; si su proceso muere, pasados
+`JOB_STALE_SECONDS` otro proceso la marca como fallida. Las tareas terminadas se borran a
+los `JOB_RETENTION_DAYS` días (índice TTL), y sus exportaciones en `EXPORT_DIR` también
+(se revisan cada `EXPORT_PRUNE_INTERVAL_SECONDS`).
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pydantic import TypeAdapter
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+
+JOBS_COLLECTION = "jobs"
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "1"))
+JOB_THREAD_WORKERS = int(os.getenv("JOB_THREAD_WORKERS", "2"))
+JOB_PROCESS_WORKERS = int(os.getenv("JOB_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "30"))
+# Carpeta de los archivos de la tarea `export`
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+# Cada cuánto se buscan exportaciones vencidas (recorrer la carpeta no hace falta en cada consulta)
+EXPORT_PRUNE_INTERVAL_SECONDS = float(os.getenv("EXPORT_PRUNE_INTERVAL_SECONDS", "3600"))
+EXPORT_BATCH_SIZE = 1000
+
+# El avance se escribe como mucho una vez por este intervalo
+PROGRESS_INTERVAL = 1.0
+# Errores de validación que se guardan en el resultado de una carga
+MAX_REPORTED_ERRORS = 20
+
+JOB_INDEXES = [
+    IndexModel([("status", ASCENDING), ("createdAt", ASCENDING)], name="status_createdAt_index"),
+    IndexModel([("createdAt", DESCENDING)], name="createdAt_index"),
+    IndexModel([("finishedAt", ASCENDING)], name="finishedAt_ttl_index",
+               expireAfterSeconds=JOB_RETENTION_DAYS * 24 * 3600),
+]
+
+JobHandler = Callable[["JobContext", Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Registra la función que ejecuta las tareas de tipo `kind`."""
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+
+    return register
+
+
+def kinds() -> List[str]:
+    return sorted(_handlers)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """Lo que ve una tarea en ejecución: su id, el avance y los pools de hilos y procesos."""
+
+    def __init__(self, runner: "JobRunner", collection, document: Dict[str, Any]):
+        self.runner = runner
+        self.collection = collection
+        self.id = document["_id"]
+        self.params = document.get("params") or {}
+        self._last_progress = 0.0
+
+    async def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None,
+                       force: bool = False) -> None:
+        """Guarda el avance (a lo sumo una vez por `PROGRESS_INTERVAL`, salvo `force`)."""
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        progress = {"done": done, "total": total, "message": message}
+        await self.collection.update_one({"_id": self.id}, {"$set": {"progress": progress, "heartbeatAt": _now()}})
+
+    async def in_thread(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """E/S síncrona fuera del event loop."""
+        return await asyncio.get_running_loop().run_in_executor(self.runner.threads, partial(fn, *args))
+
+    async def in_process(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Cálculo pesado en el pool de procesos (`fn` y los argumentos deben poder serializarse)."""
+        return await asyncio.get_running_loop().run_in_executor(self.runner.processes, partial(fn, *args))
+
+
+class JobRunner:
+    """Reclama tareas encoladas y las ejecuta con concurrencia y pools acotados."""
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY, thread_workers: int = JOB_THREAD_WORKERS,
+                 process_workers: int = JOB_PROCESS_WORKERS, poll_interval: float = JOB_POLL_SECONDS,
+                 stale_after: float = JOB_STALE_SECONDS, prune_interval: float = EXPORT_PRUNE_INTERVAL_SECONDS):
+        self.concurrency = concurrency
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.prune_interval = prune_interval
+        self._pruned_at: Optional[float] = None
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.enabled = False
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    # Los pools se crean en el primer uso: importar la app no lanza hilos ni procesos
+    @property
+    def threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="jobs")
+        return self._threads
+
+    @property
+    def processes(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            # `spawn`: el proceso de la API ya tiene hilos (Motor, SQLite) y `fork` podría copiar un lock tomado
+            self._processes = ProcessPoolExecutor(max_workers=self.process_workers,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        return self._processes
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def submit(self, collection, kind: str, params: Dict[str, Any], user) -> Dict[str, Any]:
+        """Encola una tarea de `user` (`TokenData`) y despierta a los trabajadores de este proceso."""
+        if kind not in _handlers:
+            raise ValueError(f"Tipo de tarea desconocido: {kind} (use {', '.join(kinds())})")
+        document = {
+            "kind": kind,
+            "params": params,
+            "status": "queued",
+            "progress": None,
+            "result": None,
+            "error": None,
+            "createdBy": user.sub,
+            "createdAt": _now(),
+            "startedAt": None,
+            "finishedAt": None,
+        }
+        result = await collection.insert_one(document)
+        document["_id"] = result.inserted_id
+        self._wake()
+        return document
+
+    async def _claim(self, collection) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await collection.find_one_and_update(
+            {"status": "queued"},
+            {"$set": {"status": "running", "startedAt": now, "heartbeatAt": now, "worker": self.worker}},
+            sort=[("createdAt", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _prune_exports(self) -> int:
+        """Borra las exportaciones vencidas si pasó `prune_interval` desde la última revisión."""
+        if self._pruned_at is not None and time.monotonic() - self._pruned_at < self.prune_interval:
+            return 0
+        self._pruned_at = time.monotonic()
+        # El TTL borra el documento de la tarea pero no su archivo; se usa el mismo plazo
+        return await asyncio.get_running_loop().run_in_executor(self.threads, prune_exports,
+                                                                JOB_RETENTION_DAYS * 24 * 3600)
+
+    async def _fail_stale(self, collection) -> int:
+        """Marca como fallidas las tareas cuyo proceso dejó de dar señales."""
+        now = _now()
+        result = await collection.update_many(
+            {"status": "running", "heartbeatAt": {"$lt": now - timedelta(seconds=self.stale_after)}},
+            {"$set": {"status": "failed", "error": "El proceso que ejecutaba la tarea dejó de responder",
+                      "finishedAt": now}},
+        )
+        return result.modified_count
+
+    async def _heartbeat(self, collection, job_id) -> None:
+        while True:
+            await asyncio.sleep(self.stale_after / 3)
+            await collection.update_one({"_id": job_id}, {"$set": {"heartbeatAt": _now()}})
+
+    async def _finish(self, collection, job_id, **fields: Any) -> None:
+        await collection.update_one({"_id": job_id}, {"$set": {**fields, "finishedAt": _now()}})
+
+    async def execute(self, collection, document: Dict[str, Any]) -> None:
+        """Ejecuta una tarea ya reclamada y guarda su resultado o su error."""
+        context = JobContext(self, collection, document)
+        heartbeat = asyncio.create_task(self._heartbeat(collection, document["_id"]))
+        started = time.perf_counter()
+        self.running += 1
+        try:
+            result = await _handlers[document["kind"]](context, context.params)
+            await self._finish(collection, document["_id"], status="succeeded", result=result)
+            self.succeeded += 1
+            print(f"🛠️  Tarea {document['kind']} {document['_id']} terminada ({time.perf_counter() - started:.1f}s)")
+        except asyncio.CancelledError:
+            await self._finish(collection, document["_id"], status="failed", error="Interrumpida al apagar el servidor")
+            self.failed += 1
+            raise
+        except Exception as e:
+            await self._finish(collection, document["_id"], status="failed", error=f"{type(e).__name__}: {e}")
+            self.failed += 1
+            print(f"⚠️  La tarea {document['kind']} {document['_id']} falló: {e}")
+        finally:
+            self.running -= 1
+            heartbeat.cancel()
+
+    async def _work(self, collection) -> None:
+        while True:
+            # Se limpia antes de buscar: un `submit` posterior vuelve a despertar al trabajador
+            self._wakeup.clear()
+            try:
+                document = await self._claim(collection)
+            except Exception as e:
+                print(f"⚠️  No se pudieron leer las tareas pendientes: {e}")
+                document = None
+            if document is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    try:
+                        await self._fail_stale(collection)
+                        await self._prune_exports()
+                    except Exception:
+                        pass
+                continue
+            await self.execute(collection, document)
+
+    async def run(self, collection) -> None:
+        """Tarea de fondo: `concurrency` trabajadores que toman tareas hasta que se cancela."""
+        self._wakeup = asyncio.Event()
+        self.enabled = True
+        try:
+            await self._fail_stale(collection)
+            await self._prune_exports()
+        except Exception as e:
+            print(f"⚠️  No se pudieron revisar las tareas interrumpidas: {e}")
+        self._tasks = [asyncio.create_task(self._work(collection)) for _ in range(self.concurrency)]
+        await asyncio.gather(*self._tasks)
+
+    async def stop(self) -> None:
+        """Interrumpe las tareas en curso (quedan como fallidas) y cierra los pools."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.enabled = False
+        for pool in (self._threads, self._processes):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "running": self.running, "succeeded": self.succeeded,
+                "failed": self.failed, "kinds": kinds()}
+
+
+runner = JobRunner()
+
+
+async def prepare(database) -> None:
+    await database.get_collection(JOBS_COLLECTION).create_indexes(JOB_INDEXES)
+
+
+def stats() -> Dict[str, Any]:
+    return runner.stats()
+
+
+# --- Tipos de tarea ---
+
+def _data_file(name: Optional[str]) -> str:
+    """Archivo de datos dentro del directorio de trabajo (nunca una ruta arbitraria del servidor)."""
+    from .loader import DEFAULT_FILE
+
+    name = name or DEFAULT_FILE
+    if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+        raise ValueError(f"Ruta no permitida: {name}")
+    if not os.path.isfile(name):
+        raise ValueError(f"No existe el archivo {name}")
+    return name
+
+
+def _load_result(report: Dict[str, Any]) -> Dict[str, Any]:
+    errors = report.pop("errors", [])
+    return {**report, "errors": errors[:MAX_REPORTED_ERRORS], "errorCount": len(errors)}
+
+
+def _active_collection():
+    from .database import get_convocatoria_collection
+
+    return get_convocatoria_collection()
+
+
+@job("reload")
+async def _reload(context: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Recarga blue/green desde un archivo (`file`); reemplaza `load_data.py --blue-green`."""
+    from .database import get_database
+    from .loader import reload_blue_green
+
+    report = await reload_blue_green(
+        get_database(), _data_file(params.get("file")), workers=context.runner.process_workers,
+        executor=context.runner.processes, on_progress=lambda read: context.progress(read, message="registros leídos"),
+    )
+    return _load_result(report)
+
+
+@job("load")
+async def _load(context: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Carga incremental sobre la versión activa (`file`, `dry_run`)."""
+    from . import catalog
+    from .indexes import ensure_indexes
+    from .loader import changed_count, load_catalogue
+
+    collection = _active_collection()
+    dry_run = bool(params.get("dry_run"))
+    await ensure_indexes(collection)
+    # Sin permiso de escritura (recarga blue/green en curso) la tarea falla con `WritesBlocked`
+    async with nullcontext() if dry_run else catalog.write_lease(collection.database):
+        report = await load_catalogue(
+            collection, _data_file(params.get("file")), workers=context.runner.process_workers, dry_run=dry_run,
+            executor=context.runner.processes, on_progress=lambda read: context.progress(read, message="registros leídos"),
+        )
+    changed = changed_count(report)
+    if changed and not dry_run:
+        # Las cachés se reconstruyen una vez, como tras una edición masiva (en los demás procesos al refrescar el puntero)
+        await catalog.publish_bulk_change("load", changed, collection.database)
+    return _load_result(report)
+
+
+@job("reindex")
+async def _reindex(context: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica el registro de índices (`prune` elimina los no registrados) y la selectividad."""
+    from .indexes import ensure_indexes
+    from .query_planner import refresh_selectivity
+
+    collection = _active_collection()
+    report = await ensure_indexes(collection, prune=bool(params.get("prune")))
+    await refresh_selectivity(collection)
+    return report
+
+
+@job("stats")
+async def _stats(context: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Recalcula las estadísticas materializadas (`python -m app.stats rebuild`)."""
+    from . import stats as catalog_stats
+
+    counts = await catalog_stats.rebuild(_active_collection())
+    return {"total": counts.get("total", 0)}
+
+
+@job("dedupe")
+async def _dedupe(context: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Informe de duplicados (`min_size`, `limit`); las firmas se calculan en el pool de procesos."""
+    from .dedupe import PROJECTION, find_clusters
+    from .repository import MongoRepository
+
+    collection = _active_collection()
+    documents = await MongoRepository(lambda: collection).scan(PROJECTION)
+    await context.progress(0, len(documents), "calculando firmas", force=True)
+    clusters = await context.in_process(find_clusters, documents)
+    min_size, limit = int(params.get("min_size", 2)), int(params.get("limit", 100))
+    return {
+        "documents": len(documents),
+        "clusters": len(clusters),
+        "duplicates": sum(cluster["size"] - 1 for cluster in clusters),
+        "top": [cluster for cluster in clusters if cluster["size"] >= min_size][:limit],
+    }
+
+
+_EXPORT_ADAPTER = None
+
+
+def _append_lines(path: str, documents: List[Dict[str, Any]]) -> int:
+    """Agrega los documentos a un archivo NDJSON con el formato de la API (corre en un hilo)."""
+    global _EXPORT_ADAPTER
+    if _EXPORT_ADAPTER is None:
+        from .models import Convocatoria
+
+        _EXPORT_ADAPTER = TypeAdapter(Convocatoria)
+    lines = b"".join(_EXPORT_ADAPTER.dump_json(_EXPORT_ADAPTER.validate_python(doc), by_alias=True) + b"\n"
+                     for doc in documents)
+    with open(path, "ab") as f:
+        f.write(lines)
+    return len(lines)
+
+
+def export_path(job_id) -> str:
+    return os.path.join(EXPORT_DIR, f"convocatorias_{job_id}.ndjson")
+
+
+def prune_exports(max_age: float, directory: Optional[str] = None) -> int:
+    """Borra las exportaciones modificadas hace más de `max_age` segundos (corre en un hilo)."""
+    directory = directory or EXPORT_DIR
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        # También los `.part` que dejó un proceso que murió a mitad de una exportación
+        if not (entry.name.startswith("convocatorias_") and entry.name.endswith((".ndjson", ".ndjson.part"))):
+            continue
+        try:
+            # Una exportación en curso se modifica en cada lote, así que nunca parece vieja
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Otro proceso la borró primero
+            pass
+    if removed:
+        print(f"🧹 {removed} exportaciones de más de {max_age / 86400:g} días borradas de {directory}")
+    return removed
+
+
+@job("export")
+async def _export(context: JobContext, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Exporta a NDJSON las convocatorias de los filtros del listado (`filters`); se descarga en `/jobs/{id}/download`."""
+    from .models import ConvocatoriaFilters
+    from .repository import MongoRepository
+
+    filters = ConvocatoriaFilters(**(params.get("filters") or {}))
+    collection = _active_collection()
+    repository = MongoRepository(lambda: collection)
+    total = await repository.count(filters)
+    path = export_path(context.id)
+    # Se escribe con otro nombre y se renombra al terminar: la descarga nunca ve un archivo a medias
+    partial = path + ".part"
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    exported, size, batch = 0, 0, []
+    try:
+        async for document in repository.iterate(filters, 0, max(total, 1), EXPORT_BATCH_SIZE):
+            batch.append(document)
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                size += await context.in_thread(_append_lines, partial, batch)
+                exported += len(batch)
+                batch = []
+                await context.progress(exported, total, "convocatorias exportadas")
+        if batch or not exported:
+            size += await context.in_thread(_append_lines, partial, batch)
+            exported += len(batch)
+        os.replace(partial, path)
+    except BaseException:
+        # Falla o cancelación al apagar: no queda el archivo incompleto
+        try:
+            os.remove(partial)
+        except FileNotFoundError:
+            pass
+        raise
+    return {"file": os.path.basename(path), "count": exported, "bytes": size}
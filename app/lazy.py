@@ -0,0 +1,43 @@
+"""
+Importación diferida de dependencias pesadas.
+
+numpy, scipy y httpx suman varios cientos de milisegundos al importar la API y solo se
+usan en tareas de fondo (índices en memoria, verificador de enlaces) o en rutas puntuales.
+`lazy_import` devuelve un objeto que se comporta como el módulo pero lo importa en el
+primer acceso a un atributo, así que un proceso nuevo responde antes su primera petición.
+
+Los módulos que lo usan declaran `from __future__ import annotations` para que las
+anotaciones (`np.ndarray`, `httpx.Response`) no fuercen la importación.
+"""
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """Módulo que se importa de verdad en el primer acceso a uno de sus atributos."""
+
+    def __init__(self, name: str):
+        self.__dict__["_lazy_name"] = name
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _lazy_load(self) -> ModuleType:
+        # El primer uso puede ocurrir a la vez en el event loop y en un hilo de cálculo
+        with self._lazy_lock:
+            module = importlib.import_module(self._lazy_name)
+            # Los accesos siguientes encuentran el atributo sin pasar por `__getattr__`
+            self.__dict__.update({key: value for key, value in vars(module).items() if not key.startswith("_lazy")})
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        module = self.__dict__.get("_lazy_module") or self._lazy_load()
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "importado" if "_lazy_module" in self.__dict__ else "sin importar"
+        return f"<módulo diferido {self._lazy_name} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
@@ -0,0 +1,239 @@
+"""
+Verificación de los enlaces externos de las convocatorias.
+
+Cada convocatoria tiene hasta tres URLs (`dreLink`, `agreementLink`, `internationalLink`).
+El verificador recorre las URLs distintas del catálogo con un cliente HTTP asíncrono:
+
+- Concurrencia global acotada (`LINK_CHECK_CONCURRENCY`) y por host (`LINK_CHECK_PER_HOST`)
+  para no saturar ningún servidor.
+- Peticiones condicionales (`If-None-Match` / `If-Modified-Since`) con los validadores de
+  la verificación anterior; un 304 confirma el enlace sin descargar nada.
+- Resultados cacheados por URL en `link_checks` con vencimiento distinto para enlaces
+  sanos y rotos; solo se vuelven a verificar los vencidos.
+
+El resultado se guarda en cada documento (`links.<campo>` y `hasBrokenLinks`), así que el
+listado puede filtrar con `broken_links=true|false` usando un índice.
+
+Uso como script:
+    python -m app.links check [--force]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from pymongo import UpdateOne
+
+from . import catalog
+from .lazy import lazy_import
+
+# Solo la tarea de fondo y el script usan el cliente HTTP
+httpx = lazy_import("httpx")
+
+LINK_FIELDS = ("dreLink", "agreementLink", "internationalLink")
+LINK_CHECKS_COLLECTION = "link_checks"
+
+LINK_CHECK_CONCURRENCY = int(os.getenv("LINK_CHECK_CONCURRENCY", "100"))
+LINK_CHECK_PER_HOST = int(os.getenv("LINK_CHECK_PER_HOST", "4"))
+LINK_CHECK_TIMEOUT = float(os.getenv("LINK_CHECK_TIMEOUT", "10"))
+# Vigencia de un resultado: los enlaces sanos se revisan con menos frecuencia que los rotos
+LINK_OK_TTL_SECONDS = float(os.getenv("LINK_OK_TTL_SECONDS", str(7 * 24 * 3600)))
+LINK_BROKEN_TTL_SECONDS = float(os.getenv("LINK_BROKEN_TTL_SECONDS", str(24 * 3600)))
+# Cada cuánto corre la verificación en segundo plano (0 la desactiva)
+LINK_CHECK_INTERVAL_SECONDS = float(os.getenv("LINK_CHECK_INTERVAL_SECONDS", str(24 * 3600)))
+
+OK, BROKEN = "ok", "broken"
+USER_AGENT = "UnxChange-LinkChecker/1.0"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _is_http(url: Any) -> bool:
+    return isinstance(url, str) and url.lower().startswith(("http://", "https://"))
+
+
+class LinkChecker:
+    """Verifica URLs con límites de concurrencia global y por host."""
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        concurrency: int = LINK_CHECK_CONCURRENCY,
+        per_host: int = LINK_CHECK_PER_HOST,
+        timeout: float = LINK_CHECK_TIMEOUT,
+    ):
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self._slots = asyncio.Semaphore(concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_host))
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def _request(self, method: str, url: str, headers: Dict[str, str]) -> httpx.Response:
+        # Sin leer el cuerpo: solo interesan el estado y los validadores
+        async with self.client.stream(method, url, headers=headers) as response:
+            return response
+
+    async def check(self, url: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Verifica una URL; `previous` es su resultado anterior (para la petición condicional)."""
+        headers = {}
+        if previous and previous.get("status") == OK:
+            if previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+            if previous.get("lastModified"):
+                headers["If-Modified-Since"] = previous["lastModified"]
+
+        # Una URL mal formada (p. ej. `http://[::1`) cuenta como rota; no debe cortar la verificación
+        try:
+            host = urlsplit(url).netloc.lower()
+        except ValueError as e:
+            return {"status": BROKEN, "httpStatus": None, "error": type(e).__name__}
+
+        # Primero el cupo del host: así las URLs de un host lento no acaparan los cupos globales
+        async with self._hosts[host], self._slots:
+            try:
+                response = await self._request("HEAD", url, headers)
+                if response.status_code in (403, 405, 501):
+                    # Algunos servidores no aceptan HEAD
+                    response = await self._request("GET", url, headers)
+            except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+                return {"status": BROKEN, "httpStatus": None, "error": type(e).__name__}
+
+        if response.status_code == 304 and previous:
+            return {**previous, "httpStatus": 304, "error": None}
+        return {
+            "status": OK if response.status_code < 400 else BROKEN,
+            "httpStatus": response.status_code,
+            "etag": response.headers.get("etag"),
+            "lastModified": response.headers.get("last-modified"),
+            "error": None,
+        }
+
+    async def check_many(self, urls: Iterable[str], previous: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        urls = list(urls)
+        results = await asyncio.gather(*(self.check(url, previous.get(url)) for url in urls))
+        return dict(zip(urls, results))
+
+
+def _expires_at(result: Dict[str, Any], now: datetime) -> datetime:
+    ttl = LINK_OK_TTL_SECONDS if result["status"] == OK else LINK_BROKEN_TTL_SECONDS
+    return now + timedelta(seconds=ttl)
+
+
+def document_link_fields(document: Dict[str, Any], results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Campos de estado de enlaces de un documento a partir de los resultados por URL."""
+    links = {}
+    for field in LINK_FIELDS:
+        url = document.get(field)
+        if _is_http(url) and url in results:
+            result = results[url]
+            links[field] = {"status": result["status"], "httpStatus": result.get("httpStatus"),
+                            "checkedAt": result.get("checkedAt")}
+    return {"links": links, "hasBrokenLinks": any(link["status"] == BROKEN for link in links.values())}
+
+
+async def check_catalogue(collection, checker: Optional[LinkChecker] = None, force: bool = False) -> Dict[str, Any]:
+    """Verifica los enlaces del catálogo y guarda el estado en la caché y en cada documento."""
+    started = time.perf_counter()
+    cache = collection.database.get_collection(LINK_CHECKS_COLLECTION)
+    projection = {field: 1 for field in (*LINK_FIELDS, "links", "hasBrokenLinks")}
+    documents = await collection.find({}, projection).to_list(length=None)
+    urls = {doc[field] for doc in documents for field in LINK_FIELDS if _is_http(doc.get(field))}
+
+    now = _now()
+    cached: Dict[str, Dict[str, Any]] = {}
+    url_list = list(urls)
+    for start in range(0, len(url_list), 1000):
+        async for entry in cache.find({"_id": {"$in": url_list[start:start + 1000]}}):
+            cached[entry["_id"]] = entry
+    due = [url for url in urls if force or url not in cached or cached[url]["expiresAt"].replace(tzinfo=timezone.utc) <= now]
+
+    own_checker = checker is None
+    checker = checker or LinkChecker()
+    try:
+        fresh = await checker.check_many(due, cached)
+    finally:
+        if own_checker:
+            await checker.aclose()
+
+    now = _now()
+    writes = []
+    for url, result in fresh.items():
+        result = {key: value for key, value in result.items() if key != "_id"}
+        result.update(checkedAt=now, expiresAt=_expires_at(result, now))
+        cached[url] = result
+        writes.append(UpdateOne({"_id": url}, {"$set": result}, upsert=True))
+    if writes:
+        await cache.bulk_write(writes, ordered=False)
+
+    # Solo se escriben los documentos cuyo estado cambió
+    updates = []
+    for doc in documents:
+        fields = document_link_fields(doc, cached)
+        if fields["links"] != doc.get("links") or fields["hasBrokenLinks"] != doc.get("hasBrokenLinks"):
+            updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+    try:
+        # Solo los documentos del catálogo necesitan el permiso de escritura (la caché no tiene versiones)
+        async with catalog.write_lease(collection.database):
+            for start in range(0, len(updates), 1000):
+                await collection.bulk_write(updates[start:start + 1000], ordered=False)
+    except catalog.WritesBlocked:
+        # Se aplicarán desde la caché en la próxima corrida, sobre la versión nueva
+        updates = []
+
+    broken = sum(1 for url in urls if cached.get(url, {}).get("status") == BROKEN)
+    return {
+        "urls": len(urls),
+        "checked": len(fresh),
+        "cached": len(urls) - len(fresh),
+        "broken": broken,
+        "documentsUpdated": len(updates),
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
+
+
+async def run_scheduler(get_collection, interval: float = LINK_CHECK_INTERVAL_SECONDS) -> None:
+    """Tarea de fondo: verifica los enlaces vencidos cada `interval` segundos."""
+    if interval <= 0:
+        return
+    while True:
+        try:
+            # Durante una recarga blue/green se espera a la versión nueva (la copia ya está hecha)
+            report = {"checked": 0} if catalog.writes_blocked() else await check_catalogue(get_collection())
+            if report["checked"]:
+                print(f"🔗 {report['checked']} enlaces verificados, {report['broken']} rotos ({report['elapsed']}s)")
+        except Exception as e:
+            print(f"⚠️  Error verificando enlaces: {e}")
+        await asyncio.sleep(interval)
+
+
+async def _main(force: bool) -> int:
+    from .database import get_active_convocatoria_collection
+
+    collection = await get_active_convocatoria_collection()
+    report = await check_catalogue(collection, force=force)
+    print(f"✅ URLs: {report['urls']}, verificadas: {report['checked']}, desde caché: {report['cached']}, "
+          f"rotas: {report['broken']}, documentos actualizados: {report['documentsUpdated']} ({report['elapsed']}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificación de enlaces de las convocatorias")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("check", help="Verifica los enlaces vencidos (o todos con --force)")
+    check.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.force)))
@@ -0,0 +1,321 @@
+"""
+Carga incremental e idempotente del catálogo de convocatorias.
+
+- Lee el archivo (arreglo JSON o NDJSON) por bloques, sin cargarlo completo en memoria.
+- Valida los registros con `ConvocatoriaCreate` en un pool de procesos.
+- Calcula una clave de origen (`sourceKey`) y un hash de contenido (`contentHash`) por registro.
+- Aplica solo las diferencias con upserts y borrados por lotes no ordenados, así que la
+  colección nunca queda vacía durante la recarga y el proceso puede repetirse sin efectos.
+- Con `reload_blue_green` la carga se hace sobre una copia versionada del catálogo que se
+  activa al final moviendo el puntero de `app.catalog`, sin tocar la colección que se sirve.
+
+Los documentos sin `sourceKey` cuya identidad (`SOURCE_KEY_FIELDS`) coincide con un registro
+del archivo vienen de cargas anteriores al cargador incremental (`delete_many` + `insert_many`):
+se adoptan escribiéndoles la clave y el contenido, en lugar de insertar una copia (y si el
+registro ya tiene su documento con clave, la copia sin clave se elimina). Los demás
+documentos sin `sourceKey` (creados desde la API) no se modifican.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import DeleteMany, DeleteOne, UpdateOne
+
+from . import catalog, stats
+from .indexes import ensure_indexes
+from .models import ConvocatoriaCreate
+from .normalization import fold, prepare_document
+
+# Generado por `preprocess_json.py`; se acepta también el JSON indentado anterior
+DEFAULT_FILE = "DataConvenios_limpio.ndjson"
+CHUNK_SIZE = 500
+WRITE_BATCH_SIZE = 1000
+READ_BLOCK_SIZE = 64 * 1024
+
+# Campos que identifican un convenio en el archivo de origen
+SOURCE_KEY_FIELDS = ("institution", "country", "subscriptionYear", "agreementType", "subscriptionLevel", "dreLink")
+
+
+def iter_json_records(path: str, block_size: int = READ_BLOCK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Itera los registros de un arreglo JSON o de un archivo NDJSON leyendo por bloques."""
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        if first != "[":
+            # NDJSON: un registro por línea; cada bloque de líneas se decodifica en una sola llamada
+            pending = first
+            while True:
+                lines = f.readlines(block_size)
+                if pending:
+                    lines = [pending + (lines[0] if lines else "")] + lines[1:]
+                    pending = ""
+                lines = [line for line in lines if not line.isspace()]
+                if not lines:
+                    return
+                yield from json.loads("[" + ",".join(lines) + "]")
+
+        decoder = json.JSONDecoder()
+        buffer, pos, eof = "", 0, False
+        while True:
+            # Salta separadores sin copiar el buffer
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    # Un valor al final del bloque puede estar incompleto (p. ej. un número)
+                    if end < len(buffer) or eof:
+                        yield item
+                        pos = end
+                        continue
+            elif eof:
+                return
+            block = f.read(block_size)
+            eof = not block
+            buffer, pos = buffer[pos:] + block, 0
+
+
+def _identity(item: Dict[str, Any]) -> str:
+    return "|".join(fold(item.get(field)) for field in SOURCE_KEY_FIELDS)
+
+
+def _source_key(identity: str, occurrence: int) -> str:
+    # Los convenios repetidos en el archivo se distinguen por su orden de aparición
+    return hashlib.sha1(f"{identity}#{occurrence}".encode("utf-8")).hexdigest()
+
+
+def content_hash(document: Dict[str, Any]) -> str:
+    """Hash estable del contenido de un documento (independiente del orden de las claves)."""
+    payload = json.dumps(document, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def validate_chunk(items: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """
+    Valida un bloque de registros `(sourceKey, item)` y devuelve los documentos válidos
+    y los errores `(sourceKey, mensaje)`.
+    Se ejecuta en los procesos del pool, por eso es una función de módulo.
+    """
+    documents, errors = [], []
+    for key, item in items:
+        try:
+            document = prepare_document(ConvocatoriaCreate(**item).dict(by_alias=True))
+        except Exception as e:
+            errors.append((key, f"{item.get('institution', '?')}: {e}"))
+            continue
+        document["contentHash"] = content_hash(document)
+        document["sourceKey"] = key
+        documents.append(document)
+    return documents, errors
+
+
+def _keyed_chunks(path: str, chunk_size: int) -> Iterator[List[Tuple[str, Dict[str, Any]]]]:
+    occurrences: Dict[str, int] = {}
+    chunk = []
+    for item in iter_json_records(path):
+        identity = _identity(item)
+        occurrences[identity] = occurrences.get(identity, 0) + 1
+        chunk.append((_source_key(identity, occurrences[identity]), item))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _validated_chunks(path: str, workers: int, chunk_size: int, executor: Optional[Executor] = None):
+    """
+    Produce bloques validados; con `workers > 0` la validación va en paralelo, en un pool
+    propio o en `executor` (el pool de procesos de `app.jobs`).
+    """
+    if workers <= 0:
+        for chunk in _keyed_chunks(path, chunk_size):
+            yield validate_chunk(chunk)
+        return
+
+    async def validate(pool):
+        loop = asyncio.get_running_loop()
+        pending = []
+        for chunk in _keyed_chunks(path, chunk_size):
+            pending.append(loop.run_in_executor(pool, validate_chunk, chunk))
+            # Limita los bloques en vuelo para acotar la memoria
+            if len(pending) >= workers * 2:
+                yield await pending.pop(0)
+        for future in pending:
+            yield await future
+
+    if executor is not None:
+        async for result in validate(executor):
+            yield result
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async for result in validate(pool):
+            yield result
+
+
+async def load_catalogue(
+    collection,
+    path: str = DEFAULT_FILE,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    batch_size: int = WRITE_BATCH_SIZE,
+    dry_run: bool = False,
+    executor: Optional[Executor] = None,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """
+    Sincroniza la colección con el archivo aplicando solo las diferencias.
+    `on_progress` recibe los registros leídos después de cada bloque.
+    """
+    started = time.perf_counter()
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    report = {"read": 0, "invalid": 0, "inserted": 0, "adopted": 0, "updated": 0, "unchanged": 0, "deleted": 0,
+              "duplicates": 0, "errors": []}
+
+    # Estado actual: sourceKey -> contentHash (solo las claves, no los documentos)
+    existing: Dict[str, str] = {}
+    async for doc in collection.find({"sourceKey": {"$exists": True}}, {"sourceKey": 1, "contentHash": 1}):
+        existing[doc["sourceKey"]] = doc.get("contentHash")
+
+    # Documentos sin clave por identidad, en orden de inserción: los de cargas anteriores se
+    # adoptan en el mismo orden en que aparecen las repeticiones en el archivo
+    unkeyed: Dict[str, List[Any]] = defaultdict(list)
+    projection = {field: 1 for field in SOURCE_KEY_FIELDS}
+    async for doc in collection.find({"sourceKey": {"$exists": False}}, projection).sort("_id", 1):
+        unkeyed[_identity(doc)].append(doc["_id"])
+
+    seen = set()
+    valid_keys = set()
+    operations: List[Any] = []
+
+    async def flush():
+        nonlocal operations
+        if operations and not dry_run:
+            await collection.bulk_write(operations, ordered=False)
+        operations = []
+
+    async for documents, errors in _validated_chunks(path, workers, chunk_size, executor):
+        report["read"] += len(documents) + len(errors)
+        if on_progress is not None:
+            await on_progress(report["read"])
+        report["invalid"] += len(errors)
+        for key, message in errors:
+            # Un registro inválido no borra la versión válida que ya esté cargada
+            seen.add(key)
+            report["errors"].append(message)
+        for document in documents:
+            key = document["sourceKey"]
+            seen.add(key)
+            valid_keys.add(key)
+            legacy = unkeyed.get(_identity(document))
+            if key in existing and legacy:
+                # Copia sin clave de un registro que ya tiene su documento con clave
+                report["duplicates"] += 1
+                operations.append(DeleteOne({"_id": legacy.pop(0)}))
+                if len(operations) >= batch_size:
+                    await flush()
+            if key not in existing:
+                if legacy:
+                    report["adopted"] += 1
+                    operations.append(UpdateOne({"_id": legacy.pop(0)}, {"$set": document}))
+                    if len(operations) >= batch_size:
+                        await flush()
+                    continue
+                report["inserted"] += 1
+            elif existing[key] != document["contentHash"]:
+                report["updated"] += 1
+            else:
+                report["unchanged"] += 1
+                continue
+            operations.append(UpdateOne({"sourceKey": key}, {"$set": document}, upsert=True))
+            if len(operations) >= batch_size:
+                await flush()
+
+    # Claves que deben quedar en la colección: las válidas y las inválidas que ya estaban cargadas
+    report["expected"] = report["inserted"] + report["adopted"] + report["updated"] + report["unchanged"] + sum(
+        1 for key in existing if key in seen and key not in valid_keys
+    )
+
+    removed = [key for key in existing if key not in seen]
+    report["deleted"] = len(removed)
+    for start in range(0, len(removed), batch_size):
+        operations.append(DeleteMany({"sourceKey": {"$in": removed[start:start + batch_size]}}))
+    await flush()
+
+    # Las cargas masivas no pasan por la API: las estadísticas se recalculan completas
+    if not dry_run and changed_count(report):
+        await stats.rebuild(collection)
+
+    report["elapsed"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def changed_count(report: Dict[str, Any]) -> int:
+    """Documentos que una carga insertó, adoptó, actualizó o eliminó."""
+    return sum(report[name] for name in ("inserted", "adopted", "updated", "deleted", "duplicates"))
+
+
+# Versiones anteriores que se conservan para poder volver atrás
+KEEP_PREVIOUS_VERSIONS = 1
+
+
+async def reload_blue_green(database, path: str = DEFAULT_FILE, workers: Optional[int] = None,
+                            executor: Optional[Executor] = None,
+                            on_progress: Optional[Callable[[int], Awaitable[None]]] = None) -> Dict[str, Any]:
+    """
+    Construye una nueva versión del catálogo y la activa solo si queda completa.
+
+    1. Marca la construcción en el puntero (`catalog.begin_build`): desde ahí no se dan
+       permisos de escritura, y se espera a que terminen las escrituras que ya tenían uno.
+    2. Copia la versión activa en una colección nueva (conserva `_id` y documentos creados por la API).
+    3. Crea los índices y aplica las diferencias del archivo sobre la copia.
+    4. Verifica los conteos y mueve el puntero (lo que también quita la marca); los lectores
+       pasan a la nueva versión. Si algo falla se quita la marca y se conserva la versión activa.
+    """
+    active = database.get_collection(catalog.active_collection_name())
+    name = catalog.new_version_name()
+    target = database.get_collection(name)
+
+    await catalog.begin_build(database, name)
+    try:
+        await catalog.wait_for_writers(database)
+        # La copia se hace en el servidor con $merge, sin pasar los documentos por la app
+        await active.aggregate([{"$match": {}}, {"$merge": {"into": name}}]).to_list(length=None)
+        await ensure_indexes(target)
+
+        report = await load_catalogue(target, path, workers=workers, executor=executor, on_progress=on_progress)
+        report["collection"] = name
+
+        keyed = await target.count_documents({"sourceKey": {"$exists": True}})
+        # Los documentos adoptados dejan de estar sin clave y las copias duplicadas se eliminan
+        unkeyed_expected = (await active.count_documents({"sourceKey": {"$exists": False}})
+                            - report["adopted"] - report["duplicates"])
+        unkeyed = await target.count_documents({"sourceKey": {"$exists": False}})
+        if keyed != report["expected"] or unkeyed != unkeyed_expected or keyed + unkeyed == 0:
+            raise RuntimeError(
+                f"Verificación fallida en {name}: {keyed} documentos del archivo (esperados {report['expected']}), "
+                f"{unkeyed} creados por la API (esperados {unkeyed_expected}). Se conserva la versión activa."
+            )
+
+        report["version"] = await catalog.publish(database, name)
+    except BaseException:
+        await target.drop()
+        await catalog.end_build(database)
+        raise
+
+    previous = await catalog.previous_versions(database)
+    for old in previous[:-KEEP_PREVIOUS_VERSIONS] if KEEP_PREVIOUS_VERSIONS else previous:
+        await database.drop_collection(old)
+    return report
@@ -1,27 +1,240 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import convocatorias
-
-app = FastAPI(
-    title="API de Convocatorias UnxChange",
-    description="Provee acceso a las convocatorias de movilidad académica.",
-    version="1.0.0"
+from .routes import convocatorias, jobs as job_routes, saved_searches as saved_search_routes
+from . import catalog
+from .database import (
+    close_client, get_audit_collection, get_database, get_convocatoria_collection, get_job_collection,
+    get_saved_search_collection, get_saved_search_outbox_collection,
 )
+from .expiry import run_scheduler
+from .indexes import ensure_indexes
+from .query_planner import refresh_selectivity
+from . import dedupe, links, recommender, similarity
+from .repository import STORAGE_BACKEND, get_repository
+from .singleflight import reads
+from . import admission, audit, circuit, jobs, saved_searches
+from .security import check_config
 
-# Configuración de CORS para permitir que el frontend se conecte
-# Para producción, es mejor restringir los orígenes
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Permitir todos los orígenes en desarrollo
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-)
+# Permite desactivar la creación de índices al arrancar (p. ej. con usuarios de solo lectura)
+AUTO_CREATE_INDEXES = os.getenv("AUTO_CREATE_INDEXES", "true").lower() == "true"
+
+
+# Las estadísticas de selectividad se recalculan sobre cada nueva versión del catálogo
+@catalog.on_switch
+async def _refresh_selectivity_on_switch(name: str, version: int):
+    await refresh_selectivity(get_database().get_collection(name))
+
+
+# Tareas de fondo lanzadas por los suscriptores (se cancelan al apagar)
+_background_tasks = set()
+
+
+def _run_in_background(coro, description: str) -> asyncio.Task:
+    def _report(task: asyncio.Task) -> None:
+        _background_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️  No se pudo construir {description}: {task.exception()}")
+
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_report)
+    return task
+
+
+# El índice de recomendación se reconstruye en segundo plano sobre cada nueva versión
+# y se actualiza de forma incremental con las escrituras de la API
+def _rebuild_recommender_in_background() -> None:
+    _run_in_background(recommender.rebuild(get_repository()), "el índice de recomendación")
+
+
+# La tabla de similares y los grupos de duplicados se recalculan sobre cada nueva versión
+# y, tras escrituras, una sola vez por ráfaga (esperan `REBUILD_DELAY`)
+_pending_rebuilds = {}
+# Escrituras pedidas por cada cálculo (contador) y la espera de la última
+_rebuild_requests = {}
+
+
+def _rebuild_later(rebuild, description: str, delay: float = 0) -> None:
+    generation = _rebuild_requests.get(description, (0, 0))[0] + 1
+    _rebuild_requests[description] = (generation, delay)
+    pending = _pending_rebuilds.get(description)
+    if pending is not None and not pending.done():
+        if delay:
+            # La tarea en curso vuelve a calcular si la escritura llegó después de leer el catálogo
+            return
+        pending.cancel()
+
+    async def _rebuild():
+        wait = delay
+        while True:
+            await asyncio.sleep(wait)
+            seen = _rebuild_requests[description][0]
+            await rebuild(get_repository())
+            current, wait = _rebuild_requests[description]
+            if current == seen:
+                return
+
+    _pending_rebuilds[description] = _run_in_background(_rebuild(), description)
+
+
+def _rebuild_similarity_in_background(delay: float = 0) -> None:
+    _rebuild_later(similarity.rebuild, "la tabla de similares", delay)
+
+
+def _rebuild_duplicates_in_background(delay: float = 0) -> None:
+    _rebuild_later(dedupe.rebuild, "los grupos de duplicados", delay)
+
+
+@catalog.on_switch
+def _rebuild_caches_on_switch(name: str, version: int):
+    _rebuild_recommender_in_background()
+    _rebuild_similarity_in_background()
+    _rebuild_duplicates_in_background()
+
+
+# Una edición o un borrado masivo reconstruye las cachés una sola vez (no por documento)
+@catalog.on_bulk_change
+def _rebuild_caches_after_bulk_change(operation: str, count: int):
+    print(f"🧹 Operación masiva ({operation}) sobre {count} convocatorias: se reconstruyen las cachés")
+    _rebuild_caches_on_switch(catalog.active_collection_name(), catalog.active_version())
+
+
+@catalog.on_change
+def _update_caches(before, after):
+    recommender.recommender.apply_change(before, after)
+    if recommender.recommender.needs_rebuild():
+        _rebuild_recommender_in_background()
+    _rebuild_similarity_in_background(delay=similarity.REBUILD_DELAY)
+    # Mientras tanto, las altas nuevas se comparan contra las escrituras recientes
+    dedupe.index.apply_change(before, after)
+    _rebuild_duplicates_in_background(delay=dedupe.REBUILD_DELAY)
+
+
+# Avisos para las búsquedas guardadas que la escritura empieza a cumplir (se escriben por lotes)
+@catalog.on_change
+def _match_saved_searches(before, after):
+    saved_searches.notify(before, after)
+
+
+async def _start_mongo_services() -> list:
+    """Versión activa, índices y tareas de fondo que solo existen con el backend `mongo`."""
+    try:
+        # Versión activa del catálogo (colección a la que apunta `catalog_meta`)
+        database = get_database()
+        await catalog.refresh(database)
+        collection = get_convocatoria_collection()
+        if AUTO_CREATE_INDEXES:
+            report = await ensure_indexes(collection)
+            print(f"🔍 Índices - creados: {report['created'] + report['recreated']}, sin registrar: {report['unmanaged']}")
+        await refresh_selectivity(collection)
+    except Exception as e:
+        # La API puede servir sin índices nuevos; no se bloquea el arranque
+        print(f"⚠️  No se pudieron preparar los índices: {e}")
+    # Cada servicio prepara sus propias colecciones; un fallo no impide preparar los demás
+    for name, prepare in (("búsquedas guardadas", saved_searches.prepare), ("auditoría", audit.prepare),
+                          ("tareas", jobs.prepare)):
+        try:
+            await prepare(get_database())
+        except Exception as e:
+            print(f"⚠️  No se pudieron preparar las colecciones de {name}: {e}")
+
+    return [
+        asyncio.create_task(catalog.watch(get_database())),
+        asyncio.create_task(run_scheduler(get_convocatoria_collection)),
+        asyncio.create_task(links.run_scheduler(get_convocatoria_collection)),
+        asyncio.create_task(saved_searches.run_sync(get_saved_search_collection())),
+        asyncio.create_task(saved_searches.outbox.run(get_saved_search_outbox_collection())),
+        asyncio.create_task(audit.log.run(get_audit_collection())),
+        asyncio.create_task(jobs.runner.run(get_job_collection())),
+    ]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La configuración se valida y el cliente se crea aquí, no al importar: con `--preload`
+    # el proceso maestro importa la app y cada worker arranca su propio ciclo de vida
+    check_config()
+    repository = get_repository()
+    await repository.prepare()
+    print(f"🗄️  Almacenamiento: {repository.backend} ({repository.name})")
+    services = await _start_mongo_services() if repository.backend == "mongo" else []
+
+    if not recommender.recommender.rebuilding:
+        _rebuild_recommender_in_background()
+    if not _pending_rebuilds:
+        _rebuild_similarity_in_background()
+        _rebuild_duplicates_in_background()
+    yield
+    if services:
+        # Las tareas en curso quedan registradas como interrumpidas antes de cerrar el cliente
+        await jobs.runner.stop()
+    for task in services:
+        task.cancel()
+    if services:
+        try:
+            await saved_searches.outbox.flush(get_saved_search_outbox_collection())
+        except Exception as e:
+            print(f"⚠️  Quedaron {len(saved_searches.outbox)} avisos sin escribir: {e}")
+        try:
+            await audit.log.flush(get_audit_collection())
+        except Exception as e:
+            print(f"⚠️  Quedaron {len(audit.log)} entradas de auditoría sin escribir: {e}")
+    for task in list(_background_tasks):
+        task.cancel()
+    await repository.close()
+    if repository.backend == "mongo":
+        close_client()
 
-# Incluir las rutas del módulo de convocatorias
-app.include_router(convocatorias.router)
 
-@app.get("/", tags=["Root"])
 def read_root():
-    return {"message": "Bienvenido a la API de Convocatorias UnxChange"}
\ No newline at end of file
+    return {"message": "Bienvenido a la API de Convocatorias UnxChange"}
+
+# Métricas internas del servicio
+def read_metrics():
+    return {"singleflight": reads.stats(), "admission": admission.stats(), "circuit": circuit.stats(),
+            "savedSearches": saved_searches.stats(), "duplicates": dedupe.index.stats(),
+            "audit": audit.stats(), "jobs": jobs.stats()}
+
+
+def create_app() -> FastAPI:
+    """Construye la aplicación sin abrir conexiones (`uvicorn app.main:create_app --factory`)."""
+    app = FastAPI(
+        title="API de Convocatorias UnxChange",
+        description="Provee acceso a las convocatorias de movilidad académica.",
+        version="1.0.0",
+        lifespan=lifespan,
+    )
+
+    # Configuración de CORS para permitir que el frontend se conecte
+    # Para producción, es mejor restringir los orígenes
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Permitir todos los orígenes en desarrollo
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+    )
+
+    # Incluir las rutas del módulo de convocatorias
+    app.include_router(convocatorias.router)
+    # Las búsquedas guardadas, sus avisos y las tareas administrativas se guardan en MongoDB
+    if STORAGE_BACKEND == "mongo":
+        app.include_router(saved_search_routes.router)
+        app.include_router(job_routes.router)
+
+    app.get("/", tags=["Root"])(read_root)
+    app.get("/metrics", tags=["Root"])(read_metrics)
+    return app
+
+
+# `app.main:app` sigue funcionando: la instancia se construye en el primer acceso al atributo
+def __getattr__(name: str):
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
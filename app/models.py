@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, field_validator, model_validator
 from pydantic_core import core_schema
 from typing import List, Optional, Any, Dict
+from datetime import date, datetime
 from bson import ObjectId
 
 # Helper para ObjectId - VERSIÓN CORREGIDA PARA PYDANTIC V2
@@ -35,6 +36,12 @@ class PyObjectId(str):
             raise ValueError("Invalid ObjectId")
         return ObjectId(v)
 
+# Resultado de la última verificación de un enlace
+class LinkStatus(BaseModel):
+    status: str
+    httpStatus: Optional[int] = None
+    checkedAt: Optional[datetime] = None
+
 # Modelo principal de la Convocatoria - Actualizado para coincidir con los datos reales
 class Convocatoria(BaseModel):
     # El Field ahora debe usar 'validation_alias' en lugar de 'alias' para la conversión de BSON
@@ -53,6 +60,13 @@ class Convocatoria(BaseModel):
     agreementLink: Optional[str] = None
     properties: Optional[str] = Field(None, alias="Props")
     internationalLink: Optional[str] = None
+    # Fin de la vigencia interpretada a partir de `validity` (None si no es una fecha)
+    validUntil: Optional[datetime] = None
+    # Estado de los enlaces externos según el verificador (app/links.py)
+    links: Optional[Dict[str, "LinkStatus"]] = None
+    hasBrokenLinks: Optional[bool] = None
+    # Convocatorias que esta probablemente duplica, según el índice de app/dedupe.py al crearla
+    possibleDuplicateOf: Optional[List[str]] = None
     
     # Validador que mapea campos en español a inglés (compatibilidad con datos viejos)
     @model_validator(mode='before')
@@ -168,4 +182,110 @@ class ConvocatoriaUpdate(BaseModel):
     internationalLink: Optional[str] = None
     
     class Config:
-        populate_by_name = True
\ No newline at end of file
+        populate_by_name = True
+
+
+# Filtros soportados por el listado de convocatorias
+class ConvocatoriaFilters(BaseModel):
+    q: Optional[str] = None
+    country: Optional[str] = None
+    language: Optional[str] = None
+    state: Optional[str] = None
+    agreement_type: Optional[str] = None
+    subscription_level: Optional[str] = None
+    valid_after: Optional[date] = None
+    expiring_before: Optional[date] = None
+    broken_links: Optional[bool] = None
+
+
+# Perfil de un estudiante para la recomendación de convocatorias
+class StudentProfile(BaseModel):
+    interests: List[str] = []
+    languages: List[str] = []
+    preferred_regions: List[str] = []
+    only_active: bool = True
+
+
+# Convocatoria recomendada con su puntaje de similitud (0 a 1)
+class Recommendation(BaseModel):
+    score: float
+    convocatoria: Convocatoria
+
+
+# Consulta de varias convocatorias por id en una sola petición
+class BatchGetRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=200)
+
+
+class BatchGetResponse(BaseModel):
+    items: List[Convocatoria]
+    missing: List[str] = []
+    invalid: List[str] = []
+
+
+# Resultado de una edición o un borrado masivo por filtros
+class BulkOperationResult(BaseModel):
+    matched: int
+    dryRun: bool = False
+
+
+# Conteos del catálogo para los tableros
+class ConvocatoriaStats(BaseModel):
+    total: int
+    byCountry: Dict[str, int]
+    byYear: Dict[str, int]
+    byType: Dict[str, int]
+    byState: Dict[str, int]
+    updatedAt: Optional[datetime] = None
+
+
+# Grupo de convocatorias casi duplicadas (mismo país, institución y Props parecidas)
+class DuplicateCluster(BaseModel):
+    size: int
+    country: Optional[str] = None
+    institutions: List[str]
+    ids: List[str]
+
+
+# Búsqueda guardada: los filtros del listado con un nombre, para recibir avisos
+class SavedSearchCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=100)
+    filters: ConvocatoriaFilters
+
+
+class SavedSearch(SavedSearchCreate):
+    id: PyObjectId = Field(default_factory=PyObjectId, validation_alias="_id")
+    createdAt: Optional[datetime] = None
+
+
+# Aviso de una convocatoria nueva o editada que cumple una búsqueda guardada
+class SavedSearchNotification(BaseModel):
+    savedSearchId: str
+    convocatoriaId: str
+    reason: str
+    status: str
+    createdAt: datetime
+
+
+# Tarea administrativa en segundo plano (app/jobs.py)
+class JobCreate(BaseModel):
+    kind: str = Field(..., description="reload, load, reindex, stats, dedupe o export")
+    params: Dict[str, Any] = Field(default_factory=dict)
+
+
+class JobProgress(BaseModel):
+    done: int
+    total: Optional[int] = None
+    message: Optional[str] = None
+
+
+class Job(JobCreate):
+    id: PyObjectId = Field(default_factory=PyObjectId, validation_alias="_id")
+    status: str
+    progress: Optional[JobProgress] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    createdBy: Optional[str] = None
+    createdAt: datetime
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
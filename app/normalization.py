@@ -0,0 +1,185 @@
+import calendar
+import re
+import unicodedata
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+# Subdocumento donde se guardan las versiones normalizadas de los campos filtrables.
+# Las consultas de igualdad y prefijo se hacen sobre estos campos para poder usar índices.
+NORM_PREFIX = "norm"
+
+# Campos de texto que se normalizan al escribir
+NORMALIZED_FIELDS = ("country", "institution", "state", "agreementType", "subscriptionLevel")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fold(value: Any) -> str:
+    """Normaliza un texto: sin tildes, en minúsculas y con espacios colapsados."""
+    if value is None:
+        return ""
+    text = str(value)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def normalized_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Calcula los valores normalizados de los campos presentes en `data`."""
+    norm = {field: fold(data[field]) for field in NORMALIZED_FIELDS if data.get(field) is not None}
+    if data.get("languages") is not None:
+        languages = data["languages"]
+        if isinstance(languages, str):
+            languages = [languages]
+        norm["languages"] = sorted({fold(lang) for lang in languages if fold(lang)})
+    return norm
+
+
+def with_normalized_fields(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Devuelve el documento con el subdocumento `norm` completo (para inserciones)."""
+    return {**document, NORM_PREFIX: normalized_fields(document)}
+
+
+def normalized_update(update_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Traduce un `$set` parcial a los `$set` equivalentes sobre `norm.<campo>`."""
+    return {f"{NORM_PREFIX}.{field}": value for field, value in normalized_fields(update_data).items()}
+
+
+# --- Idiomas ---
+
+# Vocabulario de idiomas con su forma canónica. Las entradas de varias palabras se
+# reconocen antes que sus palabras sueltas (p. ej. "Chino mandarín" antes que "Chino").
+LANGUAGES = [
+    "Alemán", "Árabe", "Búlgaro", "Catalán", "Checo", "Chino", "Chino mandarín", "Coreano",
+    "Danés", "Español", "Farsi", "Finés", "Francés", "Griego", "Hebreo", "Hindi", "Holandés",
+    "Húngaro", "Inglés", "Islandés", "Italiano", "Japonés", "Lengua de señas colombiana",
+    "Letón", "Mandarín", "Noruego", "Polaco", "Portugués", "Ruso", "Sueco", "Turco", "Valenciano",
+]
+LANGUAGE_ALIASES = {"hindu": "Hindi", "neerlandes": "Holandés", "persa": "Farsi", "espanol castellano": "Español"}
+LANGUAGE_VOCABULARY = {**{fold(name): name for name in LANGUAGES}, **LANGUAGE_ALIASES}
+_MAX_LANGUAGE_WORDS = max(len(key.split()) for key in LANGUAGE_VOCABULARY)
+_LANGUAGE_CONNECTORS = {"y", "e", "o"}
+_WORD = re.compile(r"\w+")
+
+
+def normalize_languages(value: Any) -> List[str]:
+    """
+    Convierte el campo `languages` (texto libre o lista) en una lista de idiomas canónicos,
+    sin duplicados y en el orden en que aparecen.
+    """
+    if value is None:
+        return []
+    parts = value if isinstance(value, list) else [value]
+    words = [word for part in parts for word in _WORD.findall(str(part))]
+    folded = [fold(word) for word in words]
+
+    result: List[str] = []
+    i = 0
+    while i < len(words):
+        for size in range(min(_MAX_LANGUAGE_WORDS, len(words) - i), 0, -1):
+            canonical = LANGUAGE_VOCABULARY.get(" ".join(folded[i:i + size]))
+            if canonical:
+                break
+        else:
+            size = 1
+            # Palabras fuera del vocabulario se conservan capitalizadas para no perder información
+            canonical = None if folded[i] in _LANGUAGE_CONNECTORS else words[i].capitalize()
+        if canonical and canonical not in result:
+            result.append(canonical)
+        i += size
+    return result
+
+
+# --- Vigencia ---
+
+_MONTHS = {
+    **{fold(name): number for number, name in enumerate(
+        ["January", "February", "March", "April", "May", "June", "July",
+         "August", "September", "October", "November", "December"], start=1)},
+    **{fold(name): number for number, name in enumerate(
+        ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio",
+         "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"], start=1)},
+}
+_MONTH_YEAR = re.compile(r"^([a-z]+)\s*-?\s*(\d{4})$")
+_YEAR = re.compile(r"^(\d{4})$")
+INDEFINITE_VALIDITY = {"indefinido", "indefinida", "indeterminado", "indeterminada"}
+
+
+def parse_validity(value: Any) -> Optional[date]:
+    """
+    Interpreta `validity` ("March - 2024", "January-2025", "2017") como la fecha en que
+    termina la vigencia (último día del mes o del año). Devuelve None si no es una fecha.
+    """
+    text = fold(value)
+    match = _MONTH_YEAR.match(text)
+    if match and match.group(1) in _MONTHS:
+        year, month = int(match.group(2)), _MONTHS[match.group(1)]
+        return date(year, month, calendar.monthrange(year, month)[1])
+    match = _YEAR.match(text)
+    if match:
+        return date(int(match.group(1)), 12, 31)
+    return None
+
+
+def is_indefinite_validity(value: Any) -> bool:
+    return fold(value) in INDEFINITE_VALIDITY
+
+
+def derive_state(valid_until: Optional[date], today: date, current: Any = None) -> str:
+    """Estado del convenio según su vigencia; si no hay fecha se normaliza el estado actual."""
+    if valid_until is not None:
+        return "Vigente" if valid_until >= today else "No Vigente"
+    folded = fold(current)
+    if folded == "vigente":
+        return "Vigente"
+    if folded == "no vigente":
+        return "No Vigente"
+    return str(current or "")
+
+
+# --- Instituciones ---
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def institution_key(value: Any) -> str:
+    """Clave para agrupar variantes de escritura de una institución (tildes, mayúsculas, puntuación)."""
+    return _NON_ALNUM.sub(" ", fold(value)).strip()
+
+
+# --- Campos derivados al escribir ---
+
+def as_datetime(value: date) -> datetime:
+    """MongoDB guarda fechas como datetime; la vigencia se representa a medianoche (UTC)."""
+    return datetime(value.year, value.month, value.day)
+
+
+def validity_fields(data: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Calcula `validUntil` a partir de `validity` y, si la vigencia es interpretable, el estado.
+    Devuelve un diccionario vacío si `data` no trae `validity`.
+    """
+    if "validity" not in data:
+        return {}
+    until = parse_validity(data["validity"])
+    fields: Dict[str, Any] = {"validUntil": as_datetime(until) if until else None}
+    if until is not None:
+        fields["state"] = derive_state(until, today or date.today())
+    elif is_indefinite_validity(data["validity"]):
+        fields["state"] = "Vigente"
+    return fields
+
+
+def prepare_document(document: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """Documento listo para insertar: vigencia interpretada, estado derivado y campos `norm`."""
+    return with_normalized_fields({**document, **validity_fields(document, today)})
+
+
+def prepare_update(update_data: Dict[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+    """`$set` listo para aplicar; un estado enviado explícitamente tiene prioridad sobre el derivado."""
+    derived = validity_fields(update_data, today)
+    if "state" in update_data:
+        derived.pop("state", None)
+    data = {**update_data, **derived}
+    return {**data, **normalized_update(data)}
@@ -0,0 +1,173 @@
+"""
+Pre-procesamiento por lotes del archivo crudo de la DRE (`DataConvenios.json`).
+
+Los registros se leen por bloques y cada bloque se procesa por columnas: cada
+transformación (idiomas, vigencia, institución) se calcula una sola vez por valor
+distinto de la columna y luego se reparte a las filas. Como los valores se repiten
+mucho (cientos de valores distintos para cientos de miles de filas), el costo depende
+de la cardinalidad y no del número de registros.
+
+El resultado es un NDJSON compacto que `app.loader` puede leer en streaming.
+"""
+import json
+import time
+from datetime import date
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .loader import iter_json_records
+from .normalization import (
+    derive_state,
+    institution_key,
+    is_indefinite_validity,
+    normalize_languages,
+    parse_validity,
+)
+
+BATCH_SIZE = 50_000
+
+# Columnas que se conservan en la salida, en este orden
+COLUMNS = (
+    "subscriptionYear", "country", "institution", "agreementType", "validity", "state",
+    "dreLink", "subscriptionLevel", "agreementLink", "languages", "Props", "internationalLink",
+)
+
+
+def to_columns(records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Convierte una lista de registros en un diccionario de columnas."""
+    columns = {}
+    for column in COLUMNS:
+        try:
+            # Columna completa (lo normal en el archivo de la DRE): se extrae sin bucle en Python
+            columns[column] = list(map(itemgetter(column), records))
+        except KeyError:
+            columns[column] = [record.get(column) for record in records]
+    return columns
+
+
+def map_unique(values: List[Any], fn: Callable[[Any], Any], key: Optional[Callable[[Any], Any]] = None) -> List[Any]:
+    """
+    Aplica `fn` una vez por valor distinto de la columna (en orden de aparición) y reparte
+    el resultado a las filas. `key` convierte valores no hashables (listas) en claves.
+    """
+    keys = values if key is None else list(map(key, values))
+    distinct = dict(zip(keys, values))
+    mapping = {k: fn(value) for k, value in distinct.items()}
+    return list(map(mapping.__getitem__, keys))
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+class InstitutionCanonicalizer:
+    """
+    Unifica las variantes de escritura de una institución (tildes, mayúsculas, puntuación)
+    usando la primera forma vista de cada clave; así el proceso es de una sola pasada.
+    `variants` cuenta las escrituras distintas que se reemplazaron.
+    """
+
+    def __init__(self):
+        self.canonical: Dict[str, str] = {}
+        self.variants = 0
+
+    def __call__(self, value: Any) -> Any:
+        if not value:
+            return value
+        key = institution_key(value)
+        canonical = self.canonical.setdefault(key, value)
+        if canonical != value:
+            self.variants += 1
+        return canonical
+
+
+def process_batch(
+    records: List[Dict[str, Any]],
+    today: date,
+    institutions: InstitutionCanonicalizer,
+) -> Tuple[Dict[str, List[Any]], int]:
+    """Normaliza un bloque de registros. Devuelve las columnas resultantes y los registros omitidos."""
+    columns = to_columns(records)
+
+    # Registros incompletos o malformados
+    skipped = 0
+    if not (all(columns["institution"]) and all(columns["country"])):
+        keep = [bool(i) and bool(c) for i, c in zip(columns["institution"], columns["country"])]
+        skipped = keep.count(False)
+        columns = {name: [v for v, k in zip(values, keep) if k] for name, values in columns.items()}
+
+    try:
+        # En el archivo de la DRE los idiomas son texto; solo las listas necesitan conversión
+        columns["languages"] = map_unique(columns["languages"], normalize_languages)
+    except TypeError:
+        columns["languages"] = map_unique(columns["languages"], normalize_languages, key=_hashable)
+    columns["institution"] = map_unique(columns["institution"], institutions)
+
+    valid_until = map_unique(columns["validity"], parse_validity)
+    indefinite = map_unique(columns["validity"], is_indefinite_validity)
+    columns["state"] = [
+        "Vigente" if endless else derive_state(until, today, state)
+        for until, endless, state in zip(valid_until, indefinite, columns["state"])
+    ]
+    columns["validUntil"] = map_unique(valid_until, lambda d: d.isoformat() if d else None)
+    return columns, skipped
+
+
+def encode_rows(columns: Dict[str, List[Any]], encode: Callable[[Any], str]) -> List[str]:
+    """
+    Serializa las filas a JSON por columnas: cada valor distinto se codifica una sola vez
+    y las líneas se arman concatenando los fragmentos ya codificados.
+
+    Cada fragmento lleva su coma delante (los nulos quedan vacíos), así que una fila es un
+    solo `join`. Las listas de idiomas salen de `map_unique` compartidas entre las filas con
+    el mismo valor, por eso se agrupan por identidad en lugar de convertirlas a tuplas.
+    """
+    encoded = [
+        map_unique(
+            values,
+            lambda v, prefix="," + encode(name) + ":": "" if v is None else prefix + encode(v),
+            key=id if name == "languages" else None,
+        )
+        for name, values in columns.items()
+    ]
+    return ["{" + "".join(row)[1:] + "}" for row in zip(*encoded)]
+
+
+def _batches(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def preprocess(
+    source: str,
+    target: str,
+    today: Optional[date] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, Any]:
+    """Procesa `source` (arreglo JSON o NDJSON) y escribe `target` en NDJSON."""
+    started = time.perf_counter()
+    today = today or date.today()
+    institutions = InstitutionCanonicalizer()
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), check_circular=False)
+    report = {"read": 0, "written": 0, "skipped": 0}
+
+    with open(target, "w", encoding="utf-8") as out:
+        for batch in _batches(iter_json_records(source), batch_size):
+            columns, skipped = process_batch(batch, today, institutions)
+            report["read"] += len(batch)
+            report["skipped"] += skipped
+            lines = encode_rows(columns, encoder.encode)
+            report["written"] += len(lines)
+            if lines:
+                out.write("\n".join(lines))
+                out.write("\n")
+
+    report["institutionVariants"] = institutions.variants
+    report["elapsed"] = round(time.perf_counter() - started, 3)
+    return report
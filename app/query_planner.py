@@ -0,0 +1,301 @@
+"""
+Planificador de consultas para el listado de convocatorias.
+
+Traduce los filtros del endpoint a consultas que MongoDB puede resolver con índices:
+- Los filtros de igualdad se comparan exactamente contra los campos normalizados (`norm.*`).
+- Las búsquedas por prefijo usan regex anclados y sensibles a mayúsculas sobre `norm.*`.
+- Toda entrada del usuario se escapa antes de llegar a un regex.
+- Los filtros de fechas se resuelven como rangos sobre `validUntil`.
+- `broken_links` compara el indicador `hasBrokenLinks` que escribe `app.links`.
+- Se elige un `hint` según la selectividad estimada de cada filtro.
+- Con `sort` se sugiere el índice que da ese orden (precedido, si lo hay, por campos
+  filtrados por igualdad), así que la página se lee en orden y no hay etapa SORT.
+
+Uso como script (requiere una base de datos con datos cargados):
+    python -m app.query_planner explain   # verifica que ninguna combinación haga COLLSCAN ni SORT
+    python -m app.query_planner backfill  # calcula `norm.*` en documentos existentes
+"""
+import asyncio
+import itertools
+import re
+import sys
+from datetime import date, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from .indexes import ensure_indexes, filter_indexes
+from .models import ConvocatoriaFilters
+from .normalization import NORM_PREFIX, as_datetime, fold, normalized_fields
+from .sorting import SORT_FIELDS, SORT_ORDERS, Sort, format_sort, resolve_sort
+
+# Filtros de igualdad: parámetro del endpoint -> campo normalizado
+EQUALITY_FILTERS = {
+    "country": f"{NORM_PREFIX}.country",
+    "language": f"{NORM_PREFIX}.languages",
+    "state": f"{NORM_PREFIX}.state",
+    "agreement_type": f"{NORM_PREFIX}.agreementType",
+}
+
+# Filtros por prefijo: parámetro del endpoint -> campo normalizado
+PREFIX_FILTERS = {
+    "subscription_level": f"{NORM_PREFIX}.subscriptionLevel",
+}
+
+# Filtros booleanos: parámetro del endpoint -> campo
+BOOLEAN_FILTERS = {
+    "broken_links": "hasBrokenLinks",
+}
+
+# Filtros por rango de fechas sobre `validUntil`: parámetro del endpoint -> operador
+RANGE_FILTERS = {
+    "valid_after": "$gte",
+    "expiring_before": "$lt",
+}
+VALID_UNTIL_FIELD = "validUntil"
+
+# Fracción del catálogo que devuelve un valor típico de cada campo.
+# Se usa mientras no haya estadísticas reales (ver `refresh_selectivity`).
+DEFAULT_SELECTIVITY = {
+    f"{NORM_PREFIX}.country": 0.05,
+    f"{NORM_PREFIX}.agreementType": 0.15,
+    f"{NORM_PREFIX}.languages": 0.2,
+    f"{NORM_PREFIX}.subscriptionLevel": 0.3,
+    f"{NORM_PREFIX}.state": 0.75,
+    "hasBrokenLinks": 0.5,
+}
+RANGE_SELECTIVITY = 0.3
+
+
+class QueryPlan(NamedTuple):
+    filter: Dict[str, Any]
+    hint: Optional[str] = None
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+# Estadísticas por valor: campo -> {valor normalizado: fracción del catálogo}
+_value_selectivity: Dict[str, Dict[str, float]] = {}
+
+
+def _estimate(field: str, value: Optional[str] = None) -> float:
+    if value is not None and value in _value_selectivity.get(field, {}):
+        return _value_selectivity[field][value]
+    if field == VALID_UNTIL_FIELD:
+        return RANGE_SELECTIVITY
+    return DEFAULT_SELECTIVITY.get(field, 1.0)
+
+
+def _index_candidates() -> List[Tuple[str, Tuple[str, ...]]]:
+    return [
+        (index.document["name"], tuple(index.document["key"].keys()))
+        for index in filter_indexes()
+    ]
+
+
+def _choose_hint(estimates: Dict[str, float]) -> Optional[str]:
+    """Elige el índice cuyo prefijo de campos filtrados deja menos documentos por revisar."""
+    best_name, best_cost = None, None
+    for name, keys in _index_candidates():
+        cost = 1.0
+        used = 0
+        for key in keys:
+            if key not in estimates:
+                break
+            cost *= estimates[key]
+            used += 1
+        if used and (best_cost is None or cost < best_cost):
+            best_name, best_cost = name, cost
+    return best_name
+
+
+def _choose_sort_hint(keys: List[Tuple[str, int]], equalities: Dict[str, Any]) -> Optional[str]:
+    """
+    Índice que termina exactamente en `keys` (o en su inverso) y cuyas claves anteriores
+    están todas fijadas por igualdad; entre varios, el que fija más campos.
+    """
+    orders = (keys, [(field, -direction) for field, direction in keys])
+    best_name, best_prefix = None, -1
+    for model in filter_indexes():
+        index = list(model.document["key"].items())
+        prefix = len(index) - len(keys)
+        if prefix < 0 or index[prefix:] not in orders:
+            continue
+        if all(field in equalities for field, _ in index[:prefix]) and prefix > best_prefix:
+            best_name, best_prefix = model.document["name"], prefix
+    return best_name
+
+
+def plan_query(filters: ConvocatoriaFilters, sort: Optional[Sort] = None) -> QueryPlan:
+    """
+    Construye la consulta y el índice sugerido para un conjunto de filtros.
+    `sort` es un orden ya resuelto (`sorting.resolve_sort`); con `q` el orden lo aplica
+    el repositorio en memoria y no forma parte del plan.
+    """
+    query: Dict[str, Any] = {}
+    estimates: Dict[str, float] = {}
+
+    for param, field in EQUALITY_FILTERS.items():
+        value = getattr(filters, param)
+        if value:
+            folded = fold(value)
+            query[field] = folded
+            estimates[field] = _estimate(field, folded)
+
+    for param, field in PREFIX_FILTERS.items():
+        value = getattr(filters, param)
+        if value:
+            folded = fold(value)
+            query[field] = {"$regex": f"^{re.escape(folded)}"}
+            estimates[field] = _estimate(field)
+
+    for param, field in BOOLEAN_FILTERS.items():
+        value = getattr(filters, param)
+        if value is not None:
+            query[field] = value
+            estimates[field] = _estimate(field, value)
+
+    date_range = {
+        operator: as_datetime(getattr(filters, param))
+        for param, operator in RANGE_FILTERS.items()
+        if getattr(filters, param)
+    }
+    if date_range:
+        query[VALID_UNTIL_FIELD] = date_range
+        estimates[VALID_UNTIL_FIELD] = _estimate(VALID_UNTIL_FIELD)
+
+    if filters.q:
+        # MongoDB no permite `hint` junto con `$text`: el índice de texto se elige solo
+        query["$text"] = {"$search": filters.q}
+        return QueryPlan(query)
+
+    if sort:
+        keys = [(SORT_FIELDS.get(name, name), direction) for name, direction in sort]
+        equalities = {field: value for field, value in query.items() if not isinstance(value, dict)}
+        # Sin índice para el orden (no debería ocurrir con un orden resuelto) MongoDB ordena en memoria
+        return QueryPlan(query, _choose_sort_hint(keys, equalities) or _choose_hint(estimates), keys)
+
+    return QueryPlan(query, _choose_hint(estimates))
+
+
+async def refresh_selectivity(collection) -> None:
+    """Actualiza las estimaciones de selectividad con la distribución real de valores."""
+    total = await collection.estimated_document_count()
+    if not total:
+        return
+    pipeline = [{
+        "$facet": {
+            field.replace(".", "_"): [
+                {"$unwind": f"${field}"} if field.endswith("languages") else {"$match": {}},
+                {"$sortByCount": f"${field}"},
+            ]
+            for field in DEFAULT_SELECTIVITY
+        }
+    }]
+    async for facets in collection.aggregate(pipeline):
+        for field in DEFAULT_SELECTIVITY:
+            buckets = facets.get(field.replace(".", "_"), [])
+            _value_selectivity[field] = {b["_id"]: b["count"] / total for b in buckets if b["_id"] is not None}
+
+
+async def backfill_normalized_fields(collection, batch_size: int = 500) -> int:
+    """Calcula `norm.*` para los documentos que aún no lo tienen."""
+    updated = 0
+    batch = []
+    async for doc in collection.find({NORM_PREFIX: {"$exists": False}}):
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {NORM_PREFIX: normalized_fields(doc)}}))
+        if len(batch) >= batch_size:
+            updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+
+def _winning_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        stages.append(node.get("stage"))
+        if "inputStage" in node:
+            stack.append(node["inputStage"])
+        stack.extend(node.get("inputStages", []))
+    return stages
+
+
+async def explain_filter_combinations(collection) -> Dict[str, List[str]]:
+    """Ejecuta `explain()` para cada combinación de filtros soportada y devuelve sus etapas."""
+    sample = await collection.find_one({NORM_PREFIX: {"$exists": True}})
+    if not sample:
+        raise RuntimeError("No hay documentos con campos normalizados para explicar las consultas")
+
+    values = {
+        "country": sample["country"],
+        "language": (sample.get("languages") or ["Español"])[0],
+        "state": sample["state"],
+        "agreement_type": sample["agreementType"],
+        "subscription_level": sample["subscriptionLevel"][:5],
+        "valid_after": date.today(),
+        "expiring_before": date.today() + timedelta(days=365),
+        "broken_links": True,
+    }
+    results = {}
+    params = list(values)
+    for size in range(1, len(params) + 1):
+        for combo in itertools.combinations(params, size):
+            plan = plan_query(ConvocatoriaFilters(**{param: values[param] for param in combo}))
+            cursor = collection.find(plan.filter)
+            if plan.hint:
+                cursor = cursor.hint(plan.hint)
+            explanation = await cursor.explain()
+            results["+".join(combo)] = _winning_stages(explanation["queryPlanner"]["winningPlan"])
+    return results
+
+
+async def explain_sort_orders(collection) -> Dict[str, List[str]]:
+    """Como `explain_filter_combinations`, para cada orden soportado (y su inverso) con y sin filtros."""
+    sample = await collection.find_one({NORM_PREFIX: {"$exists": True}})
+    if not sample:
+        raise RuntimeError("No hay documentos con campos normalizados para explicar las consultas")
+
+    filter_sets = {"": {}, "state": {"state": sample["state"]}, "country": {"country": sample["country"]}}
+    results = {}
+    for order in SORT_ORDERS:
+        for requested in {order[:size] for size in range(1, len(order) + 1)} | {order}:
+            for direction in (1, -1):
+                requested_sort = tuple((name, d * direction) for name, d in requested)
+                for label, params in filter_sets.items():
+                    filters = ConvocatoriaFilters(**params)
+                    plan = plan_query(filters, resolve_sort(requested_sort, text=False))
+                    cursor = collection.find(plan.filter).sort(plan.sort).limit(20)
+                    if plan.hint:
+                        cursor = cursor.hint(plan.hint)
+                    explanation = await cursor.explain()
+                    results[f"sort={format_sort(requested_sort)}" + (f"+{label}" if label else "")] = _winning_stages(
+                        explanation["queryPlanner"]["winningPlan"])
+    return results
+
+
+async def _main(command: str) -> int:
+    from .database import get_active_convocatoria_collection
+
+    collection = await get_active_convocatoria_collection()
+    if command == "backfill":
+        updated = await backfill_normalized_fields(collection)
+        await ensure_indexes(collection)
+        print(f"✅ {updated} documentos actualizados con campos normalizados")
+        return 0
+
+    await refresh_selectivity(collection)
+    failures = 0
+    explained = {**await explain_filter_combinations(collection), **await explain_sort_orders(collection)}
+    for combo, stages in explained.items():
+        ok = "COLLSCAN" not in stages and "SORT" not in stages
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {combo}: {' <- '.join(stages)}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "explain"
+    sys.exit(asyncio.run(_main(command)))
@@ -0,0 +1,272 @@
+"""
+Recomendación de convocatorias por contenido.
+
+Cada convocatoria se describe con términos: cada línea de sus `Props` completa y sus
+palabras sueltas, idiomas, país y región. El catálogo se representa como una matriz dispersa TF-IDF (filas normalizadas)
+y el perfil del estudiante como un vector sobre el mismo vocabulario, así que puntuar
+todo el catálogo es un único producto matriz-vector.
+
+La matriz se construye completa al arrancar y en cada cambio de versión del catálogo.
+Entre reconstrucciones, las escrituras se aplican de forma incremental: la fila anterior
+se marca como inactiva y la nueva se agrega al final (los términos nuevos se incorporan
+en la siguiente reconstrucción).
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .lazy import lazy_import
+from .normalization import fold
+
+# numpy y scipy se importan en el primer cálculo (normalmente en segundo plano)
+np = lazy_import("numpy")
+sparse = lazy_import("scipy.sparse")
+
+# Palabras de las `Props` que no aportan al perfil
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "e", "el", "en", "la", "las", "lo", "los", "o", "para",
+    "por", "que", "se", "su", "sus", "un", "una", "y", "entre", "como", "sobre", "traves",
+}
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Región de cada país (nombres normalizados con `fold`)
+COUNTRY_REGIONS = {
+    **dict.fromkeys([
+        "alemania", "austria", "belgica", "bulgaria", "dinamarca", "espana", "finlandia", "francia",
+        "grecia", "hungria", "irlanda", "islandia", "italia", "letonia", "noruega", "paises bajos",
+        "polonia", "portugal", "reino unido", "republica checa", "rusia", "suecia", "suiza", "turquia",
+    ], "europa"),
+    **dict.fromkeys([
+        "argentina", "brasil", "chile", "colombia", "costa rica", "ecuador", "guayana francesa",
+        "honduras", "mexico", "nicaragua", "paraguay", "peru", "puerto rico", "venezuela",
+    ], "america latina"),
+    **dict.fromkeys(["canada", "estados unidos"], "norteamerica"),
+    **dict.fromkeys(["china", "corea del sur", "india", "indonesia", "iran", "israel", "japon"], "asia"),
+    **dict.fromkeys(["kenia", "republica democratica del congo"], "africa"),
+    **dict.fromkeys(["australia"], "oceania"),
+}
+
+# Cuántas escrituras incrementales se toleran (fracción del catálogo) antes de reconstruir
+REBUILD_THRESHOLD = 0.1
+
+
+# Las `Props` se repiten mucho entre convocatorias: se tokeniza una vez por texto distinto
+@lru_cache(maxsize=65536)
+def _cached_text_terms(text: str) -> Tuple[str, ...]:
+    terms = []
+    for line in map(fold, text.splitlines()):
+        if line:
+            terms.append(f"prop:{line}")
+            terms += [word for word in _WORD.findall(line) if len(word) > 2 and word not in STOPWORDS]
+    return tuple(terms)
+
+
+def text_terms(text: Any) -> List[str]:
+    """Cada línea del texto como término `prop:` más sus palabras significativas."""
+    return list(_cached_text_terms(str(text or "")))
+
+
+def document_terms(document: Dict[str, Any], include_type: bool = False) -> List[str]:
+    """Términos que describen una convocatoria."""
+    terms = text_terms(document.get("Props") or document.get("properties"))
+    terms += [f"lang:{fold(lang)}" for lang in document.get("languages") or []]
+    country = fold(document.get("country"))
+    if country:
+        terms.append(f"country:{country}")
+        if country in COUNTRY_REGIONS:
+            terms.append(f"region:{COUNTRY_REGIONS[country]}")
+    if include_type and document.get("agreementType"):
+        terms.append(f"type:{fold(document['agreementType'])}")
+    return terms
+
+
+def profile_terms(interests: Iterable[str], languages: Iterable[str], regions: Iterable[str]) -> List[str]:
+    """Términos del perfil de un estudiante. Las regiones aceptan también nombres de países."""
+    terms = [term for interest in interests for term in text_terms(interest)]
+    terms += [f"lang:{fold(lang)}" for lang in languages]
+    for region in regions:
+        folded = fold(region)
+        if folded in COUNTRY_REGIONS:
+            terms.append(f"country:{folded}")
+        else:
+            terms.append(f"region:{folded}")
+    return terms
+
+
+def tfidf_matrix(
+    term_lists: List[List[str]],
+    vocabulary: Optional[Dict[str, int]] = None,
+    idf: Optional[np.ndarray] = None,
+) -> Tuple[sparse.csr_matrix, Dict[str, int], np.ndarray]:
+    """
+    Construye la matriz TF-IDF (filas con norma L2 = 1).
+    Si se pasa `vocabulary`/`idf` se reutilizan y se ignoran los términos desconocidos.
+    """
+    build = vocabulary is None
+    vocabulary = {} if build else vocabulary
+    indptr, indices = [0], []
+    for terms in term_lists:
+        for term in terms:
+            column = vocabulary.setdefault(term, len(vocabulary)) if build else vocabulary.get(term)
+            if column is not None:
+                indices.append(column)
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=np.float32)
+    matrix = sparse.csr_matrix(
+        (data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(term_lists), len(vocabulary)),
+    )
+    matrix.sum_duplicates()  # frecuencia de cada término en el documento
+
+    if idf is None:
+        df = np.bincount(matrix.indices, minlength=len(vocabulary))
+        idf = (np.log((1 + matrix.shape[0]) / (1 + df)) + 1).astype(np.float32)
+
+    matrix = matrix.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+    return matrix, vocabulary, idf
+
+
+class Recommender:
+    """
+    Índice TF-IDF en memoria sobre el catálogo activo.
+
+    Solo se modifica desde el event loop; la parte costosa de una reconstrucción
+    (`compute`) corre en un hilo y el resultado se instala de una vez con `install`.
+    """
+
+    def __init__(self):
+        # Los arreglos se crean con el primer cálculo (`install`); hasta entonces no hay filas
+        self.vocabulary: Dict[str, int] = {}
+        self.idf: Optional[np.ndarray] = None
+        self.matrix: Optional[sparse.csr_matrix] = None
+        self.ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.alive: Optional[np.ndarray] = None
+        self.active: Optional[np.ndarray] = None
+        self.ready = False
+        self.rebuilding = False
+        self._pending: List[Tuple[str, sparse.csr_matrix, bool]] = []
+        self._replay: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = []
+        self._writes_since_build = 0
+
+    @staticmethod
+    def _is_active(document: Dict[str, Any]) -> bool:
+        return fold(document.get("state")) == "vigente"
+
+    @classmethod
+    def compute(cls, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Matriz y metadatos de una reconstrucción completa (CPU, sin tocar el estado)."""
+        matrix, vocabulary, idf = tfidf_matrix([document_terms(doc) for doc in documents])
+        ids = [str(doc["_id"]) for doc in documents]
+        return {
+            "vocabulary": vocabulary,
+            "idf": idf,
+            "matrix": matrix,
+            "ids": ids,
+            "row_of": {doc_id: row for row, doc_id in enumerate(ids)},
+            "alive": np.ones(len(ids), dtype=bool),
+            "active": np.array([cls._is_active(doc) for doc in documents], dtype=bool),
+        }
+
+    def install(self, state: Dict[str, Any]) -> None:
+        """Reemplaza el índice y vuelve a aplicar las escrituras ocurridas durante la reconstrucción."""
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._pending = []
+        self._writes_since_build = 0
+        self.ready = True
+        self.rebuilding = False
+        replay, self._replay = self._replay, []
+        for before, after in replay:
+            self.apply_change(before, after)
+
+    def build(self, documents: List[Dict[str, Any]]) -> None:
+        self.install(self.compute(documents))
+
+    def apply_change(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        """Aplica una escritura del catálogo: inserción (`before` None), edición o borrado (`after` None)."""
+        if self.rebuilding:
+            self._replay.append((before, after))
+        if after is not None:
+            self.upsert(after)
+        elif before is not None:
+            self.remove(str(before["_id"]))
+
+    def upsert(self, document: Dict[str, Any]) -> None:
+        doc_id = str(document["_id"])
+        self.remove(doc_id)
+        row, _, _ = tfidf_matrix([document_terms(document)], self.vocabulary, self.idf)
+        self._pending.append((doc_id, row, self._is_active(document)))
+        self._writes_since_build += 1
+
+    def remove(self, doc_id: str) -> None:
+        row = self.row_of.pop(doc_id, None)
+        if row is not None:
+            self.alive[row] = False
+        self._pending = [entry for entry in self._pending if entry[0] != doc_id]
+
+    def needs_rebuild(self) -> bool:
+        return not self.rebuilding and self._writes_since_build > max(1, REBUILD_THRESHOLD * len(self.row_of))
+
+    def _compact(self) -> None:
+        """Agrega las filas pendientes a la matriz (un solo `vstack`)."""
+        if not self._pending:
+            return
+        start = len(self.ids)
+        self.matrix = sparse.vstack([self.matrix] + [row for _, row, _ in self._pending]).tocsr()
+        for offset, (doc_id, _, _) in enumerate(self._pending):
+            self.ids.append(doc_id)
+            self.row_of[doc_id] = start + offset
+        self.alive = np.concatenate([self.alive, np.ones(len(self._pending), dtype=bool)])
+        self.active = np.concatenate([self.active, np.array([a for _, _, a in self._pending], dtype=bool)])
+        self._pending = []
+
+    def recommend(self, terms: List[str], k: int, only_active: bool = True) -> List[Tuple[str, float]]:
+        """Devuelve hasta `k` pares `(id, puntaje)` ordenados por puntaje descendente."""
+        self._compact()
+        query = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term in terms:
+            column = self.vocabulary.get(term)
+            if column is not None:
+                query[column] += self.idf[column]
+        norm = float(np.linalg.norm(query))
+        if norm == 0 or not self.ids:
+            return []
+
+        # Puntaje de todo el catálogo: similitud coseno en un único producto matriz-vector
+        scores = self.matrix.dot(query / norm)
+        mask = self.alive & self.active if only_active else self.alive
+        scores = np.where(mask & (scores > 0), scores, -np.inf)
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+
+recommender = Recommender()
+
+# Solo se leen los campos que usa el recomendador
+PROJECTION = {"Props": 1, "languages": 1, "country": 1, "state": 1, "agreementType": 1}
+
+
+async def rebuild(repository, index: Recommender = recommender) -> None:
+    """Lee el catálogo y reconstruye el índice; el cálculo corre en un hilo para no bloquear el event loop."""
+    index.rebuilding = True
+    try:
+        documents = await repository.scan(PROJECTION)
+        state = await asyncio.to_thread(index.compute, documents)
+    except Exception:
+        index.rebuilding = False
+        index._replay = []
+        raise
+    index.install(state)
+    print(f"🧭 Recomendador listo: {len(state['ids'])} convocatorias, {len(state['vocabulary'])} términos")
@@ -0,0 +1,253 @@
+"""
+Acceso al catálogo de convocatorias detrás de una interfaz común.
+
+Las rutas y las cachés en memoria no usan Motor directamente sino un repositorio:
+
+- `MongoRepository`: la implementación de siempre sobre la versión activa del catálogo
+  (planificador de consultas, índices y estadísticas materializadas).
+- `SqliteRepository` (`app/sqlite_repository.py`): motor embebido en un archivo local con
+  búsqueda de texto FTS5, para instalaciones pequeñas y pruebas sin `mongod`.
+
+Se elige con `STORAGE_BACKEND=mongo|sqlite`. Las dos implementaciones cumplen el mismo
+contrato (`python test_repository.py`). Las funciones que dependen de MongoDB (recarga
+blue/green, vencimientos, verificación de enlaces, búsquedas guardadas) solo se activan
+con el backend `mongo`.
+"""
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from . import stats
+from .models import ConvocatoriaFilters
+from .query_planner import plan_query
+from .sorting import RELEVANCE, SORT_FIELDS, TOP_K_BATCH_SIZE, Sort, sort_key, top_k
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "convocatorias.db")
+
+Document = Dict[str, Any]
+
+
+class ConvocatoriaRepository(Protocol):
+    backend: str
+
+    @property
+    def name(self) -> str:
+        """Nombre de la versión del catálogo que se está sirviendo (para claves de caché)."""
+
+    async def prepare(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def get(self, doc_id: str) -> Optional[Document]: ...
+
+    async def get_many(self, ids: Iterable[str]) -> Dict[str, Document]:
+        """Documentos por id (texto); los inexistentes no aparecen."""
+
+    async def list(self, filters: ConvocatoriaFilters, skip: int, limit: int, sort: Optional[Sort] = None) -> List[Document]:
+        """`sort` es un orden resuelto (`sorting.resolve_sort`); sin él, el orden no está definido."""
+
+    def iterate(self, filters: ConvocatoriaFilters, skip: int, limit: int, batch_size: int,
+                sort: Optional[Sort] = None) -> AsyncIterator[Document]:
+        """Como `list`, pero leyendo de a `batch_size` documentos (para el streaming)."""
+
+    async def scan(self, projection: Dict[str, int]) -> List[Document]:
+        """Todo el catálogo con los campos de `projection` (para reconstruir las cachés)."""
+
+    async def count(self, filters: ConvocatoriaFilters) -> int: ...
+
+    async def insert(self, document: Document) -> Document: ...
+
+    async def update(self, doc_id: str, changes: Dict[str, Any]) -> Optional[Tuple[Document, Document]]:
+        """Aplica un `$set` (admite rutas `a.b`) y devuelve `(antes, después)`, o None si no existe."""
+
+    async def update_many(self, filters: ConvocatoriaFilters, changes: Dict[str, Any]) -> int:
+        """Aplica un `$set` a todas las convocatorias de los filtros; devuelve cuántas coincidieron."""
+
+    async def delete(self, doc_id: str) -> Optional[Document]: ...
+
+    async def delete_many(self, filters: ConvocatoriaFilters) -> int: ...
+
+    async def stats(self) -> Dict[str, Any]:
+        """Conteos por país, año, tipo y estado (mismo formato que `stats.read`)."""
+
+
+def _object_id(doc_id: str) -> Any:
+    return ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+
+
+# Campo proyectado con el puntaje de `$text` para ordenar por relevancia
+_SCORE = "_score"
+
+
+def _sort_value(document: Document, name: str) -> Any:
+    if name == RELEVANCE:
+        # Mayor puntaje primero en el orden ascendente
+        return -document[_SCORE]
+    value: Any = document
+    for part in SORT_FIELDS.get(name, name).split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+class MongoRepository:
+    """Catálogo en MongoDB; por defecto sobre la versión activa (`catalog`)."""
+
+    backend = "mongo"
+
+    def __init__(self, get_collection: Optional[Callable[[], Any]] = None):
+        if get_collection is None:
+            from .database import get_convocatoria_collection as get_collection
+        self._get_collection = get_collection
+
+    @property
+    def collection(self):
+        # Se resuelve en cada uso: la versión activa cambia con las recargas blue/green
+        return self._get_collection()
+
+    @property
+    def name(self) -> str:
+        return self.collection.name
+
+    async def prepare(self) -> None:
+        # Los índices y las estadísticas de selectividad los prepara el arranque de la API
+        return None
+
+    async def close(self) -> None:
+        return None
+
+    async def get(self, doc_id: str) -> Optional[Document]:
+        return await self.collection.find_one({"_id": _object_id(doc_id)})
+
+    async def get_many(self, ids: Iterable[str]) -> Dict[str, Document]:
+        """Trae varias convocatorias con un solo `$in` y las indexa por id (texto)."""
+        keys = [_object_id(doc_id) for doc_id in ids]
+        if not keys:
+            return {}
+        return {str(doc["_id"]): doc async for doc in self.collection.find({"_id": {"$in": keys}})}
+
+    def _cursor(self, filters: ConvocatoriaFilters, skip: int, limit: int, sort: Optional[Sort] = None):
+        # El planificador escapa la entrada y genera una consulta que usa índices
+        # (con `sort`, el índice que ya tiene ese orden)
+        plan = plan_query(filters, sort)
+        cursor = self.collection.find(plan.filter)
+        if plan.sort:
+            cursor = cursor.sort(plan.sort)
+        cursor = cursor.skip(skip).limit(limit)
+        if plan.hint:
+            cursor = cursor.hint(plan.hint)
+        return cursor
+
+    async def _ranked_ids(self, filters: ConvocatoriaFilters, sort: Sort, skip: int, limit: int) -> List[str]:
+        """
+        Búsqueda de texto ordenada: el índice de texto no da el orden, así que se leen solo las
+        claves de orden de las coincidencias y se conservan las `skip + limit` primeras.
+        """
+        projection: Dict[str, Any] = {SORT_FIELDS[name]: 1 for name, _ in sort if name in SORT_FIELDS}
+        if any(name == RELEVANCE for name, _ in sort):
+            projection[_SCORE] = {"$meta": "textScore"}
+        rows = self.collection.find(plan_query(filters).filter, projection).batch_size(TOP_K_BATCH_SIZE)
+        ranked = await top_k(rows, skip + limit, sort_key(sort, _sort_value))
+        return [str(row["_id"]) for row in ranked[skip:]]
+
+    async def list(self, filters: ConvocatoriaFilters, skip: int, limit: int, sort: Optional[Sort] = None) -> List[Document]:
+        if sort and filters.q:
+            ids = await self._ranked_ids(filters, sort, skip, limit)
+            documents = await self.get_many(ids)
+            return [documents[doc_id] for doc_id in ids if doc_id in documents]
+        return await self._cursor(filters, skip, limit, sort).to_list(length=limit)
+
+    async def _iterate_ranked(self, filters: ConvocatoriaFilters, skip: int, limit: int, batch_size: int,
+                              sort: Sort) -> AsyncIterator[Document]:
+        ids = await self._ranked_ids(filters, sort, skip, limit)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            documents = await self.get_many(batch)
+            for doc_id in batch:
+                if doc_id in documents:
+                    yield documents[doc_id]
+
+    def iterate(self, filters: ConvocatoriaFilters, skip: int, limit: int, batch_size: int,
+                sort: Optional[Sort] = None) -> AsyncIterator[Document]:
+        if sort and filters.q:
+            return self._iterate_ranked(filters, skip, limit, batch_size, sort)
+        return self._cursor(filters, skip, limit, sort).batch_size(batch_size)
+
+    async def scan(self, projection: Dict[str, int]) -> List[Document]:
+        return await self.collection.find({}, projection).to_list(length=None)
+
+    async def count(self, filters: ConvocatoriaFilters) -> int:
+        plan = plan_query(filters)
+        return await self.collection.count_documents(plan.filter, **({"hint": plan.hint} if plan.hint else {}))
+
+    async def insert(self, document: Document) -> Document:
+        collection = self.collection
+        result = await collection.insert_one(document)
+        created = await collection.find_one({"_id": result.inserted_id})
+        await stats.apply_change(collection, None, created)
+        return created
+
+    async def update(self, doc_id: str, changes: Dict[str, Any]) -> Optional[Tuple[Document, Document]]:
+        collection = self.collection
+        previous = await collection.find_one_and_update(
+            {"_id": _object_id(doc_id)}, {"$set": changes}, return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            return None
+        updated = await collection.find_one({"_id": previous["_id"]})
+        await stats.apply_change(collection, previous, updated)
+        return previous, updated
+
+    async def update_many(self, filters: ConvocatoriaFilters, changes: Dict[str, Any]) -> int:
+        # Un `update_many` y un solo `$inc` de estadísticas, a partir de los grupos afectados
+        collection, plan = self.collection, plan_query(filters)
+        groups = await stats.matched_groups(collection, plan.filter)
+        if not groups:
+            return 0
+        result = await collection.update_many(plan.filter, {"$set": changes}, hint=plan.hint)
+        await stats.apply_counts(collection, stats.bulk_delta(groups, changes))
+        return result.matched_count
+
+    async def delete(self, doc_id: str) -> Optional[Document]:
+        collection = self.collection
+        deleted = await collection.find_one_and_delete({"_id": _object_id(doc_id)})
+        if deleted is not None:
+            await stats.apply_change(collection, deleted, None)
+        return deleted
+
+    async def delete_many(self, filters: ConvocatoriaFilters) -> int:
+        collection, plan = self.collection, plan_query(filters)
+        groups = await stats.matched_groups(collection, plan.filter)
+        if not groups:
+            return 0
+        result = await collection.delete_many(plan.filter, hint=plan.hint)
+        await stats.apply_counts(collection, stats.bulk_delta(groups, None))
+        return result.deleted_count
+
+    async def stats(self) -> Dict[str, Any]:
+        return await stats.read(self.collection)
+
+
+_repository: Optional[ConvocatoriaRepository] = None
+
+
+def set_repository(repository: ConvocatoriaRepository) -> None:
+    global _repository
+    _repository = repository
+
+
+def get_repository() -> ConvocatoriaRepository:
+    """Repositorio configurado con `STORAGE_BACKEND` (se crea en el primer uso)."""
+    global _repository
+    if _repository is None:
+        if STORAGE_BACKEND == "sqlite":
+            from .sqlite_repository import SqliteRepository
+
+            _repository = SqliteRepository(SQLITE_PATH)
+        elif STORAGE_BACKEND == "mongo":
+            _repository = MongoRepository()
+        else:
+            raise ValueError(f"STORAGE_BACKEND desconocido: {STORAGE_BACKEND} (use mongo o sqlite)")
+    return _repository
@@ -102,12 +102,31 @@
 
 #     return
 
-from fastapi import APIRouter, HTTPException, Query, Body, status, Depends
+from fastapi import APIRouter, HTTPException, Query, Body, status, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import List, Optional
+from datetime import date
 from bson import ObjectId
+from pydantic import TypeAdapter
 
-from ..models import Convocatoria, ConvocatoriaCreate, ConvocatoriaUpdate
-from ..database import get_convocatoria_collection
+from .. import audit, catalog, saved_searches
+from ..models import (
+    Convocatoria, ConvocatoriaCreate, ConvocatoriaUpdate, ConvocatoriaFilters,
+    StudentProfile, Recommendation, BatchGetRequest, BatchGetResponse, ConvocatoriaStats, DuplicateCluster,
+    BulkOperationResult,
+)
+from ..database import get_database
+from ..repository import STORAGE_BACKEND, get_repository
+from ..dedupe import index as duplicate_index
+from ..normalization import prepare_document, prepare_update
+from ..recommender import profile_terms, recommender
+from ..similarity import NEIGHBOURS, table as neighbour_table
+from ..sorting import TEXT_SORT_MAX_RESULTS, format_sort, parse_sort, resolve_sort
+from ..singleflight import reads
+from ..admission import COSTS, admit, hold_slot, list_cost, release_slot
+from ..circuit import DB_ERRORS, mark_stale, mongo_breaker, with_snapshot
+from ..streaming import MAX_PAGE_SIZE, STREAM_BATCH_SIZE, STREAM_MAX_LIMIT, prefetch, stream_json_array
 # ¡NUEVO! Importamos nuestras dependencias de seguridad
 from ..security import get_current_user, require_admin_role, require_admin_or_professional_role, TokenData
 
@@ -116,65 +135,295 @@ router = APIRouter(
     tags=["Convocatorias"]
 )
 
-collection = get_convocatoria_collection()
+
+def convocatoria_filters(
+    q: Optional[str] = Query(None, min_length=3, description="Búsqueda por texto..."),
+    country: Optional[str] = Query(None, description="Filtrar por país (exacto, sin distinguir mayúsculas ni tildes)"),
+    language: Optional[str] = Query(None, description="Filtrar por idioma (exacto, debe estar en la lista de idiomas)"),
+    state: Optional[str] = Query(None, description="Filtrar por estado (Vigente/No Vigente)"),
+    agreement_type: Optional[str] = Query(None, description="Filtrar por tipo de convenio"),
+    subscription_level: Optional[str] = Query(None, description="Filtrar por nivel de suscripción (prefijo)"),
+    valid_after: Optional[date] = Query(None, description="Solo convenios vigentes hasta esta fecha o después"),
+    expiring_before: Optional[date] = Query(None, description="Solo convenios que vencen antes de esta fecha"),
+    broken_links: Optional[bool] = Query(None, description="Filtrar por convenios con (true) o sin (false) enlaces rotos"),
+) -> ConvocatoriaFilters:
+    """Agrupa los filtros del listado en un solo modelo."""
+    return ConvocatoriaFilters(
+        q=q,
+        country=country,
+        language=language,
+        state=state,
+        agreement_type=agreement_type,
+        subscription_level=subscription_level,
+        valid_after=valid_after,
+        expiring_before=expiring_before,
+        broken_links=broken_links,
+    )
+
+
+# Las lecturas idénticas concurrentes comparten una consulta y una serialización:
+# el resultado se valida y se convierte a JSON una vez y se responde con esos bytes
+_LIST_ADAPTER = TypeAdapter(List[Convocatoria])
+_ITEM_ADAPTER = TypeAdapter(Convocatoria)
+
+
+def json_response(content: bytes, age: Optional[float] = None) -> Response:
+    """Respuesta JSON; con `age` se marca como copia desactualizada (base no disponible)."""
+    return mark_stale(Response(content=content, media_type="application/json"), age)
+
+def _catalog_reloading() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="El catálogo se está recargando; intente de nuevo en unos minutos",
+        headers={"Retry-After": "60"},
+    )
+
+async def catalog_writable():
+    """
+    Rechaza las escrituras mientras se construye una versión nueva del catálogo (se perderían al
+    activarla). Con MongoDB la escritura toma un permiso en el puntero durante toda la petición.
+    """
+    if catalog.writes_blocked():
+        raise _catalog_reloading()
+    if STORAGE_BACKEND != "mongo":
+        yield
+        return
+    try:
+        async with catalog.write_lease(get_database()):
+            yield
+    except catalog.WritesBlocked:
+        raise _catalog_reloading()
+
+def _bulk_database():
+    # Con MongoDB la operación masiva se registra en el puntero para que los demás procesos reconstruyan sus cachés
+    return get_database() if STORAGE_BACKEND == "mongo" else None
 
 # --- PROTECCIÓN DE ENDPOINTS ---
 
 # POST protegido para administradores y profesionales
-@router.post("/", response_model=Convocatoria, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=Convocatoria, status_code=status.HTTP_201_CREATED, dependencies=[Depends(admit()), Depends(catalog_writable)])
 async def create_convocatoria(
     convocatoria: ConvocatoriaCreate = Body(...),
     current_user: TokenData = Depends(require_admin_or_professional_role) # <-- Permite admin y profesional
 ):
-    convocatoria_dict = convocatoria.dict(by_alias=True)
-    result = await collection.insert_one(convocatoria_dict)
-    new_convocatoria = await collection.find_one({"_id": result.inserted_id})
+    convocatoria_dict = prepare_document(convocatoria.dict(by_alias=True))
+    # Se crea igual, pero queda marcada para que un administrador la revise
+    if duplicate_index.ready:
+        duplicates = duplicate_index.find(convocatoria_dict)
+        if duplicates:
+            convocatoria_dict["possibleDuplicateOf"] = [doc_id for doc_id, _ in duplicates]
+    new_convocatoria = await get_repository().insert(convocatoria_dict)
+    await catalog.publish_change(None, new_convocatoria)
+    await audit.record(current_user, "create", after=new_convocatoria)
     return new_convocatoria
 
+def _require_filters(filters: ConvocatoriaFilters) -> None:
+    # Sin filtros la operación alcanzaría todo el catálogo: se exige al menos uno
+    if not filters.model_dump(exclude_none=True):
+        raise HTTPException(status_code=400, detail="Indique al menos un filtro para la operación masiva")
+
+
+def _update_data(convocatoria_update: ConvocatoriaUpdate) -> dict:
+    update_data = {k: v for k, v in convocatoria_update.dict(by_alias=True).items() if v is not None}
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No se enviaron datos para actualizar")
+    return prepare_update(update_data)
+
 # GET SIN PROTECCIÓN TEMPORAL - SOLO PARA PRUEBAS
-@router.get("/", response_model=List[Convocatoria])
+@router.get("/", response_model=List[Convocatoria], dependencies=[Depends(admit(list_cost))])
 async def get_convocatorias(
-    # ... (todos los parámetros de query como antes)
-    q: Optional[str] = Query(None, min_length=3, description="Búsqueda por texto..."),
-    country: Optional[str] = Query(None, description="Filtrar por país..."),
-    language: Optional[str] = Query(None, description="Filtrar por idioma..."),
-    state: Optional[str] = Query(None, description="Filtrar por estado..."),
-    agreement_type: Optional[str] = Query(None, description="Filtrar por tipo de convenio"),
-    subscription_level: Optional[str] = Query(None, description="Filtrar por nivel de suscripción"),
-    limit: int = Query(20, gt=0, le=200),
+    request: Request,
+    filters: ConvocatoriaFilters = Depends(convocatoria_filters),
+    limit: int = Query(20, gt=0, le=STREAM_MAX_LIMIT, description=f"Hasta {MAX_PAGE_SIZE}; más solo con stream=true"),
     skip: int = Query(0, ge=0),
+    stream: bool = Query(False, description="Enviar la página por lotes a medida que llega de la base"),
+    sort: Optional[str] = Query(None, description="Orden, p. ej. institution,-subscriptionYear,country (relevance solo con q)"),
     # AUTENTICACIÓN DESACTIVADA TEMPORALMENTE PARA PRUEBAS
     # current_user: TokenData = Depends(get_current_user) # <-- Dependencia comentada
 ):
-    query = {}
-    # ... (la lógica de construcción de la query no cambia)
-    if q: query["$text"] = {"$search": q}
-    if country: query["country"] = {"$regex": f"^{country}$", "$options": "i"}
-    if language: query["languages"] = {"$regex": language, "$options": "i"}
-    if state: query["state"] = {"$regex": f"^{state}$", "$options": "i"}
-    if agreement_type: query["agreementType"] = {"$regex": f"^{agreement_type}$", "$options": "i"}
-    if subscription_level: query["subscriptionLevel"] = {"$regex": subscription_level, "$options": "i"}
-    
-    cursor = collection.find(query).skip(skip).limit(limit)
-    results = await cursor.to_list(length=limit)
-    return results
+    repository = get_repository()
+    if limit > MAX_PAGE_SIZE and not stream:
+        raise HTTPException(status_code=400, detail=f"Para más de {MAX_PAGE_SIZE} resultados use stream=true")
+    try:
+        order = resolve_sort(parse_sort(sort), text=bool(filters.q))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Una búsqueda de texto ordenada guarda `skip + limit` claves en memoria
+    if order and filters.q and skip + limit > TEXT_SORT_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"Una búsqueda de texto ordenada admite hasta {TEXT_SORT_MAX_RESULTS} resultados (skip + limit)")
+
+    if stream:
+        # Sin copia ni agrupación: cada petición recorre su propio cursor. El primer lote se
+        # pide antes de responder para que una falla de la base sea un 503 y no un cuerpo cortado
+        cursor = repository.iterate(filters, skip, limit, STREAM_BATCH_SIZE, order)
+        try:
+            documents = await mongo_breaker.call(lambda: prefetch(cursor))
+        except DB_ERRORS:
+            raise HTTPException(status_code=503, detail="La base de datos no está disponible, intente más tarde")
+        # El cupo de concurrencia se conserva hasta terminar de leer el cursor
+        return StreamingResponse(hold_slot(request, stream_json_array(documents)), media_type="application/json",
+                                 background=BackgroundTask(release_slot, request))
+
+    async def query() -> bytes:
+        results = await repository.list(filters, skip, limit, order)
+        return _LIST_ADAPTER.dump_json(_LIST_ADAPTER.validate_python(results), by_alias=True)
+
+    # Con la base caída o lenta se responde la última copia de esta misma consulta
+    key = ("list", repository.name, filters.model_dump_json(), skip, limit, order and format_sort(order))
+    content, age = await with_snapshot(key, lambda: reads.do(key, lambda: mongo_breaker.call(query)))
+    return json_response(content, age)
+
+# Recomendación por contenido (pública, como el listado)
+@router.post("/recommend", response_model=List[Recommendation], dependencies=[Depends(admit(COSTS["list"]))])
+async def recommend_convocatorias(
+    profile: StudentProfile = Body(...),
+    k: int = Query(10, gt=0, le=100, description="Número de convocatorias a recomendar"),
+):
+    if not recommender.ready:
+        raise HTTPException(status_code=503, detail="El índice de recomendación se está construyendo")
+    terms = profile_terms(profile.interests, profile.languages, profile.preferred_regions)
+    ranked = recommender.recommend(terms, k, only_active=profile.only_active)
+    if not ranked:
+        return []
+    documents = await get_repository().get_many([doc_id for doc_id, _ in ranked])
+    return [
+        {"score": round(score, 4), "convocatoria": documents[doc_id]}
+        for doc_id, score in ranked
+        if doc_id in documents
+    ]
+
+# Varias convocatorias por id en un solo viaje a la base (favoritos, comparaciones)
+@router.post("/batch-get", response_model=BatchGetResponse, dependencies=[Depends(admit(COSTS["list"]))])
+async def batch_get_convocatorias(request: BatchGetRequest = Body(...)):
+    requested = list(dict.fromkeys(request.ids))  # sin duplicados, en el orden pedido
+    valid = [doc_id for doc_id in requested if ObjectId.is_valid(doc_id)]
+    documents = await get_repository().get_many(valid)
+    return {
+        "items": [documents[doc_id] for doc_id in valid if doc_id in documents],
+        "missing": [doc_id for doc_id in valid if doc_id not in documents],
+        "invalid": [doc_id for doc_id in requested if not ObjectId.is_valid(doc_id)],
+    }
+
+# Estadísticas materializadas (lectura de un documento, independiente del tamaño del catálogo)
+@router.get("/stats", response_model=ConvocatoriaStats, dependencies=[Depends(admit())])
+async def get_convocatoria_stats():
+    return await get_repository().stats()
+
+# Grupos de convocatorias casi duplicadas (MinHash + LSH, calculados en segundo plano)
+@router.get("/duplicates", response_model=List[DuplicateCluster], dependencies=[Depends(admit())])
+async def get_duplicate_convocatorias(
+    min_size: int = Query(2, ge=2, description="Tamaño mínimo del grupo"),
+    limit: int = Query(100, gt=0, le=1000),
+    current_user: TokenData = Depends(require_admin_role) # <-- Dependencia de administrador
+):
+    if not duplicate_index.ready:
+        raise HTTPException(status_code=503, detail="Los grupos de duplicados se están calculando")
+    clusters = [cluster for cluster in duplicate_index.clusters if cluster["size"] >= min_size]
+    return clusters[:limit]
 
 # GET por ID SIN PROTECCIÓN TEMPORAL - SOLO PARA PRUEBAS
-@router.get("/{id}", response_model=Convocatoria)
+@router.get("/{id}", response_model=Convocatoria, dependencies=[Depends(admit())])
 async def get_convocatoria_by_id(
     id: str,
     # AUTENTICACIÓN DESACTIVADA TEMPORALMENTE PARA PRUEBAS
     # current_user: TokenData = Depends(get_current_user) # <-- Dependencia comentada
 ):
+    repository = get_repository()
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="ID de convocatoria inválido")
-    convocatoria = await collection.find_one({"_id": ObjectId(id)})
-    if convocatoria:
-        return convocatoria
+
+    async def query() -> Optional[bytes]:
+        convocatoria = await repository.get(id)
+        if convocatoria is None:
+            return None
+        return _ITEM_ADAPTER.dump_json(_ITEM_ADAPTER.validate_python(convocatoria), by_alias=True)
+
+    key = ("get", repository.name, id)
+    content, age = await with_snapshot(key, lambda: reads.do(key, lambda: mongo_breaker.call(query)))
+    if content is not None:
+        return json_response(content, age)
     raise HTTPException(status_code=404, detail=f"Convocatoria con id {id} no encontrada")
 
+# Convocatorias similares (tabla precalculada; una búsqueda por petición)
+@router.get("/{id}/similar", response_model=List[Recommendation], dependencies=[Depends(admit())])
+async def get_similar_convocatorias(
+    id: str,
+    k: int = Query(NEIGHBOURS, gt=0, le=NEIGHBOURS, description="Número de convocatorias similares"),
+):
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status_code=400, detail="ID de convocatoria inválido")
+    if not neighbour_table.ready:
+        raise HTTPException(status_code=503, detail="La tabla de similares se está construyendo")
+    repository = get_repository()
+    neighbours = neighbour_table.similar(id, k)
+    if neighbours is None:
+        # Convocatoria creada después del último cálculo: aún no tiene vecinos
+        if await repository.get(id):
+            return []
+        raise HTTPException(status_code=404, detail=f"Convocatoria con id {id} no encontrada")
+    if not neighbours:
+        return []
+    documents = await repository.get_many([doc_id for doc_id, _ in neighbours])
+    return [
+        {"score": round(score, 4), "convocatoria": documents[doc_id]}
+        for doc_id, score in neighbours
+        if doc_id in documents
+    ]
+
+async def _bulk_notices(repository, filters: ConvocatoriaFilters, update_data: dict) -> list:
+    """Avisos de búsquedas guardadas de una edición masiva; sin lecturas si ninguna búsqueda puede empezar a cumplirse."""
+    candidates = saved_searches.bulk_candidates(filters, update_data)
+    if not candidates:
+        return []
+    limit = saved_searches.BULK_NOTIFY_LIMIT
+    documents = repository.iterate(filters, 0, limit, STREAM_BATCH_SIZE)
+    notices, seen = await saved_searches.bulk_notices(documents, candidates, update_data)
+    if seen >= limit:
+        print(f"⚠️  Edición masiva: solo se revisaron las primeras {limit} convocatorias contra las búsquedas guardadas")
+    return notices
+
+# Edición masiva con los filtros del listado (solo administradores); dry_run solo cuenta
+@router.patch("/", response_model=BulkOperationResult, dependencies=[Depends(admit(list_cost)), Depends(catalog_writable)])
+async def update_convocatorias(
+    convocatoria_update: ConvocatoriaUpdate = Body(...),
+    filters: ConvocatoriaFilters = Depends(convocatoria_filters),
+    dry_run: bool = Query(False, description="Solo contar las convocatorias que se editarían"),
+    current_user: TokenData = Depends(require_admin_role) # <-- Dependencia de administrador
+):
+    _require_filters(filters)
+    update_data = _update_data(convocatoria_update)
+    repository = get_repository()
+    if dry_run:
+        return {"matched": await repository.count(filters), "dryRun": True}
+    notices = await _bulk_notices(repository, filters, update_data)
+    matched = await repository.update_many(filters, update_data)
+    if matched:
+        await catalog.publish_bulk_change("update", matched, _bulk_database())
+        saved_searches.enqueue(notices)
+        await audit.record(current_user, "bulk_update", filters=filters.model_dump(mode="json", exclude_none=True),
+                           matched=matched, update={k: v for k, v in update_data.items() if not k.startswith("norm.")})
+    return {"matched": matched}
+
+# Borrado masivo con los filtros del listado (solo administradores); dry_run solo cuenta
+@router.delete("/", response_model=BulkOperationResult, dependencies=[Depends(admit(list_cost)), Depends(catalog_writable)])
+async def delete_convocatorias(
+    filters: ConvocatoriaFilters = Depends(convocatoria_filters),
+    dry_run: bool = Query(False, description="Solo contar las convocatorias que se borrarían"),
+    current_user: TokenData = Depends(require_admin_role) # <-- Dependencia de administrador
+):
+    _require_filters(filters)
+    repository = get_repository()
+    if dry_run:
+        return {"matched": await repository.count(filters), "dryRun": True}
+    matched = await repository.delete_many(filters)
+    if matched:
+        await catalog.publish_bulk_change("delete", matched, _bulk_database())
+        await audit.record(current_user, "bulk_delete", filters=filters.model_dump(mode="json", exclude_none=True),
+                           matched=matched)
+    return {"matched": matched}
+
 # PATCH protegido solo para administradores
-@router.patch("/{id}", response_model=Convocatoria)
+@router.patch("/{id}", response_model=Convocatoria, dependencies=[Depends(admit()), Depends(catalog_writable)])
 async def update_convocatoria(
     id: str,
     convocatoria_update: ConvocatoriaUpdate = Body(...),
@@ -183,17 +432,17 @@ async def update_convocatoria(
     # ... (la lógica interna no cambia)
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="ID de convocatoria inválido")
-    update_data = {k: v for k, v in convocatoria_update.dict(by_alias=True).items() if v is not None}
-    if not update_data:
-        raise HTTPException(status_code=400, detail="No se enviaron datos para actualizar")
-    result = await collection.update_one({"_id": ObjectId(id)}, {"$set": update_data})
-    if result.matched_count == 0:
+    update_data = _update_data(convocatoria_update)
+    result = await get_repository().update(id, update_data)
+    if result is None:
         raise HTTPException(status_code=404, detail=f"Convocatoria con id {id} no encontrada")
-    updated_convocatoria = await collection.find_one({"_id": ObjectId(id)})
+    previous, updated_convocatoria = result
+    await catalog.publish_change(previous, updated_convocatoria)
+    await audit.record(current_user, "update", before=previous, after=updated_convocatoria)
     return updated_convocatoria
 
 # DELETE protegido solo para administradores
-@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(admit()), Depends(catalog_writable)])
 async def delete_convocatoria(
     id: str,
     current_user: TokenData = Depends(require_admin_role) # <-- Dependencia de administrador
@@ -201,7 +450,9 @@ async def delete_convocatoria(
     # ... (la lógica interna no cambia)
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="ID de convocatoria inválido")
-    result = await collection.delete_one({"_id": ObjectId(id)})
-    if result.deleted_count == 0:
+    deleted = await get_repository().delete(id)
+    if deleted is None:
         raise HTTPException(status_code=404, detail=f"Convocatoria con id {id} no encontrada")
+    await catalog.publish_change(deleted, None)
+    await audit.record(current_user, "delete", before=deleted)
     return
\ No newline at end of file
@@ -0,0 +1,68 @@
+import os
+from typing import List, Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+
+from .. import jobs
+from ..admission import admit
+from ..database import get_job_collection
+from ..models import Job, JobCreate
+from ..security import TokenData, require_admin_role
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Tareas"]
+)
+
+
+async def _get_job(id: str) -> dict:
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status_code=400, detail="ID de tarea inválido")
+    document = await get_job_collection().find_one({"_id": ObjectId(id)})
+    if document is None:
+        raise HTTPException(status_code=404, detail=f"Tarea con id {id} no encontrada")
+    return document
+
+
+# Encola una tarea pesada (recarga, índices, estadísticas, duplicados, exportación); se sigue con GET /jobs/{id}
+@router.post("/", response_model=Job, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(admit())])
+async def create_job(
+    job: JobCreate = Body(...),
+    current_user: TokenData = Depends(require_admin_role) # <-- Dependencia de administrador
+):
+    try:
+        return await jobs.runner.submit(get_job_collection(), job.kind, job.params, current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Tareas más recientes primero
+@router.get("/", response_model=List[Job], dependencies=[Depends(admit())])
+async def get_jobs(
+    status: Optional[str] = Query(None, description="queued, running, succeeded o failed"),
+    kind: Optional[str] = None,
+    limit: int = Query(50, gt=0, le=200),
+    current_user: TokenData = Depends(require_admin_role) # <-- Dependencia de administrador
+):
+    query = {key: value for key, value in {"status": status, "kind": kind}.items() if value}
+    cursor = get_job_collection().find(query).sort("createdAt", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+@router.get("/{id}", response_model=Job, dependencies=[Depends(admit())])
+async def get_job(id: str, current_user: TokenData = Depends(require_admin_role)):
+    return await _get_job(id)
+
+
+# Archivo NDJSON de una exportación terminada
+@router.get("/{id}/download", dependencies=[Depends(admit())])
+async def download_job_result(id: str, current_user: TokenData = Depends(require_admin_role)):
+    document = await _get_job(id)
+    if document["kind"] != "export" or document["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail="La tarea no es una exportación terminada")
+    path = jobs.export_path(document["_id"])
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="El archivo de la exportación ya no existe")
+    return FileResponse(path, media_type="application/x-ndjson", filename=os.path.basename(path))
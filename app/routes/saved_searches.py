@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from typing import List
+
+from bson import ObjectId
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+
+from .. import saved_searches
+from ..admission import admit
+from ..database import get_saved_search_collection, get_saved_search_outbox_collection
+from ..models import SavedSearch, SavedSearchCreate, SavedSearchNotification
+from ..security import TokenData, get_current_user
+
+router = APIRouter(
+    prefix="/saved-searches",
+    tags=["Búsquedas guardadas"]
+)
+
+
+# Guarda los filtros del listado para recibir avisos de convocatorias nuevas que los cumplan
+@router.post("/", response_model=SavedSearch, status_code=status.HTTP_201_CREATED, dependencies=[Depends(admit())])
+async def create_saved_search(
+    saved_search: SavedSearchCreate = Body(...),
+    current_user: TokenData = Depends(get_current_user),
+):
+    filters = saved_search.filters.model_dump(mode="json", exclude_none=True)
+    if not filters:
+        raise HTTPException(status_code=400, detail="La búsqueda guardada debe tener al menos un filtro")
+    if saved_search.filters.q is not None and len(saved_search.filters.q) < 3:
+        raise HTTPException(status_code=400, detail="La búsqueda por texto requiere al menos 3 caracteres")
+    collection = get_saved_search_collection()
+    count = await collection.count_documents({"owner": current_user.sub, "active": True})
+    if count >= saved_searches.MAX_SAVED_SEARCHES_PER_USER:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se alcanzó el máximo de {saved_searches.MAX_SAVED_SEARCHES_PER_USER} búsquedas guardadas",
+        )
+    now = datetime.now(timezone.utc)
+    document = {
+        "owner": current_user.sub,
+        "name": saved_search.name,
+        "filters": filters,
+        "active": True,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    result = await collection.insert_one(document)
+    document["_id"] = result.inserted_id
+    # Este proceso la ve de inmediato; los demás en la siguiente sincronización
+    saved_searches.index.apply(document)
+    return document
+
+
+@router.get("/", response_model=List[SavedSearch], dependencies=[Depends(admit())])
+async def get_saved_searches(current_user: TokenData = Depends(get_current_user)):
+    cursor = get_saved_search_collection().find({"owner": current_user.sub, "active": True})
+    return await cursor.to_list(length=saved_searches.MAX_SAVED_SEARCHES_PER_USER)
+
+
+# Avisos generados para las búsquedas del usuario (más recientes primero)
+@router.get("/notifications", response_model=List[SavedSearchNotification], dependencies=[Depends(admit())])
+async def get_saved_search_notifications(
+    limit: int = Query(50, gt=0, le=200),
+    current_user: TokenData = Depends(get_current_user),
+):
+    cursor = get_saved_search_outbox_collection().find({"owner": current_user.sub}).sort("createdAt", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(admit())])
+async def delete_saved_search(id: str, current_user: TokenData = Depends(get_current_user)):
+    if not ObjectId.is_valid(id):
+        raise HTTPException(status_code=400, detail="ID de búsqueda guardada inválido")
+    # Se marca como inactiva (no se borra) para que los demás procesos la quiten de su índice
+    result = await get_saved_search_collection().update_one(
+        {"_id": ObjectId(id), "owner": current_user.sub, "active": True},
+        {"$set": {"active": False, "updatedAt": datetime.now(timezone.utc)}},
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail=f"Búsqueda guardada con id {id} no encontrada")
+    saved_searches.index.remove(id)
+    return
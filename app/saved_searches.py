@@ -0,0 +1,454 @@
+"""
+Búsquedas guardadas y alertas de nuevas convocatorias.
+
+Un estudiante guarda los mismos filtros del listado (p. ej. país=Alemania, idioma=Inglés,
+estado=Vigente) y recibe un aviso cuando una convocatoria creada o editada empieza a
+cumplirlos. En lugar de evaluar cada búsqueda guardada contra el documento, se hace la
+búsqueda al revés:
+
+- Las búsquedas se agrupan en memoria por la combinación exacta de sus filtros de
+  igualdad (país, idioma, estado, tipo de convenio, enlaces rotos), normalizados como en
+  el planificador. La combinación es la clave de un diccionario.
+- Un documento solo puede cumplir las combinaciones formadas con sus propios valores
+  (cada campo presente o ausente; un valor por cada idioma), que son a lo sumo unas
+  decenas. Se consultan esas claves y solo las búsquedas encontradas evalúan el resto de
+  sus filtros (prefijo de nivel, rango de vigencia, texto).
+
+El costo depende del número de combinaciones del documento y de las búsquedas que
+coinciden, no del total de búsquedas guardadas. Los avisos se acumulan en memoria y se
+escriben por lotes en la colección `saved_search_outbox`, de donde los toma quien los
+entregue (correo, push).
+
+Cada proceso mantiene su índice: lo carga al arrancar y trae periódicamente las búsquedas
+creadas o eliminadas en otros procesos (`SAVED_SEARCH_SYNC_SECONDS`).
+"""
+import asyncio
+import itertools
+import os
+import re
+import time
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import BulkWriteError
+
+from .models import ConvocatoriaFilters
+from .normalization import NORM_PREFIX, as_datetime, fold, normalized_fields, validity_fields
+
+SAVED_SEARCHES_COLLECTION = "saved_searches"
+OUTBOX_COLLECTION = "saved_search_outbox"
+
+MAX_SAVED_SEARCHES_PER_USER = int(os.getenv("MAX_SAVED_SEARCHES_PER_USER", "20"))
+SAVED_SEARCH_SYNC_SECONDS = float(os.getenv("SAVED_SEARCH_SYNC_SECONDS", "10"))
+# Avisos por escritura a la bandeja de salida y espera máxima antes de escribir un lote incompleto
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_FLUSH_SECONDS = float(os.getenv("OUTBOX_FLUSH_SECONDS", "2"))
+# Convocatorias que una edición masiva revisa como mucho contra las búsquedas guardadas
+BULK_NOTIFY_LIMIT = int(os.getenv("BULK_NOTIFY_LIMIT", "5000"))
+
+# Filtros de igualdad que forman la clave, en orden fijo: parámetro -> campo normalizado
+KEY_PREDICATES = {
+    "country": "country",
+    "language": "languages",
+    "state": "state",
+    "agreement_type": "agreementType",
+    "broken_links": "hasBrokenLinks",
+}
+# Campos del índice de texto (`search_index`) contra los que se evalúa `q`
+TEXT_FIELDS = ("institution", "country", "Props", "agreementType")
+# Campos del documento que lee cada filtro que no forma parte de la clave
+RESIDUAL_FIELDS = {
+    "subscription_level": ("subscriptionLevel",),
+    "valid_after": ("validity", "validUntil"),
+    "expiring_before": ("validity", "validUntil"),
+    "q": TEXT_FIELDS,
+}
+_WORD = re.compile(r"\w+")
+
+OUTBOX_INDEXES = [
+    # Un aviso por búsqueda y convocatoria aunque el documento se edite varias veces
+    IndexModel([("savedSearchId", ASCENDING), ("convocatoriaId", ASCENDING)], name="search_convocatoria_unique", unique=True),
+    IndexModel([("owner", ASCENDING), ("createdAt", ASCENDING)], name="owner_createdAt_index"),
+    IndexModel([("status", ASCENDING), ("createdAt", ASCENDING)], name="status_createdAt_index"),
+]
+SAVED_SEARCH_INDEXES = [
+    IndexModel([("owner", ASCENDING), ("active", ASCENDING)], name="owner_active_index"),
+    IndexModel([("updatedAt", ASCENDING)], name="updatedAt_index"),
+]
+
+Key = Tuple[Tuple[str, Any], ...]
+
+# Los valores de los filtros se repiten mucho entre búsquedas (países, idiomas, estados)
+_fold = lru_cache(maxsize=65536)(fold)
+Residual = Callable[[Dict[str, Any]], bool]
+
+
+class Subscription(NamedTuple):
+    id: str
+    owner: str
+    key: Key
+    # Filtros que no forman parte de la clave (None si no hay)
+    residual: Optional[Residual] = None
+    # Campos del documento de los que depende la búsqueda
+    fields: FrozenSet[str] = frozenset()
+
+
+def filters_key(filters: ConvocatoriaFilters) -> Key:
+    """Combinación de filtros de igualdad de una búsqueda, normalizada."""
+    key = []
+    for param in KEY_PREDICATES:
+        value = getattr(filters, param)
+        if value is None or value == "":
+            continue
+        key.append((param, value if isinstance(value, bool) else _fold(value)))
+    return tuple(key)
+
+
+def filter_fields(filters: ConvocatoriaFilters) -> FrozenSet[str]:
+    """Campos del documento que leen los filtros de una búsqueda."""
+    fields = {KEY_PREDICATES[param] for param in KEY_PREDICATES if getattr(filters, param) not in (None, "")}
+    for param, names in RESIDUAL_FIELDS.items():
+        if getattr(filters, param):
+            fields.update(names)
+    return frozenset(fields)
+
+
+def _text_words(value: Any) -> set:
+    return set(_WORD.findall(fold(value)))
+
+
+def compile_residual(filters: ConvocatoriaFilters) -> Optional[Residual]:
+    """
+    Predicado con los filtros que no están en la clave. `q` se aproxima como en `$text`:
+    basta que una de sus palabras aparezca en los campos indexados (sin lematizar).
+    """
+    checks: List[Residual] = []
+    if filters.subscription_level:
+        prefix = fold(filters.subscription_level)
+        checks.append(lambda doc: _document_norm(doc).get("subscriptionLevel", "").startswith(prefix))
+    if filters.valid_after:
+        after = as_datetime(filters.valid_after)
+        checks.append(lambda doc: _valid_until(doc) is not None and _valid_until(doc) >= after)
+    if filters.expiring_before:
+        before = as_datetime(filters.expiring_before)
+        checks.append(lambda doc: _valid_until(doc) is not None and _valid_until(doc) < before)
+    if filters.q:
+        words = _text_words(filters.q)
+        checks.append(lambda doc: bool(words & set().union(*(_text_words(doc.get(f)) for f in TEXT_FIELDS))))
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda doc: all(check(doc) for check in checks)
+
+
+def _document_norm(document: Dict[str, Any]) -> Dict[str, Any]:
+    return document.get(NORM_PREFIX) or normalized_fields(document)
+
+
+def _valid_until(document: Dict[str, Any]) -> Optional[datetime]:
+    if "validUntil" in document:
+        return document["validUntil"]
+    return validity_fields(document).get("validUntil")
+
+
+def document_key_values(document: Dict[str, Any]) -> List[List[Tuple[str, Any]]]:
+    """Por cada filtro de la clave, los pares (parámetro, valor) que el documento puede cumplir."""
+    norm = _document_norm(document)
+    options = []
+    for param, field in KEY_PREDICATES.items():
+        if param == "broken_links":
+            value = document.get(field)
+            values = [value] if isinstance(value, bool) else []
+        elif param == "language":
+            values = norm.get(field) or []
+        else:
+            values = [norm[field]] if norm.get(field) else []
+        options.append([None] + [(param, value) for value in values])
+    return options
+
+
+def candidate_keys(document: Dict[str, Any]) -> Iterable[Key]:
+    """Todas las combinaciones de filtros de igualdad que el documento cumple."""
+    for combination in itertools.product(*document_key_values(document)):
+        yield tuple(pair for pair in combination if pair is not None)
+
+
+class _Bucket:
+    """Búsquedas con la misma combinación; las que no tienen filtros residuales coinciden sin evaluar nada."""
+
+    __slots__ = ("key", "plain", "filtered")
+
+    def __init__(self, key: Key):
+        self.key = key
+        self.plain: Dict[str, Subscription] = {}
+        self.filtered: Dict[str, Subscription] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.plain or self.filtered)
+
+
+class SavedSearchIndex:
+    """Índice invertido de búsquedas guardadas por combinación de filtros de igualdad."""
+
+    def __init__(self):
+        self._buckets: Dict[Key, _Bucket] = {}
+        self._by_id: Dict[str, Subscription] = {}
+        self.ready = False
+        self.synced_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def add(self, search_id: str, owner: str, filters: ConvocatoriaFilters) -> None:
+        self.remove(search_id)
+        key = filters_key(filters)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(key)
+        # Todas las búsquedas de un grupo comparten la misma tupla de clave
+        subscription = Subscription(search_id, owner, bucket.key, compile_residual(filters), filter_fields(filters))
+        self._by_id[search_id] = subscription
+        (bucket.plain if subscription.residual is None else bucket.filtered)[search_id] = subscription
+
+    def remove(self, search_id: str) -> None:
+        subscription = self._by_id.pop(search_id, None)
+        if subscription is None:
+            return
+        bucket = self._buckets[subscription.key]
+        bucket.plain.pop(search_id, None)
+        bucket.filtered.pop(search_id, None)
+        if not bucket:
+            del self._buckets[subscription.key]
+
+    def match(self, document: Dict[str, Any]) -> List[Subscription]:
+        """Búsquedas guardadas que el documento cumple."""
+        matches = []
+        for key in candidate_keys(document):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            matches.extend(bucket.plain.values())
+            matches.extend(subscription for subscription in bucket.filtered.values() if subscription.residual(document))
+        return matches
+
+    def newly_matching(self, before: Optional[Dict[str, Any]], after: Dict[str, Any]) -> List[Subscription]:
+        """Búsquedas que `after` cumple y la versión anterior del documento no cumplía."""
+        matches = self.match(after)
+        if before is None or not matches:
+            return matches
+        previous = {subscription.id for subscription in self.match(before)}
+        return [subscription for subscription in matches if subscription.id not in previous]
+
+    def bulk_candidates(self, filters: ConvocatoriaFilters, changes: Dict[str, Any]) -> List[Subscription]:
+        """
+        Búsquedas que una edición masiva (`filters` y el `$set` `changes`) puede hacer cumplir:
+        las que leen algún campo editado y cuya clave no contradice los valores nuevos ni los
+        filtros de igualdad de la edición. Se decide sin leer documentos.
+        """
+        # `prepare_update` agrega `norm.<campo>` por cada campo normalizado que se edita
+        after = {name.split(".", 1)[1]: value for name, value in changes.items() if name.startswith(NORM_PREFIX + ".")}
+        changed = set(changes) | set(after)
+        fixed = dict(filters_key(filters))
+        candidates = []
+        for subscription in self._by_id.values():
+            if not subscription.fields & changed:
+                continue
+            consistent = True
+            for param, value in subscription.key:
+                field = KEY_PREDICATES[param]
+                if field in changed:
+                    new = changes.get(field) if param == "broken_links" else after.get(field)
+                    consistent = value in (new or []) if param == "language" else value == new
+                elif param != "language" and param in fixed:
+                    consistent = value == fixed[param]
+                if not consistent:
+                    break
+            if consistent:
+                candidates.append(subscription)
+        return candidates
+
+    def apply(self, document: Dict[str, Any]) -> None:
+        """Agrega o quita una búsqueda según su documento en `saved_searches`."""
+        search_id = str(document["_id"])
+        if document.get("active", True):
+            self.add(search_id, document["owner"], ConvocatoriaFilters(**document["filters"]))
+        else:
+            self.remove(search_id)
+
+    async def sync(self, collection) -> int:
+        """Trae las búsquedas cambiadas desde la última sincronización (todas la primera vez)."""
+        query: Dict[str, Any] = {}
+        if self.synced_at is not None:
+            # Margen para escrituras de otros procesos con el reloj algo atrasado
+            query["updatedAt"] = {"$gte": self.synced_at - timedelta(seconds=2 * SAVED_SEARCH_SYNC_SECONDS)}
+        else:
+            query["active"] = True
+        changed = 0
+        latest = self.synced_at
+        async for document in collection.find(query, {"owner": 1, "filters": 1, "active": 1, "updatedAt": 1}):
+            self.apply(document)
+            changed += 1
+            if latest is None or document["updatedAt"] > latest:
+                latest = document["updatedAt"]
+        self.synced_at = latest or datetime.now(timezone.utc).replace(tzinfo=None)
+        self.ready = True
+        return changed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"subscriptions": len(self._by_id), "keys": len(self._buckets), "ready": self.ready}
+
+
+class Outbox:
+    """Avisos pendientes de escribir en `saved_search_outbox`, escritos por lotes."""
+
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pending: List[Dict[str, Any]] = []
+        self._full = asyncio.Event()
+        self.written = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, subscriptions: Iterable[Subscription], document: Dict[str, Any], reason: str) -> int:
+        now = datetime.now(timezone.utc)
+        added = 0
+        for subscription in subscriptions:
+            self._pending.append({
+                "savedSearchId": subscription.id,
+                "owner": subscription.owner,
+                "convocatoriaId": str(document["_id"]),
+                "reason": reason,
+                "status": "pending",
+                "createdAt": now,
+            })
+            added += 1
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return added
+
+    async def flush(self, collection) -> int:
+        """Escribe los avisos acumulados; los repetidos (misma búsqueda y convocatoria) se ignoran."""
+        written = 0
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            try:
+                result = await collection.insert_many(batch, ordered=False)
+                written += len(result.inserted_ids)
+            except BulkWriteError as e:
+                details = e.details
+                errors = details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in errors):
+                    # Otro error: el lote vuelve a la cola para el siguiente intento
+                    failed = {error["index"] for error in errors if error.get("code") != 11000}
+                    self._pending = [batch[i] for i in sorted(failed)] + self._pending
+                    raise
+                written += details.get("nInserted", 0)
+                self.duplicates += len(errors)
+        self._full.clear()
+        self.written += written
+        return written
+
+    async def run(self, collection, interval: float = OUTBOX_FLUSH_SECONDS) -> None:
+        """Tarea de fondo: escribe un lote cuando se llena o cada `interval` segundos."""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush(collection)
+            except Exception as e:
+                print(f"⚠️  No se pudieron escribir los avisos de búsquedas guardadas: {e}")
+                await asyncio.sleep(interval)
+
+
+index = SavedSearchIndex()
+outbox = Outbox()
+
+
+def notify(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> int:
+    """Encola un aviso por cada búsqueda guardada que la escritura empieza a cumplir."""
+    if after is None or not index.ready:
+        return 0
+    matches = index.newly_matching(before, after)
+    return outbox.add(matches, after, "created" if before is None else "updated")
+
+
+def matches(subscription: Subscription, document: Dict[str, Any]) -> bool:
+    """Si el documento cumple una búsqueda dada (sin pasar por el índice)."""
+    values = {pair for options in document_key_values(document) for pair in options if pair is not None}
+    if not all(pair in values for pair in subscription.key):
+        return False
+    return subscription.residual is None or subscription.residual(document)
+
+
+def apply_set(document: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia del documento con el `$set` aplicado (campos de primer nivel y `norm.*`)."""
+    result = dict(document)
+    for name, value in changes.items():
+        if name.startswith(NORM_PREFIX + "."):
+            result[NORM_PREFIX] = {**(result.get(NORM_PREFIX) or {}), name.split(".", 1)[1]: value}
+        else:
+            result[name] = value
+    return result
+
+
+def bulk_candidates(filters: ConvocatoriaFilters, changes: Dict[str, Any]) -> List[Subscription]:
+    if not index.ready:
+        return []
+    return index.bulk_candidates(filters, changes)
+
+
+async def bulk_notices(documents: AsyncIterator[Dict[str, Any]], candidates: List[Subscription],
+                       changes: Dict[str, Any]) -> Tuple[List[Tuple[List[Subscription], Dict[str, Any]]], int]:
+    """
+    Avisos de una edición masiva, calculados antes de escribir: cada documento se compara
+    con su versión editada en memoria, solo contra las búsquedas candidatas. `documents`
+    viene de un cursor limitado a `BULK_NOTIFY_LIMIT` convocatorias. Devuelve también
+    cuántos documentos se revisaron.
+    """
+    notices, seen = [], 0
+    async for document in documents:
+        seen += 1
+        after = apply_set(document, changes)
+        found = [subscription for subscription in candidates
+                 if matches(subscription, after) and not matches(subscription, document)]
+        if found:
+            notices.append((found, {"_id": document["_id"]}))
+    return notices, seen
+
+
+def enqueue(notices: List[Tuple[List[Subscription], Dict[str, Any]]], reason: str = "updated") -> int:
+    """Pasa a la bandeja de salida los avisos de `bulk_notices` una vez hecha la escritura."""
+    return sum(outbox.add(found, document, reason) for found, document in notices)
+
+
+async def prepare(database) -> None:
+    await database.get_collection(SAVED_SEARCHES_COLLECTION).create_indexes(SAVED_SEARCH_INDEXES)
+    await database.get_collection(OUTBOX_COLLECTION).create_indexes(OUTBOX_INDEXES)
+
+
+async def run_sync(collection, interval: float = SAVED_SEARCH_SYNC_SECONDS) -> None:
+    """Tarea de fondo: carga el índice y lo mantiene al día con los demás procesos."""
+    while True:
+        try:
+            started = time.perf_counter()
+            first = not index.ready
+            changed = await index.sync(collection)
+            if first:
+                print(f"🔔 {len(index)} búsquedas guardadas indexadas ({time.perf_counter() - started:.2f}s)")
+            elif changed:
+                print(f"🔔 {changed} búsquedas guardadas sincronizadas")
+        except Exception as e:
+            print(f"⚠️  No se pudieron sincronizar las búsquedas guardadas: {e}")
+        await asyncio.sleep(interval)
+
+
+def stats() -> Dict[str, Any]:
+    return {**index.stats(), "outboxPending": len(outbox), "outboxWritten": outbox.written,
+            "outboxDuplicates": outbox.duplicates}
@@ -3,21 +3,20 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials # <-- Cambios aquí
 from jose import JWTError, jwt
 from pydantic import BaseModel
-from dotenv import load_dotenv
 from typing import Optional
 
-load_dotenv()
-
 # --- CONFIGURACIÓN JWT ---
+# (las variables del archivo .env se cargan al importar el paquete, en app/__init__.py)
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-# Validar que las configuraciones críticas estén presentes
-if not SECRET_KEY:
-    raise ValueError("SECRET_KEY no está configurada en las variables de entorno")
 
-print(f"🔐 JWT Config - Algorithm: {ALGORITHM}, Expire: {ACCESS_TOKEN_EXPIRE_MINUTES}min")
+def check_config() -> None:
+    """Valida la configuración crítica; se llama al arrancar la API, no al importar el módulo."""
+    if not SECRET_KEY:
+        raise ValueError("SECRET_KEY no está configurada en las variables de entorno")
+    print(f"🔐 JWT Config - Algorithm: {ALGORITHM}, Expire: {ACCESS_TOKEN_EXPIRE_MINUTES}min")
 
 # --- ESQUEMA DE SEGURIDAD ---
 # Usamos HTTPBearer en lugar de OAuth2PasswordBearer.
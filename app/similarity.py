@@ -0,0 +1,100 @@
+"""
+Convocatorias similares precalculadas.
+
+Para cada convocatoria se guardan sus `NEIGHBOURS` vecinos más cercanos (similitud coseno
+sobre los mismos términos TF-IDF del recomendador, más el tipo de convenio) en dos arreglos
+compactos: índices de fila (`int32`) y puntajes (`float32`). Responder una petición es
+buscar una fila; la tabla completa se recalcula en segundo plano cuando cambia la versión
+del catálogo o tras un lote de escrituras.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from .lazy import lazy_import
+from .recommender import document_terms, tfidf_matrix
+
+np = lazy_import("numpy")
+
+NEIGHBOURS = 10
+# Filas por bloque al calcular similitudes (limita la memoria a BLOCK_SIZE x N flotantes)
+BLOCK_SIZE = 256
+# Segundos que se esperan tras una escritura antes de recalcular (agrupa ráfagas)
+REBUILD_DELAY = 30.0
+
+PROJECTION = {"Props": 1, "languages": 1, "country": 1, "agreementType": 1}
+
+
+def nearest_neighbours(documents: List[Dict[str, Any]], k: int = NEIGHBOURS) -> Tuple[np.ndarray, np.ndarray]:
+    """Devuelve `(vecinos, puntajes)` de forma `(n, k)`; las posiciones vacías tienen vecino -1."""
+    n = len(documents)
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if n < 2:
+        return neighbours, scores
+
+    matrix, _, _ = tfidf_matrix([document_terms(doc, include_type=True) for doc in documents])
+    width = min(k, n - 1)
+    for start in range(0, n, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n)
+        # Disperso x denso: bastante más rápido que disperso x disperso con salida casi densa
+        block = matrix.dot(matrix[start:stop].toarray().T).T
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # sin sí misma
+        top = np.argpartition(-block, width - 1, axis=1)[:, :width]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        valid = top_scores > 0
+        neighbours[start:stop, :width] = np.where(valid, top, -1)
+        scores[start:stop, :width] = np.where(valid, top_scores, 0)
+    return neighbours, scores
+
+
+class NeighbourTable:
+    """Tabla de vecinos de la versión activa del catálogo."""
+
+    def __init__(self):
+        # Los arreglos se crean con el primer cálculo (`install`)
+        self.ids: Optional[np.ndarray] = None
+        self.row_of: Dict[str, int] = {}
+        self.neighbours: Optional[np.ndarray] = None
+        self.scores: Optional[np.ndarray] = None
+        self.ready = False
+
+    @staticmethod
+    def compute(documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        neighbours, scores = nearest_neighbours(documents)
+        ids = np.array([str(doc["_id"]) for doc in documents], dtype=object)
+        return {
+            "ids": ids,
+            "row_of": {doc_id: row for row, doc_id in enumerate(ids)},
+            "neighbours": neighbours,
+            "scores": scores,
+        }
+
+    def install(self, state: Dict[str, Any]) -> None:
+        self.ids, self.row_of = state["ids"], state["row_of"]
+        self.neighbours, self.scores = state["neighbours"], state["scores"]
+        self.ready = True
+
+    def similar(self, doc_id: str, k: int = NEIGHBOURS) -> Optional[List[Tuple[str, float]]]:
+        """Vecinos de `doc_id` ordenados por puntaje, o None si no está en la tabla."""
+        row = self.row_of.get(doc_id)
+        if row is None:
+            return None
+        neighbours = self.neighbours[row, :k]
+        valid = neighbours >= 0
+        return list(zip(self.ids[neighbours[valid]].tolist(), self.scores[row, :k][valid].tolist()))
+
+
+table = NeighbourTable()
+
+
+async def rebuild(repository, neighbours: NeighbourTable = table) -> None:
+    """Recalcula la tabla; la parte de CPU corre en un hilo para no bloquear el event loop."""
+    documents = await repository.scan(PROJECTION)
+    state = await asyncio.to_thread(neighbours.compute, documents)
+    neighbours.install(state)
+    print(f"🧭 Tabla de similares lista: {len(documents)} convocatorias")
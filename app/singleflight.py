@@ -0,0 +1,47 @@
+"""
+Agrupación de lecturas idénticas concurrentes ("single-flight").
+
+Si llegan varias peticiones con la misma clave mientras la primera aún está en curso,
+todas esperan el mismo resultado en lugar de repetir la consulta. La clave se libera en
+cuanto la consulta termina, así que el resultado nunca es más viejo que la consulta misma:
+una petición que llega después vuelve a consultar la base.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta `fn` una sola vez por clave en vuelo y comparte su resultado (o su excepción)."""
+        task = self._flights.get(key)
+        if task is None or task.done():
+            self.executed += 1
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+        else:
+            self.coalesced += 1
+        # `shield`: si la petición que inició la consulta se cancela, las demás siguen esperando
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.executed + self.coalesced
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "inFlight": len(self._flights),
+            "coalescedRatio": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+
+# Lecturas del catálogo (listado y detalle)
+reads = SingleFlight()
@@ -0,0 +1,155 @@
+"""
+Orden del listado de convocatorias (`sort=institution,-subscriptionYear,country`).
+
+Solo se aceptan los campos de `SORT_FIELDS` (con `-` delante, de mayor a menor) y, sin
+búsqueda de texto, solo los órdenes de `SORT_ORDERS` o un prefijo de ellos, en el mismo
+sentido o en el inverso. Cada uno tiene su índice compuesto en MongoDB (`app/indexes.py`)
+y en SQLite, así que una página ordenada se lee recorriendo el índice, sin ordenar en
+memoria. El orden pedido se completa con el resto de las claves del índice y el id, para
+que la paginación sea estable.
+
+Con `q` el índice de texto no puede dar el orden: se leen solo las claves de orden de las
+coincidencias y se conservan las `skip + limit` primeras en un heap acotado (`top_k`), sin
+ordenar ni traer completas todas las coincidencias. `relevance` (primero las más
+relevantes) solo se admite junto con `q`.
+"""
+import heapq
+import os
+from datetime import datetime
+from typing import Any, AsyncIterable, Callable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from .normalization import NORM_PREFIX
+
+# Orden resuelto: (campo del parámetro `sort`, 1 ascendente | -1 descendente)
+Sort = Tuple[Tuple[str, int], ...]
+
+RELEVANCE = "relevance"
+# Desempate final (`_id` en MongoDB, `pk` en SQLite)
+ID = "_id"
+
+# Campos ordenables: parámetro -> campo en MongoDB (los textos se ordenan normalizados)
+SORT_FIELDS = {
+    "institution": f"{NORM_PREFIX}.institution",
+    "country": f"{NORM_PREFIX}.country",
+    "subscriptionYear": "subscriptionYear",
+    "validUntil": "validUntil",
+}
+
+# Órdenes con índice propio (sin contar el desempate por id)
+SORT_ORDERS: List[Sort] = [
+    (("institution", 1), ("subscriptionYear", -1), ("country", 1)),
+    (("country", 1), ("institution", 1)),
+    (("subscriptionYear", -1), ("institution", 1)),
+    (("validUntil", 1),),
+]
+
+# Máximo de `skip + limit` para ordenar una búsqueda de texto (tamaño del heap)
+TEXT_SORT_MAX_RESULTS = int(os.getenv("TEXT_SORT_MAX_RESULTS", "10000"))
+# Documentos que se leen antes de recortar el heap
+TOP_K_BATCH_SIZE = 1000
+
+
+def format_sort(sort: Sort) -> str:
+    return ",".join(("-" if direction < 0 else "") + name for name, direction in sort)
+
+
+def parse_sort(value: Optional[str]) -> Optional[Sort]:
+    """Interpreta el parámetro `sort`; ValueError si nombra campos no permitidos."""
+    if not value:
+        return None
+    sort = []
+    for part in value.split(","):
+        part = part.strip()
+        name = part.lstrip("-")
+        if name not in SORT_FIELDS and name != RELEVANCE:
+            allowed = ", ".join([*SORT_FIELDS, RELEVANCE])
+            raise ValueError(f"No se puede ordenar por '{part}'; campos permitidos: {allowed}")
+        if any(name == other for other, _ in sort):
+            raise ValueError(f"El campo '{name}' aparece más de una vez en el orden")
+        sort.append((name, -1 if part.startswith("-") else 1))
+    return tuple(sort)
+
+
+def _reversed(sort: Sort) -> Sort:
+    return tuple((name, -direction) for name, direction in sort)
+
+
+def resolve_sort(sort: Optional[Sort], text: bool) -> Optional[Sort]:
+    """
+    Orden completo que aplicará el repositorio, terminado en `ID`.
+    Sin texto debe ser (el prefijo de) un orden con índice; ValueError si no lo es.
+    """
+    if not sort:
+        return None
+    if not text:
+        if any(name == RELEVANCE for name, _ in sort):
+            raise ValueError("El orden por relevancia requiere una búsqueda de texto (q)")
+        for order in SORT_ORDERS:
+            full = order + ((ID, 1),)
+            if order[:len(sort)] == sort:
+                return full
+            if _reversed(order[:len(sort)]) == sort:
+                return _reversed(full)
+        supported = "; ".join(format_sort(order) for order in SORT_ORDERS)
+        raise ValueError(f"Orden no soportado sin búsqueda de texto; use uno de estos (o un prefijo, o al revés): {supported}")
+    return sort + ((ID, 1),)
+
+
+# --- Top-k en memoria (búsquedas de texto) ---
+
+class _Descending:
+    """Invierte la comparación de un valor (para las claves de mayor a menor)."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+
+def _comparable(value: Any) -> Tuple[int, Any]:
+    # Mismo orden entre tipos que MongoDB: nulos, números, textos, ObjectId, booleanos, fechas
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (4, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, value)
+    if isinstance(value, datetime):
+        return (5, value)
+    return (6, str(value))
+
+
+def sort_key(sort: Sort, get: Callable[[Any, str], Any]) -> Callable[[Any], Tuple]:
+    """Clave de `heapq`/`sorted` para `sort`; `get(fila, campo)` lee cada valor."""
+    def key(row: Any) -> Tuple:
+        values = []
+        for name, direction in sort:
+            value = _comparable(get(row, name))
+            values.append(value if direction > 0 else _Descending(value))
+        return tuple(values)
+
+    return key
+
+
+async def top_k(rows: AsyncIterable[Any], k: int, key: Callable[[Any], Tuple],
+                batch_size: int = TOP_K_BATCH_SIZE) -> List[Any]:
+    """Las `k` primeras filas según `key`, con memoria acotada a `k + batch_size` filas."""
+    best: List[Any] = []
+    batch: List[Any] = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            best, batch = heapq.nsmallest(k, best + batch, key=key), []
+    return heapq.nsmallest(k, best + batch, key=key)
@@ -0,0 +1,482 @@
+"""
+Catálogo en un archivo SQLite local (backend `sqlite` de `app.repository`).
+
+Pensado para instalaciones pequeñas y pruebas sin `mongod`:
+
+- Cada convocatoria se guarda completa como BSON (mismos tipos que devuelve Motor:
+  `ObjectId`, fechas) junto a columnas con los valores normalizados (`norm.*`), la
+  vigencia y el indicador de enlaces rotos, todas con índice.
+- Los idiomas van en una tabla aparte (`convocatoria_languages`) para filtrar por uno.
+- `q` usa una tabla FTS5 sobre los mismos campos que el índice de texto de MongoDB, sin
+  distinguir mayúsculas ni tildes; como `$text`, basta con que coincida una palabra.
+- Cada orden del listado (`app/sorting.py`) tiene su índice, terminado en `pk`; con `q`
+  la relevancia es el `rank` de FTS5 y SQLite ordena con un top-N acotado (`LIMIT`).
+- sqlite3 es síncrono: todas las operaciones corren en un único hilo dedicado, así que no
+  bloquean el event loop y la conexión nunca se comparte entre hilos. El archivo usa WAL.
+
+Uso como script:
+    python -m app.sqlite_repository load [archivo]   # reemplaza el catálogo (una transacción)
+"""
+import asyncio
+import re
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+
+from . import stats
+from .models import ConvocatoriaFilters
+from .normalization import NORM_PREFIX, as_datetime, fold
+from .sorting import ID, RELEVANCE, SORT_ORDERS, Sort
+
+Document = Dict[str, Any]
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = NORMAL;
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS convocatorias (
+    pk INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    document BLOB NOT NULL,
+    country TEXT,
+    subscription_year TEXT,
+    agreement_type TEXT,
+    state TEXT,
+    norm_country TEXT,
+    norm_institution TEXT,
+    norm_state TEXT,
+    norm_agreement_type TEXT,
+    norm_subscription_level TEXT,
+    valid_until TEXT,
+    has_broken_links INTEGER
+);
+CREATE INDEX IF NOT EXISTS norm_country_index ON convocatorias (norm_country);
+CREATE INDEX IF NOT EXISTS norm_state_country_index ON convocatorias (norm_state, norm_country);
+CREATE INDEX IF NOT EXISTS norm_agreement_type_index ON convocatorias (norm_agreement_type);
+CREATE INDEX IF NOT EXISTS norm_subscription_level_index ON convocatorias (norm_subscription_level);
+CREATE INDEX IF NOT EXISTS valid_until_index ON convocatorias (valid_until);
+CREATE INDEX IF NOT EXISTS has_broken_links_index ON convocatorias (has_broken_links);
+-- Las estadísticas agrupan recorriendo solo estos índices
+CREATE INDEX IF NOT EXISTS country_index ON convocatorias (country);
+CREATE INDEX IF NOT EXISTS subscription_year_index ON convocatorias (subscription_year);
+CREATE INDEX IF NOT EXISTS agreement_type_index ON convocatorias (agreement_type);
+CREATE INDEX IF NOT EXISTS state_index ON convocatorias (state);
+CREATE TABLE IF NOT EXISTS convocatoria_languages (
+    language TEXT NOT NULL,
+    pk INTEGER NOT NULL REFERENCES convocatorias (pk) ON DELETE CASCADE,
+    PRIMARY KEY (language, pk)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS convocatoria_languages_pk_index ON convocatoria_languages (pk);
+CREATE VIRTUAL TABLE IF NOT EXISTS convocatorias_fts USING fts5(
+    institution, country, Props, agreementType,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Filtros de igualdad: parámetro del endpoint -> columna normalizada
+EQUALITY_COLUMNS = {
+    "country": "norm_country",
+    "state": "norm_state",
+    "agreement_type": "norm_agreement_type",
+}
+# Columnas con el valor original de cada dimensión de las estadísticas
+STATS_COLUMNS = {
+    "byCountry": "country",
+    "byYear": "subscription_year",
+    "byType": "agreement_type",
+    "byState": "state",
+}
+# Campos ordenables (`sorting.SORT_FIELDS`) -> columna; el desempate por id es `pk`
+SORT_COLUMNS = {
+    "institution": "norm_institution",
+    "country": "norm_country",
+    "subscriptionYear": "subscription_year",
+    "validUntil": "valid_until",
+    RELEVANCE: "convocatorias_fts.rank",
+    ID: "pk",
+}
+# Se crean después de `SCHEMA` (y de migrar los archivos anteriores a `norm_institution`)
+SORT_INDEXES = "\n".join(
+    f"CREATE INDEX IF NOT EXISTS sort_{'_'.join(field for field, _ in order)}_index ON convocatorias ("
+    + ", ".join(SORT_COLUMNS[field] + (" DESC" if direction < 0 else "") for field, direction in order)
+    + ", pk);"
+    for order in SORT_ORDERS
+) + "\nCREATE INDEX IF NOT EXISTS norm_state_valid_until_index ON convocatorias (norm_state, valid_until, pk);"
+TEXT_FIELDS = ("institution", "country", "Props", "agreementType")
+_WORD = re.compile(r"\w+")
+# Mayor que cualquier carácter: `prefijo <= x < prefijo + _MAX_CHAR` es un rango con índice
+_MAX_CHAR = "\U0010ffff"
+
+
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else None
+
+
+def _row(document: Document) -> Tuple[Any, ...]:
+    norm = document.get(NORM_PREFIX) or {}
+    broken = document.get("hasBrokenLinks")
+    return (
+        str(document["_id"]),
+        bson.encode(document),
+        document.get("country"),
+        document.get("subscriptionYear"),
+        document.get("agreementType"),
+        document.get("state"),
+        norm.get("country"),
+        norm.get("institution"),
+        norm.get("state"),
+        norm.get("agreementType"),
+        norm.get("subscriptionLevel"),
+        _iso(document.get("validUntil")),
+        None if broken is None else int(broken),
+    )
+
+
+def _set_path(document: Document, path: str, value: Any) -> None:
+    """Aplica un `$set` con ruta `a.b` sobre un documento."""
+    *parents, leaf = path.split(".")
+    target = document
+    for part in parents:
+        target = target.setdefault(part, {})
+    target[leaf] = value
+
+
+def text_query(q: str) -> Optional[str]:
+    """Consulta FTS5 equivalente a `$text`: cualquiera de las palabras, entre comillas."""
+    words = _WORD.findall(fold(q))
+    return " OR ".join(f'"{word}"' for word in words) or None
+
+
+def where_clause(filters: ConvocatoriaFilters, join_text: bool = False) -> Tuple[str, List[Any]]:
+    """
+    Traduce los filtros del listado a una condición SQL con parámetros.
+    Con `join_text` la consulta une `convocatorias_fts` (para ordenar por `rank`).
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for param, column in EQUALITY_COLUMNS.items():
+        value = getattr(filters, param)
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(fold(value))
+    if filters.language:
+        clauses.append(
+            "EXISTS (SELECT 1 FROM convocatoria_languages l WHERE l.language = ? AND l.pk = convocatorias.pk)"
+        )
+        params.append(fold(filters.language))
+    if filters.subscription_level:
+        prefix = fold(filters.subscription_level)
+        clauses.append("norm_subscription_level >= ? AND norm_subscription_level < ?")
+        params.extend([prefix, prefix + _MAX_CHAR])
+    if filters.broken_links is not None:
+        clauses.append("has_broken_links = ?")
+        params.append(int(filters.broken_links))
+    if filters.valid_after:
+        clauses.append("valid_until >= ?")
+        params.append(as_datetime(filters.valid_after).isoformat())
+    if filters.expiring_before:
+        clauses.append("valid_until < ?")
+        params.append(as_datetime(filters.expiring_before).isoformat())
+    if filters.q:
+        match = text_query(filters.q)
+        if match is None:
+            clauses.append("0")
+        elif join_text:
+            clauses.append("convocatorias_fts MATCH ?")
+            params.append(match)
+        else:
+            clauses.append("pk IN (SELECT rowid FROM convocatorias_fts WHERE convocatorias_fts MATCH ?)")
+            params.append(match)
+    return (" AND ".join(clauses) or "1"), params
+
+
+def select_clause(filters: ConvocatoriaFilters, sort: Optional[Sort]) -> Tuple[str, List[Any]]:
+    """`FROM ... WHERE ... ORDER BY ...` del listado; sin `sort`, en orden de inserción."""
+    join_text = bool(sort and filters.q)
+    where, params = where_clause(filters, join_text)
+    source = "convocatorias"
+    if join_text:
+        source += " JOIN convocatorias_fts ON convocatorias_fts.rowid = convocatorias.pk"
+    order = ", ".join(
+        SORT_COLUMNS[field] + (" DESC" if direction < 0 else "") for field, direction in sort or ((ID, 1),)
+    )
+    return f"FROM {source} WHERE {where} ORDER BY {order}", params
+
+
+class SqliteRepository:
+    """Catálogo en un archivo SQLite; todas las operaciones corren en un hilo propio."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def name(self) -> str:
+        return f"sqlite:{self.path}"
+
+    # --- Ejecución en el hilo de SQLite ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.executescript(SCHEMA)
+            self._migrate(self._connection)
+            self._connection.executescript(SORT_INDEXES)
+        return self._connection
+
+    @staticmethod
+    def _migrate(connection: sqlite3.Connection) -> None:
+        # Archivos creados antes de poder ordenar por institución
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(convocatorias)")}
+        if "norm_institution" in columns:
+            return
+        with connection:
+            connection.execute("ALTER TABLE convocatorias ADD COLUMN norm_institution TEXT")
+            rows = connection.execute("SELECT pk, document FROM convocatorias").fetchall()
+            connection.executemany(
+                "UPDATE convocatorias SET norm_institution = ? WHERE pk = ?",
+                [((bson.decode(blob).get(NORM_PREFIX) or {}).get("institution"), pk) for pk, blob in rows],
+            )
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args))
+
+    def _close_sync(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def prepare(self) -> None:
+        await self._run(self._connect)
+
+    async def close(self) -> None:
+        await self._run(self._close_sync)
+
+    # --- Lecturas ---
+
+    def _fetch(self, sql: str, params: Iterable[Any] = ()) -> List[Document]:
+        return [bson.decode(row[0]) for row in self._connect().execute(sql, tuple(params))]
+
+    async def get(self, doc_id: str) -> Optional[Document]:
+        rows = await self._run(self._fetch, "SELECT document FROM convocatorias WHERE id = ?", (doc_id,))
+        return rows[0] if rows else None
+
+    async def get_many(self, ids: Iterable[str]) -> Dict[str, Document]:
+        ids = list(ids)
+        if not ids:
+            return {}
+        sql = f"SELECT document FROM convocatorias WHERE id IN ({','.join('?' * len(ids))})"
+        return {str(doc["_id"]): doc for doc in await self._run(self._fetch, sql, ids)}
+
+    async def list(self, filters: ConvocatoriaFilters, skip: int, limit: int, sort: Optional[Sort] = None) -> List[Document]:
+        select, params = select_clause(filters, sort)
+        sql = f"SELECT document {select} LIMIT ? OFFSET ?"
+        return await self._run(self._fetch, sql, [*params, limit, skip])
+
+    async def iterate(self, filters: ConvocatoriaFilters, skip: int, limit: int, batch_size: int,
+                      sort: Optional[Sort] = None) -> AsyncIterator[Document]:
+        if sort:
+            # Con otro orden que `pk` cada lote es una página con OFFSET
+            select, params = select_clause(filters, sort)
+            sql = f"SELECT document {select} LIMIT ? OFFSET ?"
+            for offset in range(skip, skip + limit, batch_size):
+                documents = await self._run(self._fetch, sql, [*params, min(batch_size, skip + limit - offset), offset])
+                for document in documents:
+                    yield document
+                if len(documents) < batch_size:
+                    return
+            return
+        # Paginación por clave (`pk > último`) en lugar de OFFSET para cada lote
+        where, params = where_clause(filters)
+        sql = f"SELECT pk, document FROM convocatorias WHERE {where} AND pk > ? ORDER BY pk LIMIT ? OFFSET ?"
+        last, offset, remaining = 0, skip, limit
+
+        def fetch(after: int, size: int, offset: int) -> List[Tuple[int, bytes]]:
+            return self._connect().execute(sql, (*params, after, size, offset)).fetchall()
+
+        while remaining > 0:
+            rows = await self._run(fetch, last, min(batch_size, remaining), offset)
+            if not rows:
+                return
+            offset = 0
+            remaining -= len(rows)
+            last = rows[-1][0]
+            for _, blob in rows:
+                yield bson.decode(blob)
+
+    async def scan(self, projection: Dict[str, int]) -> List[Document]:
+        documents = await self._run(self._fetch, "SELECT document FROM convocatorias ORDER BY pk")
+        fields = {field for field, include in projection.items() if include} | {"_id"}
+        return [{key: value for key, value in doc.items() if key in fields} for doc in documents]
+
+    async def count(self, filters: ConvocatoriaFilters) -> int:
+        where, params = where_clause(filters)
+        sql = f"SELECT count(*) FROM convocatorias WHERE {where}"
+        return await self._run(lambda: self._connect().execute(sql, params).fetchone()[0])
+
+    # --- Escrituras ---
+
+    def _write(self, connection: sqlite3.Connection, document: Document, pk: Optional[int] = None) -> int:
+        row = _row(document)
+        if pk is None:
+            cursor = connection.execute(
+                "INSERT INTO convocatorias (id, document, country, subscription_year, agreement_type, state, "
+                "norm_country, norm_institution, norm_state, norm_agreement_type, norm_subscription_level, "
+                "valid_until, has_broken_links) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            pk = cursor.lastrowid
+        else:
+            connection.execute(
+                "UPDATE convocatorias SET id = ?, document = ?, country = ?, subscription_year = ?, agreement_type = ?, "
+                "state = ?, norm_country = ?, norm_institution = ?, norm_state = ?, norm_agreement_type = ?, "
+                "norm_subscription_level = ?, valid_until = ?, has_broken_links = ? WHERE pk = ?",
+                (*row, pk),
+            )
+            connection.execute("DELETE FROM convocatoria_languages WHERE pk = ?", (pk,))
+            connection.execute("DELETE FROM convocatorias_fts WHERE rowid = ?", (pk,))
+        languages = (document.get(NORM_PREFIX) or {}).get("languages") or []
+        connection.executemany(
+            "INSERT OR IGNORE INTO convocatoria_languages (language, pk) VALUES (?, ?)",
+            [(language, pk) for language in languages],
+        )
+        connection.execute(
+            "INSERT INTO convocatorias_fts (rowid, institution, country, Props, agreementType) VALUES (?, ?, ?, ?, ?)",
+            (pk, *(str(document.get(field) or "") for field in TEXT_FIELDS)),
+        )
+        return pk
+
+    def _insert_sync(self, document: Document) -> Document:
+        document = {"_id": ObjectId(), **document} if "_id" not in document else document
+        connection = self._connect()
+        with connection:
+            self._write(connection, document)
+        return bson.decode(bson.encode(document))
+
+    def _update_sync(self, doc_id: str, changes: Dict[str, Any]) -> Optional[Tuple[Document, Document]]:
+        connection = self._connect()
+        with connection:
+            row = connection.execute("SELECT pk, document FROM convocatorias WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            previous = bson.decode(row[1])
+            updated = bson.decode(row[1])
+            for path, value in changes.items():
+                _set_path(updated, path, value)
+            # Los mismos tipos que se leerán después (p. ej. `date` no existe en BSON)
+            updated = bson.decode(bson.encode(updated))
+            self._write(connection, updated, pk=row[0])
+        return previous, updated
+
+    def _update_many_sync(self, filters: ConvocatoriaFilters, changes: Dict[str, Any]) -> int:
+        where, params = where_clause(filters)
+        connection = self._connect()
+        with connection:
+            rows = connection.execute(f"SELECT pk, document FROM convocatorias WHERE {where}", params).fetchall()
+            for pk, blob in rows:
+                updated = bson.decode(blob)
+                for path, value in changes.items():
+                    _set_path(updated, path, value)
+                self._write(connection, bson.decode(bson.encode(updated)), pk=pk)
+        return len(rows)
+
+    def _delete_sync(self, doc_id: str) -> Optional[Document]:
+        connection = self._connect()
+        with connection:
+            row = connection.execute("SELECT pk, document FROM convocatorias WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            connection.execute("DELETE FROM convocatorias_fts WHERE rowid = ?", (row[0],))
+            connection.execute("DELETE FROM convocatorias WHERE pk = ?", (row[0],))
+        return bson.decode(row[1])
+
+    def _delete_many_sync(self, filters: ConvocatoriaFilters) -> int:
+        where, params = where_clause(filters)
+        connection = self._connect()
+        with connection:
+            pks = [(pk,) for pk, in connection.execute(f"SELECT pk FROM convocatorias WHERE {where}", params)]
+            connection.executemany("DELETE FROM convocatorias_fts WHERE rowid = ?", pks)
+            connection.executemany("DELETE FROM convocatorias WHERE pk = ?", pks)
+        return len(pks)
+
+    def _replace_all_sync(self, documents: Iterable[Document]) -> int:
+        connection = self._connect()
+        count = 0
+        with connection:
+            connection.execute("DELETE FROM convocatorias_fts")
+            connection.execute("DELETE FROM convocatoria_languages")
+            connection.execute("DELETE FROM convocatorias")
+            for document in documents:
+                self._write(connection, {"_id": ObjectId(), **document} if "_id" not in document else document)
+                count += 1
+        return count
+
+    async def insert(self, document: Document) -> Document:
+        return await self._run(self._insert_sync, document)
+
+    async def update(self, doc_id: str, changes: Dict[str, Any]) -> Optional[Tuple[Document, Document]]:
+        return await self._run(self._update_sync, doc_id, changes)
+
+    async def update_many(self, filters: ConvocatoriaFilters, changes: Dict[str, Any]) -> int:
+        return await self._run(self._update_many_sync, filters, changes)
+
+    async def delete(self, doc_id: str) -> Optional[Document]:
+        return await self._run(self._delete_sync, doc_id)
+
+    async def delete_many(self, filters: ConvocatoriaFilters) -> int:
+        return await self._run(self._delete_many_sync, filters)
+
+    async def replace_all(self, documents: Iterable[Document]) -> int:
+        """Reemplaza el catálogo en una sola transacción (los lectores ven el anterior hasta el final)."""
+        return await self._run(self._replace_all_sync, documents)
+
+    # --- Estadísticas ---
+
+    def _stats_sync(self) -> Dict[str, Any]:
+        connection = self._connect()
+        counts: Dict[str, Any] = {"total": connection.execute("SELECT count(*) FROM convocatorias").fetchone()[0]}
+        for bucket, column in STATS_COLUMNS.items():
+            counts[bucket] = {}
+            for value, n in connection.execute(f"SELECT {column}, count(*) FROM convocatorias GROUP BY {column}"):
+                key = stats.bucket_key(value)
+                counts[bucket][key] = counts[bucket].get(key, 0) + n
+        return counts
+
+    async def stats(self) -> Dict[str, Any]:
+        # Con el catálogo local un GROUP BY por dimensión es suficiente: no se materializa
+        return stats.present({**await self._run(self._stats_sync), "updatedAt": None})
+
+
+async def _main(path: str) -> int:
+    from .loader import _keyed_chunks, validate_chunk
+    from .repository import SQLITE_PATH
+
+    repository = SqliteRepository(SQLITE_PATH)
+    documents, failures = [], 0
+    for chunk in _keyed_chunks(path, 1000):
+        valid, errors = validate_chunk(chunk)
+        documents.extend(valid)
+        failures += len(errors)
+    count = await repository.replace_all(documents)
+    await repository.close()
+    print(f"✅ {count} convocatorias cargadas en {SQLITE_PATH} ({failures} con errores)")
+    return 0
+
+
+if __name__ == "__main__":
+    from .loader import DEFAULT_FILE
+
+    if len(sys.argv) < 2 or sys.argv[1] != "load":
+        print("Uso: python -m app.sqlite_repository load [archivo]")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_FILE)))
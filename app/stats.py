@@ -0,0 +1,170 @@
+"""
+Estadísticas materializadas del catálogo.
+
+Los conteos por país, año de suscripción, tipo de convenio y estado se guardan en un
+documento por versión del catálogo (colección `catalog_stats`, `_id` = nombre de la
+colección). Cada escritura aplica solo su diferencia con un `$inc`, así que leer las
+estadísticas es leer un documento, sin importar el tamaño del catálogo.
+
+Uso como script:
+    python -m app.stats rebuild   # recalcula desde cero con una agregación
+    python -m app.stats verify    # compara lo materializado con un recálculo
+"""
+import asyncio
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+STATS_COLLECTION = "catalog_stats"
+
+# Campo del documento que agrupa cada conteo
+DIMENSIONS = {
+    "byCountry": "country",
+    "byYear": "subscriptionYear",
+    "byType": "agreementType",
+    "byState": "state",
+}
+MISSING = "(sin dato)"
+
+
+def _stats_collection(collection):
+    return collection.database.get_collection(STATS_COLLECTION)
+
+
+def bucket_key(value: Any) -> str:
+    """Valor como clave de subdocumento (MongoDB no admite '.' ni '$' inicial en los nombres)."""
+    text = str(value).strip() if value not in (None, "") else MISSING
+    return text.replace(".", "·").lstrip("$") or MISSING
+
+
+def document_counts(document: Optional[Dict[str, Any]], sign: int = 1) -> Counter:
+    """Rutas `$inc` que aporta un documento (con signo)."""
+    counts: Counter = Counter()
+    if document is None:
+        return counts
+    counts["total"] += sign
+    for bucket, field in DIMENSIONS.items():
+        counts[f"{bucket}.{bucket_key(document.get(field))}"] += sign
+    return counts
+
+
+def delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Diferencia de conteos entre dos versiones de un documento (sin entradas en cero)."""
+    counts = document_counts(after)
+    counts.update(document_counts(before, -1))
+    return {path: n for path, n in counts.items() if n}
+
+
+async def matched_groups(collection, match: Dict[str, Any]) -> List[Tuple[Dict[str, Any], int]]:
+    """Combinaciones de valores de las dimensiones entre los documentos de `match`, con su cantidad."""
+    group = {"_id": {field: f"${field}" for field in DIMENSIONS.values()}, "count": {"$sum": 1}}
+    return [(doc["_id"], doc["count"]) async for doc in collection.aggregate([{"$match": match}, {"$group": group}])]
+
+
+def bulk_delta(groups: List[Tuple[Dict[str, Any], int]], changes: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Diferencia de conteos de aplicar `changes` (un `$set`; None = borrar) a todos los grupos."""
+    counts: Counter = Counter()
+    for values, count in groups:
+        after = None if changes is None else {**values, **changes}
+        for path, n in delta(values, after).items():
+            counts[path] += n * count
+    return {path: n for path, n in counts.items() if n}
+
+
+async def apply_counts(collection, increments: Dict[str, int]) -> None:
+    if not increments:
+        return
+    await _stats_collection(collection).update_one(
+        {"_id": collection.name},
+        {"$inc": increments, "$set": {"updatedAt": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def apply_change(collection, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+    """Aplica a las estadísticas una escritura puntual (inserción, edición o borrado)."""
+    await apply_counts(collection, delta(before, after))
+
+
+async def compute(collection) -> Dict[str, Any]:
+    """Recalcula todos los conteos con una sola agregación (`$facet`)."""
+    facets = {bucket: [{"$sortByCount": f"${field}"}] for bucket, field in DIMENSIONS.items()}
+    facets["total"] = [{"$count": "n"}]
+    result = (await collection.aggregate([{"$facet": facets}]).to_list(length=1))[0]
+    stats: Dict[str, Any] = {"total": result["total"][0]["n"] if result["total"] else 0}
+    for bucket in DIMENSIONS:
+        stats[bucket] = {}
+        for group in result[bucket]:
+            key = bucket_key(group["_id"])
+            stats[bucket][key] = stats[bucket].get(key, 0) + group["count"]
+    return stats
+
+
+async def rebuild(collection) -> Dict[str, Any]:
+    """Reemplaza las estadísticas materializadas por un recálculo completo."""
+    stats = await compute(collection)
+    await _stats_collection(collection).replace_one(
+        {"_id": collection.name},
+        {**stats, "updatedAt": datetime.now(timezone.utc)},
+        upsert=True,
+    )
+    return stats
+
+
+def _sorted(counts: Dict[str, int], by_key: bool = False) -> Dict[str, int]:
+    items = [(key, n) for key, n in counts.items() if n > 0]
+    items.sort(key=(lambda item: item[0]) if by_key else (lambda item: (-item[1], item[0])))
+    return dict(items)
+
+
+def present(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Formato de respuesta: sin conteos en cero, por frecuencia (los años en orden)."""
+    return {
+        "total": stats.get("total", 0),
+        **{bucket: _sorted(stats.get(bucket, {}), by_key=bucket == "byYear") for bucket in DIMENSIONS},
+        "updatedAt": stats.get("updatedAt"),
+    }
+
+
+async def read(collection) -> Dict[str, Any]:
+    """Estadísticas de la versión activa (un documento); se calculan la primera vez si no existen."""
+    stats = await _stats_collection(collection).find_one({"_id": collection.name})
+    if stats is None:
+        stats = await rebuild(collection)
+    return present(stats)
+
+
+async def verify(collection) -> List[str]:
+    """Diferencias entre las estadísticas materializadas y un recálculo (vacío si coinciden)."""
+    stored = await _stats_collection(collection).find_one({"_id": collection.name}) or {}
+    fresh = await compute(collection)
+    differences = []
+    if stored.get("total", 0) != fresh["total"]:
+        differences.append(f"total: {stored.get('total', 0)} != {fresh['total']}")
+    for bucket in DIMENSIONS:
+        materialized = {k: n for k, n in stored.get(bucket, {}).items() if n}
+        for key in sorted(set(materialized) | set(fresh[bucket])):
+            if materialized.get(key, 0) != fresh[bucket].get(key, 0):
+                differences.append(f"{bucket}.{key}: {materialized.get(key, 0)} != {fresh[bucket].get(key, 0)}")
+    return differences
+
+
+async def _main(command: str) -> int:
+    from .database import get_active_convocatoria_collection
+
+    collection = await get_active_convocatoria_collection()
+    if command == "verify":
+        differences = await verify(collection)
+        for difference in differences:
+            print(f"❌ {difference}")
+        print("✅ Estadísticas al día" if not differences else f"{len(differences)} diferencias")
+        return 1 if differences else 0
+    stats = await rebuild(collection)
+    print(f"✅ Estadísticas recalculadas: {stats['total']} convocatorias")
+    return 0
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    sys.exit(asyncio.run(_main(command)))
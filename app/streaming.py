@@ -0,0 +1,62 @@
+"""
+Respuestas JSON en streaming para páginas grandes.
+
+En lugar de leer toda la página con `to_list`, validarla y serializarla de una vez, el
+cursor se recorre por lotes y cada lote se escribe como un fragmento del arreglo JSON.
+El primer byte sale en cuanto llega el primer lote y la memoria máxima depende del tamaño
+del lote, no del de la página.
+"""
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List
+
+from pydantic import TypeAdapter
+
+from .models import Convocatoria
+
+# Documentos por lote (también es el `batch_size` del cursor)
+STREAM_BATCH_SIZE = 200
+# Tamaño máximo de página: hasta `MAX_PAGE_SIZE` sin streaming, hasta este valor con streaming
+STREAM_MAX_LIMIT = 10_000
+MAX_PAGE_SIZE = 200
+
+_ITEM_ADAPTER = TypeAdapter(Convocatoria)
+
+
+async def prefetch(documents: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Lee ya el primer documento (así un error de la base ocurre antes de enviar cabeceras)
+    y devuelve un iterador con todos los documentos.
+    """
+    iterator = documents.__aiter__()
+    try:
+        first = [await iterator.__anext__()]
+    except StopAsyncIteration:
+        first = []
+
+    async def chained():
+        for document in first:
+            yield document
+        async for document in iterator:
+            yield document
+
+    return chained()
+
+
+def _encode_batch(documents: List[Dict[str, Any]]) -> bytes:
+    return b",".join(
+        _ITEM_ADAPTER.dump_json(_ITEM_ADAPTER.validate_python(doc), by_alias=True) for doc in documents
+    )
+
+
+async def stream_json_array(documents: AsyncIterable[Dict[str, Any]], batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Serializa `documents` como un arreglo JSON, emitiendo un fragmento por lote."""
+    yield b"["
+    batch: List[Dict[str, Any]] = []
+    first = True
+    async for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield (b"" if first else b",") + _encode_batch(batch)
+            first, batch = False, []
+    if batch:
+        yield (b"" if first else b",") + _encode_batch(batch)
+    yield b"]"
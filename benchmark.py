@@ -0,0 +1,709 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del backend de convocatorias.
+
+Uso:
+    python benchmark.py preprocess [--records 1000000]
+    python benchmark.py recommend [--docs 100000]
+    python benchmark.py similar [--docs 10000]
+    python benchmark.py stream [--page 10000]
+    python benchmark.py links [--links 5000] [--hosts 50]
+    python benchmark.py alerts [--searches 1000000]
+    python benchmark.py storage [--docs 20000] [--mongo]
+    python benchmark.py dedupe [--docs 100000]
+    python benchmark.py audit [--writes 2000] [--latency-ms 2] [--mongo]
+    python benchmark.py startup [--runs 5]
+    python benchmark.py sort [--docs 50000]
+    python benchmark.py jobs [--docs 50000]
+"""
+import argparse
+import json
+import os
+import random
+import asyncio
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RAW_FILE = "DataConvenios.json"
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+
+def synthetic_records(count, seed=42):
+    """Genera registros crudos a partir del archivo real, variando institución y vigencia."""
+    with open(RAW_FILE, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    rng = random.Random(seed)
+    for i in range(count):
+        record = dict(base[i % len(base)])
+        # ~5.000 instituciones distintas, con variantes de mayúsculas como en el archivo real
+        variant = rng.randrange(5000)
+        institution = f"{base[variant % len(base)].get('institution', '')} {variant // len(base)}"
+        record["institution"] = institution.upper() if variant % 7 == 0 else institution
+        record["validity"] = f"{rng.choice(MONTHS)} - {rng.randrange(1995, 2035)}"
+        yield record
+
+
+def bench_preprocess(records):
+    from app.preprocessing import preprocess
+
+    print(f"🧪 Pre-procesamiento de {records:,} registros sintéticos")
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "raw.ndjson")
+        target = os.path.join(tmp, "clean.ndjson")
+        with open(source, "w", encoding="utf-8") as f:
+            for record in synthetic_records(records):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+        size_mb = os.path.getsize(source) / 1e6
+
+        # Piso del proceso: solo leer y decodificar el JSON de entrada
+        from app.loader import iter_json_records
+
+        started = time.perf_counter()
+        for _ in iter_json_records(source):
+            pass
+        decoding = time.perf_counter() - started
+
+        started = time.perf_counter()
+        report = preprocess(source, target)
+        elapsed = time.perf_counter() - started
+
+    print(f"   Entrada: {size_mb:.0f} MB, salida: {report['written']:,} registros")
+    print(f"   Tiempo: {elapsed:.2f}s ({report['read'] / elapsed:,.0f} registros/s), "
+          f"de los que {decoding:.2f}s son leer y decodificar el JSON")
+
+
+def catalogue_documents(count):
+    """Documentos del catálogo limpio repetidos hasta `count`, cada uno con su `_id`."""
+    from bson import ObjectId
+
+    with open("DataConvenios_limpio.ndjson", "r", encoding="utf-8") as f:
+        base = [json.loads(line) for line in f if line.strip()]
+    return [{**base[i % len(base)], "_id": ObjectId()} for i in range(count)]
+
+
+def bench_recommend(docs, queries=200):
+    from app.recommender import Recommender, profile_terms
+
+    print(f"🧪 Recomendación sobre {docs:,} convocatorias")
+    documents = catalogue_documents(docs)
+
+    index = Recommender()
+    started = time.perf_counter()
+    index.build(documents)
+    print(f"   Construcción: {time.perf_counter() - started:.2f}s ({index.matrix.shape[1]:,} términos)")
+
+    profiles = [
+        profile_terms(["Arte y diseño", "arquitectura"], ["Alemán"], ["Europa"]),
+        profile_terms(["ingeniería", "investigación"], ["Inglés"], ["Asia", "Canadá"]),
+        profile_terms(["salud pública"], ["Portugués"], ["América Latina"]),
+    ]
+    started = time.perf_counter()
+    for i in range(queries):
+        index.recommend(profiles[i % len(profiles)], k=10)
+    elapsed = time.perf_counter() - started
+    print(f"   Consulta: {elapsed / queries * 1000:.2f} ms por perfil (k=10)")
+
+
+def bench_similar(docs, lookups=10_000):
+    from app.similarity import NeighbourTable
+
+    print(f"🧪 Tabla de similares sobre {docs:,} convocatorias")
+    documents = catalogue_documents(docs)
+    table = NeighbourTable()
+    started = time.perf_counter()
+    table.install(table.compute(documents))
+    print(f"   Cálculo: {time.perf_counter() - started:.2f}s "
+          f"({table.neighbours.nbytes + table.scores.nbytes:,} bytes de tabla)")
+
+    ids = [str(doc["_id"]) for doc in documents]
+    started = time.perf_counter()
+    for i in range(lookups):
+        table.similar(ids[i % len(ids)])
+    print(f"   Búsqueda: {(time.perf_counter() - started) / lookups * 1e6:.1f} µs")
+
+
+def bench_stream(page):
+    from typing import List
+    from pydantic import TypeAdapter
+    from app.models import Convocatoria
+    from app.streaming import STREAM_BATCH_SIZE, stream_json_array
+
+    print(f"🧪 Serialización de una página de {page:,} convocatorias")
+    base = catalogue_documents(min(page, 1000))
+
+    async def cursor():
+        # Como el cursor de Motor: los documentos llegan por lotes y no quedan en memoria
+        for i in range(page):
+            if i % STREAM_BATCH_SIZE == 0:
+                await asyncio.sleep(0)
+            yield dict(base[i % len(base)])
+
+    async def materialized():
+        documents = [doc async for doc in cursor()]  # to_list
+        adapter = TypeAdapter(List[Convocatoria])
+        return [adapter.dump_json(adapter.validate_python(documents), by_alias=True)]
+
+    async def streamed():
+        size, first = 0, None
+        async for chunk in stream_json_array(cursor()):
+            if first is None and len(chunk) > 1:  # primer lote con datos (no solo "[")
+                first = time.perf_counter()
+            size += len(chunk)
+        return first, size
+
+    for name, run in (("to_list + dump", materialized), ("streaming", streamed)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        first = result[0] - started if name == "streaming" else elapsed
+        print(f"   {name:15s} pico: {peak / 1e6:6.1f} MB  primer byte: {first * 1000:7.1f} ms  total: {elapsed:.2f}s")
+
+
+async def _stand_in_server(reader, writer):
+    """Servidor HTTP mínimo: /dead/* responde 404, el resto 200 con ETag (304 si coincide)."""
+    try:
+        while True:
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            path = lines[0].split(" ")[1]
+            headers = {k.lower(): v.strip() for k, _, v in (line.partition(":") for line in lines[1:] if line)}
+            if path.startswith("/dead"):
+                status = "404 Not Found"
+            elif headers.get("if-none-match") == '"v1"':
+                status = "304 Not Modified"
+            else:
+                status = "200 OK"
+            writer.write(f"HTTP/1.1 {status}\r\nETag: \"v1\"\r\nContent-Length: 0\r\n\r\n".encode())
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def bench_links(links, hosts):
+    from app.links import LinkChecker
+
+    print(f"🧪 Verificación de {links:,} enlaces en {hosts} hosts locales")
+
+    async def run():
+        server = await asyncio.start_server(_stand_in_server, "0.0.0.0", 0, backlog=4096)
+        port = server.sockets[0].getsockname()[1]
+        urls = [
+            f"http://127.0.0.{1 + i % hosts}:{port}/{'dead' if i % 10 == 0 else 'ok'}/{i}"
+            for i in range(links)
+        ]
+        async with server:
+            checker = LinkChecker()
+            started = time.perf_counter()
+            first = await checker.check_many(urls, {})
+            elapsed = time.perf_counter() - started
+            broken = sum(1 for result in first.values() if result["status"] == "broken")
+            print(f"   Primera pasada: {elapsed:.2f}s ({links / elapsed:,.0f} enlaces/s), rotos: {broken:,}")
+
+            started = time.perf_counter()
+            second = await checker.check_many(urls, first)
+            elapsed = time.perf_counter() - started
+            not_modified = sum(1 for result in second.values() if result["httpStatus"] == 304)
+            print(f"   Pasada condicional: {elapsed:.2f}s, 304: {not_modified:,}")
+            await checker.aclose()
+
+    asyncio.run(run())
+
+
+def bench_alerts(searches, documents=2_000):
+    from datetime import date
+
+    from app.models import ConvocatoriaFilters
+    from app.normalization import prepare_document
+    from app.saved_searches import SavedSearchIndex
+
+    print(f"🧪 Búsquedas inversas contra {searches:,} búsquedas guardadas")
+    docs = [prepare_document(doc) for doc in catalogue_documents(documents)]
+    rng = random.Random(7)
+    values = {
+        "country": sorted({doc["country"] for doc in docs}),
+        "language": sorted({lang for doc in docs for lang in doc.get("languages", [])}),
+        "state": ["Vigente", "No Vigente"],
+        "agreement_type": sorted({doc["agreementType"] for doc in docs}),
+    }
+    index = SavedSearchIndex()
+    started = time.perf_counter()
+    for i in range(searches):
+        # Entre uno y tres filtros de igualdad; una de cada diez con un filtro residual
+        params = rng.sample(list(values), rng.randint(1, 3))
+        filters = {param: rng.choice(values[param]) for param in params}
+        if i % 10 == 0:
+            filters["valid_after"] = date(rng.randrange(2020, 2030), 1, 1)
+        index.add(str(i), f"user{i % 50_000}", ConvocatoriaFilters(**filters))
+    elapsed = time.perf_counter() - started
+    print(f"   Índice: {elapsed:.2f}s, {len(index):,} búsquedas en {index.stats()['keys']:,} combinaciones")
+
+    timings, matched = [], 0
+    for doc in docs:
+        started = time.perf_counter()
+        matched += len(index.match(doc))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"   Por documento: mediana {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms, "
+          f"{matched / len(docs):,.0f} búsquedas coincidentes en promedio")
+
+
+async def _time_storage(repository, docs, rounds=300):
+    """Latencia promedio (µs) de las operaciones de lectura y escritura de un repositorio."""
+    from app.models import ConvocatoriaFilters
+    from app.normalization import prepare_document
+
+    rng = random.Random(3)
+    ids = [str(doc["_id"]) for doc in docs]
+    operations = {
+        "get por id": lambda: repository.get(rng.choice(ids)),
+        "get_many (100 ids)": lambda: repository.get_many(rng.sample(ids, 100)),
+        "listado país+estado": lambda: repository.list(ConvocatoriaFilters(country="Alemania", state="Vigente"), 0, 20),
+        "listado idioma": lambda: repository.list(ConvocatoriaFilters(language="Francés"), 0, 20),
+        "listado texto": lambda: repository.list(ConvocatoriaFilters(q="arquitectura"), 0, 20),
+        "estadísticas": lambda: repository.stats(),
+        "insert": lambda: repository.insert(prepare_document({k: v for k, v in rng.choice(docs).items() if k != "_id"})),
+    }
+    results = {}
+    for name, operation in operations.items():
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await operation()
+        results[name] = (time.perf_counter() - started) / rounds * 1e6
+    return results
+
+
+def bench_storage(count, mongo):
+    from app.normalization import prepare_document
+    from app.sqlite_repository import SqliteRepository
+
+    print(f"🧪 Backends de almacenamiento con {count:,} convocatorias")
+    docs = [prepare_document(doc) for doc in catalogue_documents(count)]
+    results = {}
+
+    async def run_sqlite():
+        with tempfile.TemporaryDirectory() as tmp:
+            repository = SqliteRepository(os.path.join(tmp, "bench.db"))
+            started = time.perf_counter()
+            await repository.replace_all(docs)
+            print(f"   Carga sqlite: {time.perf_counter() - started:.2f}s")
+            results["sqlite"] = await _time_storage(repository, docs)
+            await repository.close()
+
+    async def run_mongo():
+        from app import stats
+        from app.database import get_database
+        from app.indexes import ensure_indexes
+        from app.repository import MongoRepository
+
+        database = get_database()
+        collection = database.get_collection("bench_storage")
+        await collection.drop()
+        started = time.perf_counter()
+        await collection.insert_many([dict(doc) for doc in docs], ordered=False)
+        await ensure_indexes(collection)
+        await stats.rebuild(collection)
+        print(f"   Carga mongo: {time.perf_counter() - started:.2f}s")
+        try:
+            results["mongo"] = await _time_storage(MongoRepository(lambda: collection), docs)
+        finally:
+            await collection.drop()
+            await database.get_collection(stats.STATS_COLLECTION).delete_one({"_id": collection.name})
+
+    asyncio.run(run_sqlite())
+    if mongo:
+        asyncio.run(run_mongo())
+    backends = list(results)
+    print(f"   {'operación':<22}" + "".join(f"{backend:>12}" for backend in backends) + "  (µs por operación)")
+    for name in results["sqlite"]:
+        print(f"   {name:<22}" + "".join(f"{results[backend][name]:>12,.0f}" for backend in backends))
+
+
+def _variant(name, rng):
+    """Otra forma de escribir la misma institución (como las del archivo de la DRE)."""
+    import unicodedata
+
+    choice = rng.randrange(4)
+    if choice == 0:
+        return name.upper()
+    if choice == 1:
+        return "".join(c for c in unicodedata.normalize("NFD", name) if unicodedata.category(c) != "Mn")
+    if choice == 2:
+        return f"{name} ({''.join(word[0] for word in name.split()).upper()})"
+    return name.replace(" de ", " ", 1) if " de " in name else f"{name} - Sede"
+
+
+def bench_dedupe(docs, duplicate_rate=0.1):
+    from app.dedupe import DuplicateIndex
+
+    print(f"🧪 Duplicados (MinHash + LSH) sobre {docs:,} convocatorias")
+    rng = random.Random(11)
+    syllables = ["ba", "cor", "del", "fi", "gra", "lu", "man", "no", "per", "ri", "sal", "ta", "ven", "zu"]
+    kinds = ["Universidad", "Instituto", "Universidade", "University of", "Escuela"]
+    documents, planted = catalogue_documents(docs), 0
+    for i, doc in enumerate(documents):
+        if i and rng.random() < duplicate_rate:
+            # Variante de una convocatoria anterior: mismo país y Props, otra escritura
+            original = documents[rng.randrange(i)]
+            doc.update(country=original["country"], Props=original.get("Props"),
+                       institution=_variant(original["institution"], rng))
+            planted += 1
+        else:
+            words = ["".join(rng.choices(syllables, k=rng.randint(2, 4))).capitalize() for _ in range(2)]
+            doc["institution"] = f"{rng.choice(kinds)} de {' '.join(words)}"
+
+    index = DuplicateIndex()
+    started = time.perf_counter()
+    index.build(documents)
+    stats = index.stats()
+    print(f"   Cálculo: {time.perf_counter() - started:.2f}s, {stats['clusters']:,} grupos, "
+          f"{stats['duplicates']:,} sobrantes ({planted:,} variantes sembradas)")
+
+    timings = []
+    for doc in rng.sample(documents, 1_000):
+        started = time.perf_counter()
+        index.find(doc)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"   Verificación al crear: mediana {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p99 {timings[int(len(timings) * 0.99)] * 1000:.2f} ms")
+
+
+class _RemoteCollection:
+    """Colección que solo simula la ida y vuelta a la base (para medir sin `mongod`)."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.documents = 0
+
+    async def insert_one(self, document):
+        await asyncio.sleep(self.latency)
+        self.documents += 1
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.latency)
+        self.documents += len(documents)
+
+
+def bench_audit(writes, latency_ms, mongo):
+    from types import SimpleNamespace
+
+    from app.audit import AuditLog, entry
+    from app.normalization import prepare_document, prepare_update
+    from app.sqlite_repository import SqliteRepository
+
+    print(f"🧪 Auditoría de {writes:,} ediciones (sqlite local; auditoría "
+          f"{'en MongoDB' if mongo else f'con {latency_ms} ms de ida y vuelta'})")
+    # Mismos atributos que `TokenData` (sin exigir SECRET_KEY para importar app.security)
+    user = SimpleNamespace(sub="bench", role="administrador")
+    docs = [prepare_document(doc) for doc in catalogue_documents(1_000)]
+    rng = random.Random(5)
+
+    async def run(collection):
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            repository = SqliteRepository(os.path.join(tmp, "bench.db"))
+            await repository.replace_all(docs)
+            ids = [str(doc["_id"]) for doc in docs]
+            log = AuditLog()
+            writer = asyncio.create_task(log.run(collection))
+
+            async def without_audit(before, after):
+                return None
+
+            async def synchronous(before, after):
+                await collection.insert_one(entry(user, "update", before, after))
+
+            async def write_behind(before, after):
+                await log.record(entry(user, "update", before, after))
+
+            for name, audit in [("sin auditoría", without_audit), ("insert_one por escritura", synchronous),
+                                ("write-behind", write_behind)]:
+                timings = []
+                for i in range(writes):
+                    started = time.perf_counter()
+                    before, after = await repository.update(rng.choice(ids), prepare_update({"state": rng.choice(["Vigente", "No Vigente"])}))
+                    await audit(before, after)
+                    timings.append(time.perf_counter() - started)
+                timings.sort()
+                results[name] = (timings[len(timings) // 2] * 1000, timings[int(len(timings) * 0.99)] * 1000)
+            started = time.perf_counter()
+            writer.cancel()
+            await log.flush(collection)
+            flushed = time.perf_counter() - started
+            await repository.close()
+        for name, (p50, p99) in results.items():
+            print(f"   {name:<26} mediana {p50:.2f} ms, p99 {p99:.2f} ms")
+        print(f"   Escritas en segundo plano: {log.written:,} entradas "
+              f"(vaciado final {flushed * 1000:.0f} ms, esperas por cola llena: {log.waited}, descartadas: {log.dropped})")
+
+    async def run_mongo():
+        from app.database import get_database
+
+        collection = get_database().get_collection("bench_audit")
+        await collection.drop()
+        try:
+            await run(collection)
+        finally:
+            await collection.drop()
+
+    asyncio.run(run_mongo() if mongo else run(_RemoteCollection(latency_ms / 1000)))
+
+
+def bench_sort(count, rounds=50):
+    from app.models import ConvocatoriaFilters
+    from app.normalization import prepare_document
+    from app.repository import _sort_value
+    from app.sorting import SORT_ORDERS, format_sort, parse_sort, resolve_sort, sort_key, top_k
+    from app.sqlite_repository import SqliteRepository, select_clause
+
+    print(f"🧪 Listado ordenado sobre {count:,} convocatorias (sqlite)")
+    docs = [prepare_document(doc) for doc in catalogue_documents(count)]
+
+    async def pages():
+        with tempfile.TemporaryDirectory() as tmp:
+            repository = SqliteRepository(os.path.join(tmp, "sort.db"))
+            await repository.replace_all(docs)
+            filters = ConvocatoriaFilters()
+            print(f"   {'orden':<38}{'con índice':>12}{'sin índice':>12}  (µs por página de 20)")
+            for order in SORT_ORDERS:
+                resolved = resolve_sort(order, text=False)
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    await repository.list(filters, 0, 20, resolved)
+                indexed = (time.perf_counter() - started) / rounds * 1e6
+                # `+columna` impide que SQLite use el índice: ordena todo el catálogo en memoria
+                select, params = select_clause(filters, resolved)
+                head, order_by = select.split(" ORDER BY ")
+                sql = f"SELECT document {head} ORDER BY " + ", ".join("+" + term for term in order_by.split(", ")) + " LIMIT 20"
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    await repository._run(repository._fetch, sql, params)
+                unindexed = (time.perf_counter() - started) / rounds * 1e6
+                print(f"   {format_sort(order):<38}{indexed:>12,.0f}{unindexed:>12,.0f}")
+            await repository.close()
+
+    asyncio.run(pages())
+
+    # Búsqueda de texto ordenada: top-k con heap acotado frente a ordenar todas las coincidencias
+    rng = random.Random(5)
+    rows = [{"_id": doc["_id"], "norm": {"institution": doc["norm"].get("institution")},
+             "subscriptionYear": doc.get("subscriptionYear"), "_score": rng.random()} for doc in docs]
+    order = resolve_sort(parse_sort("relevance,-subscriptionYear"), text=True)
+    key = sort_key(order, _sort_value)
+
+    async def stream():
+        for row in rows:
+            yield row
+
+    for name, run in (("top-k (heap)", lambda: asyncio.run(top_k(stream(), 100, key))),
+                      ("orden completo", lambda: sorted(rows, key=key)[:100])):
+        tracemalloc.start()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"   Texto + relevance, 100 primeras de {count:,}, {name}: {elapsed * 1000:,.0f} ms, pico {peak / 1e6:.1f} MB")
+
+
+class _JobCollection:
+    """Colección `jobs` en memoria con las operaciones que usa `JobRunner`."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def insert_one(self, document):
+        from types import SimpleNamespace
+
+        document["_id"] = len(self.documents) + 1
+        self.documents[document["_id"]] = document
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=None):
+        queued = [doc for doc in self.documents.values() if doc["status"] == query["status"]]
+        if not queued:
+            return None
+        document = min(queued, key=lambda doc: doc["createdAt"])
+        document.update(update["$set"])
+        return document
+
+    async def update_one(self, query, update):
+        self.documents[query["_id"]].update(update["$set"])
+
+    async def update_many(self, query, update):
+        from types import SimpleNamespace
+
+        return SimpleNamespace(modified_count=0)
+
+
+def bench_jobs(docs):
+    from types import SimpleNamespace
+
+    from app import jobs
+    from app.dedupe import find_clusters
+
+    print(f"🧪 Retraso del event loop mientras corre una tarea de duplicados sobre {docs:,} convocatorias")
+    documents = [{key: doc.get(key) for key in ("_id", "institution", "country", "Props")}
+                 for doc in catalogue_documents(docs)]
+
+    @jobs.job("bench_inline")
+    async def inline(context, params):
+        return {"clusters": len(find_clusters(documents))}
+
+    @jobs.job("bench_process")
+    async def in_process(context, params):
+        return {"clusters": len(await context.in_process(find_clusters, documents))}
+
+    async def run(kind):
+        collection, runner = _JobCollection(), jobs.JobRunner(concurrency=1, process_workers=1)
+        # El pool de procesos se inicia antes de medir (como en un servidor que ya corrió alguna tarea)
+        await asyncio.get_running_loop().run_in_executor(runner.processes, find_clusters, documents[:10])
+        worker = asyncio.create_task(runner.run(collection))
+        await asyncio.sleep(0)
+        job = await runner.submit(collection, kind, {}, SimpleNamespace(sub="bench"))
+        lags, started = [], time.perf_counter()
+        while job["status"] in ("queued", "running"):
+            tick = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - tick - 0.01)
+        elapsed = time.perf_counter() - started
+        await runner.stop()
+        worker.cancel()
+        lags.sort()
+        return elapsed, lags[len(lags) // 2], lags[-1], job
+
+    for name, kind in [("en el event loop", "bench_inline"), ("en el pool de procesos", "bench_process")]:
+        elapsed, p50, worst, job = asyncio.run(run(kind))
+        print(f"   {name:<24} {job['status']} en {elapsed:.2f}s ({job['result']['clusters']:,} grupos); "
+              f"retraso del loop mediana {p50 * 1000:.1f} ms, peor {worst * 1000:,.0f} ms")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _first_response(env, timeout=60):
+    """Lanza uvicorn y mide hasta la primera respuesta 200 de `GET /convocatorias`."""
+    from urllib.error import URLError
+    from urllib.request import urlopen
+
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/convocatorias?limit=1"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:create_app", "--factory", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError("el servidor no respondió a tiempo")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_startup(runs):
+    from app.normalization import prepare_document
+    from app.sqlite_repository import SqliteRepository
+
+    print(f"🧪 Arranque en frío de la API ({runs} arranques, backend sqlite)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "startup.db")
+
+        async def load():
+            repository = SqliteRepository(path)
+            await repository.replace_all([prepare_document(doc) for doc in catalogue_documents(1_000)])
+            await repository.close()
+
+        asyncio.run(load())
+        env = {**os.environ, "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": path,
+               "SECRET_KEY": os.getenv("SECRET_KEY", "benchmark"), "RATE_LIMIT_ENABLED": "false"}
+
+        code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+        imports = [float(subprocess.run([sys.executable, "-c", code], env=env, capture_output=True,
+                                        text=True, check=True).stdout.split()[-1]) for _ in range(runs)]
+        first = [_first_response(env) for _ in range(runs)]
+
+    print(f"   Importar app.main:          mediana {statistics.median(imports) * 1000:,.0f} ms")
+    print(f"   Hasta la primera respuesta: mediana {statistics.median(first) * 1000:,.0f} ms, "
+          f"peor {max(first) * 1000:,.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del backend de convocatorias")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("preprocess", help="Pre-procesamiento por lotes del archivo de la DRE")
+    p.add_argument("--records", type=int, default=1_000_000)
+    p = sub.add_parser("recommend", help="Construcción y consulta del índice de recomendación")
+    p.add_argument("--docs", type=int, default=100_000)
+    p = sub.add_parser("similar", help="Cálculo y búsqueda en la tabla de similares")
+    p.add_argument("--docs", type=int, default=10_000)
+    p = sub.add_parser("stream", help="Memoria de una página grande con y sin streaming")
+    p.add_argument("--page", type=int, default=10_000)
+    p = sub.add_parser("links", help="Verificador de enlaces contra un servidor HTTP local")
+    p.add_argument("--links", type=int, default=5_000)
+    p.add_argument("--hosts", type=int, default=50)
+    p = sub.add_parser("alerts", help="Búsqueda inversa de búsquedas guardadas para un documento nuevo")
+    p.add_argument("--searches", type=int, default=1_000_000)
+    p = sub.add_parser("storage", help="Comparación de los backends de almacenamiento (sqlite y, con --mongo, MongoDB)")
+    p.add_argument("--docs", type=int, default=20_000)
+    p.add_argument("--mongo", action="store_true")
+    p = sub.add_parser("dedupe", help="Agrupación de convocatorias casi duplicadas")
+    p.add_argument("--docs", type=int, default=100_000)
+    p = sub.add_parser("audit", help="Latencia de las escrituras con auditoría síncrona y write-behind")
+    p.add_argument("--writes", type=int, default=2_000)
+    p.add_argument("--latency-ms", type=float, default=2.0)
+    p.add_argument("--mongo", action="store_true")
+    p = sub.add_parser("sort", help="Páginas ordenadas con y sin índice, y top-k de búsquedas de texto")
+    p.add_argument("--docs", type=int, default=50_000)
+    p = sub.add_parser("jobs", help="Retraso del event loop con una tarea pesada dentro y fuera del loop")
+    p.add_argument("--docs", type=int, default=50_000)
+    p = sub.add_parser("startup", help="Tiempo de importación y hasta la primera respuesta de un proceso nuevo")
+    p.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "preprocess":
+        bench_preprocess(args.records)
+    elif args.command == "recommend":
+        bench_recommend(args.docs)
+    elif args.command == "similar":
+        bench_similar(args.docs)
+    elif args.command == "stream":
+        bench_stream(args.page)
+    elif args.command == "links":
+        bench_links(args.links, args.hosts)
+    elif args.command == "alerts":
+        bench_alerts(args.searches)
+    elif args.command == "storage":
+        bench_storage(args.docs, args.mongo)
+    elif args.command == "dedupe":
+        bench_dedupe(args.docs)
+    elif args.command == "audit":
+        bench_audit(args.writes, args.latency_ms, args.mongo)
+    elif args.command == "sort":
+        bench_sort(args.docs)
+    elif args.command == "jobs":
+        bench_jobs(args.docs)
+    elif args.command == "startup":
+        bench_startup(args.runs)
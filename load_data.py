@@ -1,52 +1,69 @@
-import json
+import argparse
 import asyncio
+from contextlib import nullcontext
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
-from app.models import ConvocatoriaCreate  # Importamos el modelo para validar
+from app.indexes import ensure_indexes
+from app import catalog
+from app.loader import DEFAULT_FILE, changed_count, load_catalogue, reload_blue_green
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
-async def load_data():
+async def load_data(path: str, workers: int = None, dry_run: bool = False, blue_green: bool = False):
     client = AsyncIOMotorClient(MONGO_URI)
     db = client[DATABASE_NAME]
-    collection = db.get_collection("convocatorias")
-
-    # Opcional: Limpiar la colección antes de insertar nuevos datos
-    await collection.delete_many({})
-    print("Colección 'convocatorias' limpiada.")
-
-    # Cargar los datos desde el archivo JSON pre-procesado
-    with open('DataConvenios_limpio.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    convocatorias_to_insert = []
-    for item in data:
-        try:
-            # Validar cada item con Pydantic antes de agregarlo
-            convocatoria_model = ConvocatoriaCreate(**item)
-            convocatorias_to_insert.append(convocatoria_model.dict(by_alias=True))
-        except Exception as e:
-            print(f"Error de validación en el item: {item}. Error: {e}")
-
-    if convocatorias_to_insert:
-        result = await collection.insert_many(convocatorias_to_insert)
-        print(f"Se insertaron {len(result.inserted_ids)} documentos en la base de datos.")
-    else:
-        print("No se encontraron documentos válidos para insertar.")
-
-    # Crear el índice de texto si no existe
-    await collection.create_index([
-        ("institution", "text"),
-        ("country", "text"),
-        ("properties", "text")
-    ], name="search_index")
-    print("Índice de texto asegurado.")
+
+    # Trabaja sobre la versión activa del catálogo
+    await catalog.refresh(db)
+    collection = db.get_collection(catalog.active_collection_name())
+
+    if blue_green:
+        # Construye una versión nueva y la activa solo si queda completa
+        report = await reload_blue_green(db, path, workers=workers)
+        print(f"Versión {report['version']} activa en '{report['collection']}': "
+              f"{report['expected']} documentos del archivo ({report['elapsed']}s)")
+        client.close()
+        return
+
+    # Los índices van primero: el cargador busca por `sourceKey`
+    await ensure_indexes(collection)
+    print("Índices asegurados.")
+
+    # Sincroniza la colección con el archivo: solo inserta, actualiza o borra lo que cambió.
+    # Lo que se escriba en la versión activa durante una recarga blue/green se perdería: se pide permiso
+    try:
+        async with nullcontext() if dry_run else catalog.write_lease(db):
+            report = await load_catalogue(collection, path, workers=workers, dry_run=dry_run)
+    except catalog.WritesBlocked:
+        print(f"Hay una recarga blue/green en curso ({catalog.building()}); intente cuando termine.")
+        client.close()
+        return
+    for error in report["errors"]:
+        print(f"Error de validación: {error}")
+    print(
+        f"{'[simulación] ' if dry_run else ''}Leídos: {report['read']}, inválidos: {report['invalid']}, "
+        f"insertados: {report['inserted']}, adoptados de cargas anteriores: {report['adopted']}, "
+        f"actualizados: {report['updated']}, sin cambios: {report['unchanged']}, eliminados: {report['deleted']}, "
+        f"copias duplicadas eliminadas: {report['duplicates']} ({report['elapsed']}s)"
+    )
+    changed = changed_count(report)
+    if changed and not dry_run:
+        # La API reconstruye sus cachés (recomendaciones, similares, duplicados) al ver el cambio en el puntero
+        await catalog.publish_bulk_change("load", changed, db)
 
     client.close()
 
 if __name__ == "__main__":
-    asyncio.run(load_data())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carga incremental del catálogo de convocatorias")
+    parser.add_argument("--file", default=DEFAULT_FILE, help="Archivo JSON o NDJSON pre-procesado")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para validar (0 = sin pool)")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula los cambios sin escribir")
+    parser.add_argument("--blue-green", action="store_true", help="Carga sobre una colección nueva y la activa al final")
+    args = parser.parse_args()
+    if args.dry_run and args.blue_green:
+        parser.error("--dry-run no se puede combinar con --blue-green (la recarga blue/green siempre escribe)")
+    asyncio.run(load_data(args.file, workers=args.workers, dry_run=args.dry_run, blue_green=args.blue_green))
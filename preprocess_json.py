@@ -1,30 +1,18 @@
-import json
-import re
+import argparse
 
-# Carga el archivo JSON original
-with open('DataConvenios.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+from app.preprocessing import preprocess
 
-processed_data = []
-for item in data:
-    # Ignorar registros incompletos o malformados
-    if not item.get("institution") or not item.get("country"):
-        print(f"Omitiendo registro incompleto: {item}")
-        continue
-    
-    # Pre-procesamiento del campo de idiomas
-    languages_str = item.get("languages", "").strip()
-    if languages_str:
-        # Usa una expresión regular para dividir por espacios o comas, y limpia los resultados
-        languages_list = [lang.strip().capitalize() for lang in re.split(r'[\s,]+', languages_str) if lang.strip()]
-        item["languages"] = list(set(languages_list)) # Usa set para eliminar duplicados
-    else:
-        item["languages"] = []
+# Pre-procesa el archivo crudo de la DRE y genera un NDJSON listo para `load_data.py`:
+# idiomas normalizados contra el vocabulario, instituciones unificadas, vigencia
+# interpretada como fecha (`validUntil`) y estado derivado de esa fecha.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-procesamiento de DataConvenios.json")
+    parser.add_argument("--source", default="DataConvenios.json", help="Archivo crudo (JSON o NDJSON)")
+    parser.add_argument("--target", default="DataConvenios_limpio.ndjson", help="Archivo NDJSON de salida")
+    args = parser.parse_args()
 
-    processed_data.append(item)
-
-# Guarda el archivo JSON procesado y limpio
-with open('DataConvenios_limpio.json', 'w', encoding='utf-8') as f:
-    json.dump(processed_data, f, indent=4, ensure_ascii=False)
-
-print("Pre-procesamiento completado. Se ha generado 'DataConvenios_limpio.json'")
\ No newline at end of file
+    report = preprocess(args.source, args.target)
+    print(f"Omitidos por incompletos: {report['skipped']}")
+    print(f"Variantes de institución unificadas: {report['institutionVariants']}")
+    print(f"Pre-procesamiento completado en {report['elapsed']}s. "
+          f"Se ha generado '{args.target}' con {report['written']} registros")
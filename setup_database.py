@@ -16,6 +16,10 @@ import pymongo
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
+from app import catalog
+from app.indexes import ensure_indexes
+from app.loader import DEFAULT_FILE, changed_count, load_catalogue
+
 # Cargar variables de entorno
 load_dotenv()
 
@@ -38,6 +42,9 @@ class DatabaseSetup:
             print(f"✅ Conexión exitosa a MongoDB: {MONGO_URI}")
             
             self.database = self.client[DATABASE_NAME]
+
+            # Si ya hubo recargas blue/green, se trabaja sobre la versión activa del catálogo
+            await catalog.refresh(self.database)
             return True
             
         except Exception as e:
@@ -53,19 +60,18 @@ class DatabaseSetup:
         print(f"📁 Creando base de datos '{DATABASE_NAME}'...")
         
         # Crear colección (se crea automáticamente al insertar el primer documento)
-        collection = self.database.get_collection("convocatorias")
+        collection = self.database.get_collection(catalog.active_collection_name())
         
         # Verificar si ya existe y tiene datos
         count = await collection.count_documents({})
         if count > 0:
-            print(f"⚠️  La colección ya existe con {count} documentos")
-            response = input("¿Deseas limpiar y repoblar la base de datos? (y/N): ").lower()
-            if response == 'y' or response == 'yes':
-                await collection.delete_many({})
-                print("🧹 Colección limpiada")
-            else:
-                print("✅ Manteniendo datos existentes")
-                return True
+            print(f"⚠️  La colección ya existe con {count} documentos; se sincronizará solo lo que cambió")
+
+            # Los documentos cargados por versiones anteriores no tienen `sourceKey`: el cargador
+            # adopta los que coinciden con un registro del archivo en lugar de duplicarlos
+            legacy = await collection.count_documents({"sourceKey": {"$exists": False}})
+            if legacy > 0:
+                print(f"ℹ️  {legacy} documentos sin clave de origen; se adoptarán los que coincidan con el archivo")
         
         return True
     
@@ -73,55 +79,44 @@ class DatabaseSetup:
         """Crear índices optimizados para búsquedas"""
         print("🔍 Creando índices de búsqueda...")
         
-        collection = self.database.get_collection("convocatorias")
-        
-        # Índice de texto completo para búsquedas
-        try:
-            await collection.create_index([
-                ("institution", "text"),
-                ("country", "text"),
-                ("properties", "text"),
-                ("agreementType", "text")
-            ], name="search_index")
-            print("✅ Índice de texto creado")
-        except Exception as e:
-            print(f"⚠️  Índice ya existe o error: {e}")
-        
-        # Índice por país para filtros rápidos
-        try:
-            await collection.create_index("country", name="country_index")
-            print("✅ Índice por país creado")
-        except Exception as e:
-            print(f"⚠️  Índice por país ya existe o error: {e}")
-        
-        # Índice por estado (vigente/no vigente)
+        collection = self.database.get_collection(catalog.active_collection_name())
+
+        # Los índices se definen en un único registro (app/indexes.py) compartido con la app
         try:
-            await collection.create_index("state", name="state_index")
-            print("✅ Índice por estado creado")
+            report = await ensure_indexes(collection)
+            for action, names in report.items():
+                if names:
+                    print(f"✅ Índices {action}: {', '.join(names)}")
         except Exception as e:
-            print(f"⚠️  Índice por estado ya existe o error: {e}")
+            print(f"⚠️  Error creando índices: {e}")
     
     async def load_data(self):
         """Cargar datos desde el archivo JSON"""
-        data_file = Path("DataConvenios_limpio.json")
+        data_file = Path(DEFAULT_FILE)
         
         if not data_file.exists():
             print(f"❌ Archivo de datos no encontrado: {data_file}")
-            print("💡 Asegúrate de que 'DataConvenios_limpio.json' esté en el directorio del proyecto")
+            print(f"💡 Asegúrate de que '{DEFAULT_FILE}' esté en el directorio del proyecto (python preprocess_json.py)")
             return False
         
         print(f"📊 Cargando datos desde {data_file}...")
         
         try:
-            with open(data_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            collection = self.database.get_collection("convocatorias")
-            
-            print(f"📝 Insertando {len(data)} convocatorias...")
-            result = await collection.insert_many(data)
-            
-            print(f"✅ {len(result.inserted_ids)} convocatorias insertadas exitosamente")
+            collection = self.database.get_collection(catalog.active_collection_name())
+
+            # Carga incremental: valida cada registro y aplica solo las diferencias
+            # (con permiso de escritura: durante una recarga blue/green los cambios se perderían)
+            async with catalog.write_lease(self.database):
+                report = await load_catalogue(collection, str(data_file))
+            for error in report["errors"]:
+                print(f"⚠️  Registro inválido omitido: {error}")
+
+            print(f"✅ Insertadas: {report['inserted']}, adoptadas: {report['adopted']}, actualizadas: {report['updated']}, "
+                  f"sin cambios: {report['unchanged']}, eliminadas: {report['deleted']}")
+            changed = changed_count(report)
+            if changed:
+                # Si la API está corriendo, reconstruye sus cachés al ver el cambio en el puntero
+                await catalog.publish_bulk_change("load", changed, self.database)
             return True
             
         except Exception as e:
@@ -132,7 +127,7 @@ class DatabaseSetup:
         """Verificar que los datos se cargaron correctamente"""
         print("🔍 Verificando datos cargados...")
         
-        collection = self.database.get_collection("convocatorias")
+        collection = self.database.get_collection(catalog.active_collection_name())
         
         # Contar documentos
         total_count = await collection.count_documents({})
@@ -213,8 +208,8 @@ def check_prerequisites():
     print("🔍 Verificando prerrequisitos...")
     
     # Verificar archivo de datos
-    if not Path("DataConvenios_limpio.json").exists():
-        print("❌ Archivo 'DataConvenios_limpio.json' no encontrado")
+    if not Path(DEFAULT_FILE).exists():
+        print(f"❌ Archivo '{DEFAULT_FILE}' no encontrado")
         return False
     
     # Verificar módulos requeridos
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Pruebas de contrato de los repositorios del catálogo (app/repository.py).
+
+Las mismas verificaciones corren contra cada backend, así que ambos se comportan igual
+para las rutas:
+
+    python test_repository.py            # SQLite en un archivo temporal
+    python test_repository.py --mongo    # además MongoDB (MONGO_URI / DATABASE_NAME),
+                                         # en una colección temporal que se elimina al final
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date
+
+from app.models import ConvocatoriaFilters
+from app.normalization import prepare_document, prepare_update
+from app.sorting import parse_sort, resolve_sort
+
+SAMPLE = [
+    {"country": "Alemania", "institution": "Technische Universität Berlin", "languages": ["Alemán", "Inglés"],
+     "state": "Vigente", "validity": "March - 2030", "agreementType": "Intercambio", "subscriptionYear": "2019",
+     "subscriptionLevel": "Universidad Nacional de Colombia", "Props": "Ingeniería\nArquitectura sostenible"},
+    {"country": "Alemania", "institution": "Universität Hamburg", "languages": ["Alemán"],
+     "state": "No Vigente", "validity": "January - 2020", "agreementType": "Marco", "subscriptionYear": "2015",
+     "subscriptionLevel": "Facultad de Ciencias", "Props": "Biología marina"},
+    {"country": "Francia", "institution": "Université de Lyon", "languages": ["Francés", "Inglés"],
+     "state": "Vigente", "validity": "Indefinido", "agreementType": "Intercambio", "subscriptionYear": "2021",
+     "subscriptionLevel": "Universidad Nacional de Colombia", "Props": "Derecho internacional", "hasBrokenLinks": True},
+    {"country": "México", "institution": "UNAM", "languages": ["Español"],
+     "state": "Vigente", "validity": "December - 2027", "agreementType": "Intercambio", "subscriptionYear": "2021",
+     "subscriptionLevel": "Sede Medellín", "Props": "Arquitectura colonial", "hasBrokenLinks": False},
+]
+
+failures = 0
+
+
+def check(name: str, condition: bool, detail: str = "") -> None:
+    global failures
+    if condition:
+        print(f"   ✅ {name}")
+    else:
+        failures += 1
+        print(f"   ❌ {name} {detail}")
+
+
+def institutions(documents) -> list:
+    return sorted(doc["institution"] for doc in documents)
+
+
+async def run_contract(repository) -> None:
+    print(f"\n🧪 Contrato del repositorio: {repository.backend}")
+    await repository.prepare()
+    created = [await repository.insert(prepare_document(dict(doc))) for doc in SAMPLE]
+    ids = [str(doc["_id"]) for doc in created]
+
+    # Lecturas por id
+    check("insert devuelve el documento con _id y campos derivados",
+          all("_id" in doc and "norm" in doc for doc in created) and created[1]["state"] == "No Vigente")
+    found = await repository.get(ids[0])
+    check("get por id", found is not None and found["institution"] == SAMPLE[0]["institution"])
+    check("get de un id inexistente devuelve None", await repository.get("0" * 24) is None)
+    many = await repository.get_many([ids[2], "0" * 24, ids[0]])
+    check("get_many indexa por id y omite los inexistentes", sorted(many) == sorted([ids[0], ids[2]]))
+    check("get_many vacío", await repository.get_many([]) == {})
+
+    # Filtros del listado
+    async def listed(**filters):
+        return institutions(await repository.list(ConvocatoriaFilters(**filters), 0, 100))
+
+    check("sin filtros", len(await listed()) == 4)
+    check("país sin tildes ni mayúsculas", await listed(country="mexico") == ["UNAM"])
+    check("idioma (uno de la lista)", await listed(language="INGLÉS") == ["Technische Universität Berlin", "Université de Lyon"])
+    check("estado + país", await listed(state="vigente", country="Alemania") == ["Technische Universität Berlin"])
+    check("tipo de convenio", await listed(agreement_type="marco") == ["Universität Hamburg"])
+    check("prefijo de nivel de suscripción", len(await listed(subscription_level="universidad nac")) == 2)
+    check("prefijo con caracteres especiales no falla", await listed(subscription_level="(.*") == [])
+    check("vigentes hasta una fecha o después", await listed(valid_after=date(2028, 1, 1)) == ["Technische Universität Berlin"])
+    check("vencen antes de una fecha", await listed(expiring_before=date(2021, 1, 1)) == ["Universität Hamburg"])
+    check("enlaces rotos", await listed(broken_links=True) == ["Université de Lyon"])
+    check("sin enlaces rotos", await listed(broken_links=False) == ["UNAM"])
+    check("texto (cualquier palabra)", await listed(q="arquitectura") == ["Technische Universität Berlin", "UNAM"])
+    check("texto + filtro", await listed(q="arquitectura", country="mexico") == ["UNAM"])
+
+    # Orden (con índice sin `q`, top-k en memoria con `q`)
+    async def ordered(sort, skip=0, limit=100, **filters):
+        order = resolve_sort(parse_sort(sort), text=bool(filters.get("q")))
+        return [doc["institution"] for doc in await repository.list(ConvocatoriaFilters(**filters), skip, limit, order)]
+
+    by_institution = ["Technische Universität Berlin", "UNAM", "Universität Hamburg", "Université de Lyon"]
+    check("orden por institución (sin tildes ni mayúsculas)", await ordered("institution") == by_institution)
+    check("orden inverso", await ordered("-institution,subscriptionYear") == by_institution[::-1])
+    check("orden por año descendente y desempate por institución",
+          await ordered("-subscriptionYear") == ["UNAM", "Université de Lyon", "Technische Universität Berlin", "Universität Hamburg"])
+    check("orden + filtro", await ordered("-subscriptionYear", country="alemania") == ["Technische Universität Berlin", "Universität Hamburg"])
+    check("orden por vigencia (sin fecha primero)",
+          await ordered("validUntil") == ["Université de Lyon", "Universität Hamburg", "UNAM", "Technische Universität Berlin"])
+    check("orden por vigencia de las vigentes", await ordered("-validUntil", state="vigente") == ["Technische Universität Berlin", "UNAM", "Université de Lyon"])
+    check("orden con skip y limit", await ordered("institution", 1, 2) == by_institution[1:3])
+    streamed = [doc["institution"] async for doc in repository.iterate(ConvocatoriaFilters(), 1, 3, 2, resolve_sort(parse_sort("institution"), False))]
+    check("iterate ordenado por lotes", streamed == by_institution[1:4], str(streamed))
+    check("texto ordenado por un campo", await ordered("-subscriptionYear", q="arquitectura") == ["UNAM", "Technische Universität Berlin"])
+    check("texto ordenado por relevancia", await ordered("relevance", q="arquitectura ingeniería") == ["Technische Universität Berlin", "UNAM"])
+    check("texto ordenado por relevancia inversa", await ordered("-relevance", q="arquitectura ingeniería") == ["UNAM", "Technische Universität Berlin"])
+    check("texto ordenado con skip y limit", await ordered("relevance,institution", 1, 1, q="arquitectura ingeniería") == ["UNAM"])
+
+    page = await repository.list(ConvocatoriaFilters(), 1, 2)
+    everything = await repository.list(ConvocatoriaFilters(), 0, 100)
+    check("skip y limit", [doc["_id"] for doc in page] == [doc["_id"] for doc in everything[1:3]])
+    streamed = [doc async for doc in repository.iterate(ConvocatoriaFilters(), 1, 3, 2)]
+    check("iterate por lotes devuelve lo mismo que list", [doc["_id"] for doc in streamed] == [doc["_id"] for doc in everything[1:4]])
+    scanned = await repository.scan({"country": 1})
+    check("scan con proyección", len(scanned) == 4 and all(set(doc) <= {"_id", "country"} for doc in scanned))
+
+    # Escrituras
+    result = await repository.update(ids[1], {"country": "Austria", "norm.country": "austria"})
+    check("update devuelve (antes, después)", result is not None and result[0]["country"] == "Alemania" and result[1]["country"] == "Austria")
+    check("update se refleja en los filtros", await listed(country="austria") == ["Universität Hamburg"])
+    check("update de un id inexistente devuelve None", await repository.update("0" * 24, {"country": "X"}) is None)
+
+    summary = await repository.stats()
+    check("stats: total y conteos", summary["total"] == 4 and summary["byCountry"].get("Alemania") == 1 and summary["byCountry"].get("Austria") == 1)
+    check("stats: años en orden", list(summary["byYear"]) == sorted(summary["byYear"]))
+
+    deleted = await repository.delete(ids[3])
+    check("delete devuelve el documento borrado", deleted is not None and deleted["institution"] == "UNAM")
+    check("delete se refleja en las lecturas", await repository.get(ids[3]) is None and await listed(q="colonial") == [])
+    check("delete de un id inexistente devuelve None", await repository.delete(ids[3]) is None)
+    check("stats tras borrar", (await repository.stats())["total"] == 3)
+
+    # Escrituras masivas por filtros
+    vigentes = ConvocatoriaFilters(state="vigente")
+    check("count con filtros", await repository.count(vigentes) == 2)
+    updated = await repository.update_many(vigentes, prepare_update({"state": "No Vigente"}))
+    check("update_many devuelve las coincidencias", updated == 2)
+    check("update_many se refleja en los filtros", len(await listed(state="no vigente")) == 3)
+    check("update_many sin coincidencias", await repository.update_many(vigentes, prepare_update({"state": "Vigente"})) == 0)
+    summary = await repository.stats()
+    check("stats tras update_many", summary["byState"] == {"No Vigente": 3}, str(summary["byState"]))
+    check("delete_many devuelve las coincidencias", await repository.delete_many(ConvocatoriaFilters(country="francia")) == 1)
+    check("delete_many se refleja en las lecturas", await repository.get(ids[2]) is None and await listed(q="derecho") == [])
+    summary = await repository.stats()
+    check("stats tras delete_many", summary["total"] == 2 and "Francia" not in summary["byCountry"], str(summary))
+
+
+async def run_sqlite() -> None:
+    from app.sqlite_repository import SqliteRepository
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = SqliteRepository(os.path.join(tmp, "contract.db"))
+        try:
+            await run_contract(repository)
+        finally:
+            await repository.close()
+
+
+async def run_mongo() -> None:
+    from app import stats
+    from app.database import get_database
+    from app.indexes import ensure_indexes
+    from app.repository import MongoRepository
+
+    database = get_database()
+    collection = database.get_collection(f"contract_test_{uuid.uuid4().hex[:8]}")
+    await ensure_indexes(collection)
+    try:
+        await run_contract(MongoRepository(lambda: collection))
+    finally:
+        await collection.drop()
+        await database.get_collection(stats.STATS_COLLECTION).delete_one({"_id": collection.name})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pruebas de contrato de los repositorios")
+    parser.add_argument("--mongo", action="store_true", help="Correr también contra MongoDB")
+    args = parser.parse_args()
+
+    asyncio.run(run_sqlite())
+    if args.mongo:
+        asyncio.run(run_mongo())
+    print("\n✅ Todos los backends cumplen el contrato" if not failures else f"\n❌ {failures} verificaciones fallidas")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,1251 @@
+#!/usr/bin/env python3
+"""
+Verificaciones de los servicios de la API que no dependen de MongoDB (admisión, enlaces, cargador, vencimientos, ...).
+
+    python test_services.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Dict
+
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+
+from app.normalization import prepare_document
+
+SAMPLE = [
+    {"country": "Alemania", "institution": f"Universität {i}", "languages": ["Alemán"], "state": "Vigente",
+     "validity": "March - 2030", "agreementType": "Intercambio", "subscriptionYear": "2019",
+     "subscriptionLevel": "Universidad Nacional de Colombia", "Props": "Ingeniería"}
+    for i in range(250)
+]
+
+failures = 0
+
+
+def check(name: str, condition: bool, detail: str = "") -> None:
+    global failures
+    if condition:
+        print(f"   ✅ {name}")
+    else:
+        failures += 1
+        print(f"   ❌ {name} {detail}")
+
+
+async def asgi_request(app, method: str, path: str, query: str = "", on_body=None, body: bytes = b"",
+                       headers=()) -> int:
+    """Llama a la app ASGI directamente; `on_body` se invoca con cada fragmento enviado."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "client": ("127.0.0.1", 5000), "server": ("test", 80),
+        "headers": [(b"content-type", b"application/json"), *((k.encode(), v.encode()) for k, v in headers)],
+    }
+    status = {}
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message["type"] == "http.response.body" and on_body is not None:
+            on_body(message)
+
+    await app(scope, receive, send)
+    return status.get("code", 0)
+
+
+async def run_admission() -> None:
+    from jose import jwt
+
+    from app import admission, catalog
+    from app.main import create_app
+    from app.models import ConvocatoriaFilters
+    from app.security import ALGORITHM, SECRET_KEY
+    from app.repository import set_repository
+    from app.sqlite_repository import SqliteRepository
+    from app.streaming import stream_json_array
+
+    print("🧪 Admisión")
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = SqliteRepository(os.path.join(tmp, "services.db"))
+        await repository.prepare()
+        await repository.replace_all([prepare_document(doc) for doc in SAMPLE])
+        set_repository(repository)
+        try:
+            app = create_app()
+            in_use = []
+
+            def record(message):
+                if message.get("body"):
+                    in_use.append(admission.metrics["inUse"])
+
+            # Con lotes de STREAM_BATCH_SIZE: "[", un fragmento por lote y "]"
+            code = await asgi_request(app, "GET", "/convocatorias/", f"stream=true&limit={len(SAMPLE)}", record)
+            check("streaming responde 200", code == 200, str(code))
+            check("el streaming conserva su cupo mientras envía el cuerpo",
+                  len(in_use) > 2 and all(value > 0 for value in in_use), str(in_use))
+            check("el cupo se libera al terminar el streaming", admission.metrics["inUse"] == 0,
+                  str(admission.metrics["inUse"]))
+
+            in_use.clear()
+            code = await asgi_request(app, "GET", "/convocatorias/", "limit=20", record)
+            check("una página normal libera su cupo", code == 200 and admission.metrics["inUse"] == 0)
+
+            print("🧪 Páginas en streaming")
+            bodies = {}
+
+            async def body_of(query):
+                chunks = []
+                code = await asgi_request(app, "GET", "/convocatorias/", query, lambda m: chunks.append(m["body"]))
+                bodies[query] = b"".join(chunks)
+                return code
+
+            await body_of("limit=200&sort=country,institution")
+            await body_of("stream=true&limit=200&sort=country,institution")
+            streamed = json.loads(bodies["stream=true&limit=200&sort=country,institution"])
+            check("el arreglo en streaming es la misma página", len(streamed) == 200
+                  and streamed == json.loads(bodies["limit=200&sort=country,institution"]))
+            await body_of("stream=true&limit=500&country=Atlántida")
+            check("sin resultados es un arreglo vacío", bodies["stream=true&limit=500&country=Atlántida"] == b"[]")
+            code = await body_of(f"limit={len(SAMPLE)}")
+            check("una página grande sin streaming se rechaza", code == 400, str(code))
+
+            async def documents():
+                for doc in await repository.list(ConvocatoriaFilters(), 0, 5):
+                    yield doc
+
+            chunks = [chunk async for chunk in stream_json_array(documents(), batch_size=2)]
+            check("un fragmento por lote", len(chunks) == 5 and len(json.loads(b"".join(chunks))) == 5, str(len(chunks)))
+
+            print("🧪 Escrituras durante una recarga blue/green")
+            token = jwt.encode({"sub": "admin@test", "role": "administrador"}, SECRET_KEY, algorithm=ALGORITHM)
+            auth = [("authorization", f"Bearer {token}")]
+            doc_id = str((await repository.list(ConvocatoriaFilters(), 0, 1))[0]["_id"])
+            patch = json.dumps({"Props": "Medicina"}).encode()
+            catalog._set_building({"building": "convocatorias_nueva", "buildStartedAt": datetime.now(timezone.utc)})
+            try:
+                code = await asgi_request(app, "PATCH", f"/convocatorias/{doc_id}", body=patch, headers=auth)
+                check("una edición durante la recarga responde 503", code == 503, str(code))
+                code = await asgi_request(app, "DELETE", "/convocatorias/", "country=Alemania", headers=auth)
+                check("un borrado masivo durante la recarga responde 503", code == 503, str(code))
+                code = await asgi_request(app, "GET", "/convocatorias/", "limit=5")
+                check("las lecturas siguen respondiendo", code == 200, str(code))
+                catalog._set_building({"building": "convocatorias_vieja",
+                                       "buildStartedAt": datetime.now(timezone.utc) - timedelta(days=1)})
+                check("una marca abandonada no bloquea las escrituras", not catalog.writes_blocked())
+            finally:
+                catalog._set_building({})
+            code = await asgi_request(app, "PATCH", f"/convocatorias/{doc_id}", body=patch, headers=auth)
+            check("sin recarga la edición se aplica", code == 200, str(code))
+        finally:
+            await repository.close()
+
+
+async def run_rate_limit() -> None:
+    print("🧪 Límite de tasa")
+    from jose import jwt
+
+    from app import admission
+    from app.security import ALGORITHM, SECRET_KEY
+
+    backend = admission.InMemoryBackend(max_clients=2)
+    taken = [(await backend.take("a", 4, capacity=10, rate=2))[0] for _ in range(3)]
+    check("el bucket admite hasta su capacidad", taken == [True, True, False], str(taken))
+    allowed, retry = await backend.take("a", 4, capacity=10, rate=2)
+    check("sin fichas indica cuándo reintentar", not allowed and abs(retry - 1.0) < 0.01, str(retry))
+    tokens, updated = backend._buckets["a"]
+    backend._buckets["a"] = (tokens, updated - 1)
+    check("las fichas se recuperan con el tiempo", (await backend.take("a", 4, capacity=10, rate=2))[0])
+    await backend.take("b", 1, capacity=10, rate=2)
+    await backend.take("c", 1, capacity=10, rate=2)
+    check("se olvida al cliente más antiguo", list(backend._buckets) == ["b", "c"], str(list(backend._buckets)))
+
+    expires = int(time.time()) + 1
+    token = jwt.encode({"sub": "ana@test", "exp": expires}, SECRET_KEY, algorithm=ALGORITHM)
+    check("un token válido identifica al cliente", admission._token_subject(token) == "ana@test")
+    await asyncio.sleep(max(0.0, expires - time.time()) + 0.1)
+    check("vencido deja de identificarlo aunque esté en caché", admission._token_subject(token) is None)
+    check("un token inválido no identifica", admission._token_subject(token[:-2] + "xx") is None)
+
+
+async def run_singleflight() -> None:
+    from app.singleflight import SingleFlight
+
+    print("🧪 Lecturas agrupadas (single-flight)")
+    flights = SingleFlight()
+    calls = []
+    release = asyncio.Event()
+
+    async def query(value):
+        calls.append(value)
+        await release.wait()
+        if value == "falla":
+            raise RuntimeError("sin base")
+        return value
+
+    same = [asyncio.create_task(flights.do("a", lambda: query("a"))) for _ in range(5)]
+    other = asyncio.create_task(flights.do("b", lambda: query("b")))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*same, other)
+    check("las lecturas iguales en vuelo hacen una sola consulta", calls == ["a", "b"], str(calls))
+    check("y todas reciben el resultado", results == ["a"] * 5 + ["b"], str(results))
+    check("al terminar se libera la clave", flights.stats()["inFlight"] == 0)
+    await flights.do("a", lambda: query("a"))
+    check("una lectura posterior vuelve a consultar", calls.count("a") == 2, str(calls))
+
+    release.clear()
+    first = asyncio.create_task(flights.do("c", lambda: query("c")))
+    second = asyncio.create_task(flights.do("c", lambda: query("c")))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    check("cancelar la primera petición no cancela a las que esperan", await second == "c")
+
+    failing = [asyncio.create_task(flights.do("x", lambda: query("falla"))) for _ in range(3)]
+    errors = await asyncio.gather(*failing, return_exceptions=True)
+    check("el error se comparte", all(isinstance(e, RuntimeError) for e in errors) and calls.count("falla") == 1,
+          str(errors))
+    stats = flights.stats()
+    check("las métricas cuentan consultas y agrupadas", stats["executed"] == 5 and stats["coalesced"] == 7, str(stats))
+
+
+async def run_circuit() -> None:
+    from fastapi import HTTPException
+    from pymongo.errors import PyMongoError
+
+    from app import circuit
+
+    print("🧪 Circuit breaker")
+    breaker = circuit.CircuitBreaker("prueba", failure_threshold=2, slow_call_seconds=0.05, open_seconds=0.1,
+                                     timeout=0.2)
+    calls = []
+
+    async def fails():
+        calls.append("falla")
+        raise PyMongoError("sin base")
+
+    async def works(delay=0.0):
+        calls.append("responde")
+        await asyncio.sleep(delay)
+        return "ok"
+
+    async def attempt(fn):
+        try:
+            return await breaker.call(fn)
+        except Exception as e:
+            return type(e).__name__
+
+    await attempt(fails)
+    check("un fallo no abre el circuito", breaker.state == circuit.CLOSED)
+    await attempt(fails)
+    check("los fallos seguidos lo abren", breaker.state == circuit.OPEN and breaker.times_opened == 1)
+    calls.clear()
+    check("abierto no se consulta la base", await attempt(works) == "CircuitOpenError" and not calls)
+
+    await asyncio.sleep(0.1)
+    probe = asyncio.create_task(attempt(lambda: works(0.01)))
+    await asyncio.sleep(0)
+    check("semiabierto deja pasar una sola prueba", breaker.state == circuit.HALF_OPEN
+          and await attempt(works) == "CircuitOpenError")
+    check("una prueba correcta lo cierra", await probe == "ok" and breaker.state == circuit.CLOSED
+          and breaker.failures == 0)
+
+    await attempt(fails)
+    await attempt(fails)
+    await asyncio.sleep(0.1)
+    await attempt(fails)
+    check("una prueba fallida lo vuelve a abrir", breaker.state == circuit.OPEN and breaker.times_opened == 3,
+          str(breaker.stats()))
+
+    breaker = circuit.CircuitBreaker("prueba", failure_threshold=2, slow_call_seconds=0.05, open_seconds=0.1,
+                                     timeout=0.2)
+    check("una llamada lenta responde", await attempt(lambda: works(0.06)) == "ok")
+    check("pero cuenta como fallo", breaker.failures == 1)
+    check("un timeout también", await attempt(lambda: works(0.3)) == "TimeoutError" and breaker.state == circuit.OPEN)
+
+    breaker = circuit.CircuitBreaker("prueba", failure_threshold=1)
+
+    async def bug():
+        raise ValueError("error de la app")
+
+    await attempt(bug)
+    check("los errores que no son de la base no cuentan", breaker.state == circuit.CLOSED and breaker.failures == 0)
+
+    print("🧪 Respuestas desactualizadas")
+    key = ("prueba", "circuito")
+    check("con la base se guarda la respuesta", await circuit.with_snapshot(key, works) == ("ok", None))
+    value, age = await circuit.with_snapshot(key, fails)
+    check("sin base se responde la copia con su antigüedad", value == "ok" and age is not None and age >= 0)
+    try:
+        await circuit.with_snapshot(("prueba", "sin copia"), fails)
+        check("sin copia responde 503", False)
+    except HTTPException as e:
+        check("sin copia responde 503", e.status_code == 503 and "Retry-After" in e.headers)
+
+
+async def run_links() -> None:
+    import httpx
+
+    from app.links import BROKEN, OK, LinkChecker
+
+    print("🧪 Verificación de enlaces")
+    transport = httpx.MockTransport(lambda request: httpx.Response(200 if request.url.path != "/missing" else 404))
+    checker = LinkChecker(client=httpx.AsyncClient(transport=transport))
+    urls = ["http://example.org/ok", "http://example.org/missing", "http://[::1", "http://exa mple.org/\x00"]
+    try:
+        results = await checker.check_many(urls, {})
+    except Exception as e:
+        results = {}
+        check("una URL mal formada no corta la verificación", False, repr(e))
+    finally:
+        await checker.aclose()
+    if results:
+        check("enlace sano", results[urls[0]]["status"] == OK, str(results[urls[0]]))
+        check("enlace con 404", results[urls[1]]["status"] == BROKEN, str(results[urls[1]]))
+        check("URL con host inválido cuenta como rota", results[urls[2]]["status"] == BROKEN, str(results[urls[2]]))
+        check("URL que httpx rechaza cuenta como rota", results[urls[3]]["status"] == BROKEN, str(results[urls[3]]))
+
+
+class _Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length=None):
+        return list(self.documents)
+
+    def sort(self, key, direction):
+        return _Cursor(sorted(self.documents, key=lambda doc: doc[key], reverse=direction < 0))
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+
+
+class _CatalogueCollection:
+    """Colección en memoria con las lecturas que hace `load_catalogue` (para cargas `dry_run`)."""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query, projection):
+        exists = query["sourceKey"]["$exists"]
+        return _Cursor([{key: doc.get(key) for key in ("_id", *projection)}
+                        for doc in self.documents if ("sourceKey" in doc) == exists])
+
+
+async def run_loader() -> None:
+    from bson import ObjectId
+
+    from app.loader import (DEFAULT_FILE, _keyed_chunks, changed_count, iter_json_records, load_catalogue,
+                            validate_chunk)
+    from app.models import ConvocatoriaCreate
+
+    print("🧪 Carga incremental sobre un catálogo anterior al cargador")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalogo.ndjson")
+        records = [record for _, record in zip(range(200), iter_json_records(DEFAULT_FILE))]
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        # Lo que dejaba el `load_data.py` original: los registros validados, sin clave de origen
+        legacy = [{**ConvocatoriaCreate(**record).dict(by_alias=True), "_id": ObjectId()} for record in records]
+        keyed = [doc for chunk in _keyed_chunks(path, 500) for doc in validate_chunk(chunk)[0]]
+        api_created = {**legacy[0], "_id": ObjectId(), "institution": "Creada desde la API"}
+
+        report = await load_catalogue(_CatalogueCollection(legacy + [api_created]), path, workers=0, dry_run=True)
+        check("los documentos de la carga anterior se adoptan", report["adopted"] == len(records), str(report["adopted"]))
+        check("no se insertan copias", report["inserted"] == 0, str(report["inserted"]))
+        check("el total esperado no se duplica", report["expected"] == len(records), str(report["expected"]))
+
+        report = await load_catalogue(_CatalogueCollection(legacy + keyed + [api_created]), path, workers=0, dry_run=True)
+        check("un catálogo ya duplicado elimina las copias sin clave", report["duplicates"] == len(records),
+              str(report["duplicates"]))
+        check("sin adopciones ni inserciones si ya hay clave", report["adopted"] == report["inserted"] == 0)
+
+        print("🧪 Diferencias de una carga incremental")
+        report = await load_catalogue(_CatalogueCollection(keyed), path, workers=0, dry_run=True)
+        check("el mismo archivo no cambia nada", report["unchanged"] == len(records) and changed_count(report) == 0,
+              str(report))
+
+        edited = [dict(record) for record in records[:-1]]
+        edited[0]["Props"] = "Medicina"
+        edited[1]["Props"] = 42  # inválido: no reemplaza la versión cargada ni la borra
+        edited.append(dict(records[2]))  # un convenio repetido es otro registro
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in edited)
+        report = await load_catalogue(_CatalogueCollection(keyed), path, workers=0, dry_run=True)
+        check("el registro editado se actualiza", report["updated"] == 1, str(report["updated"]))
+        check("el que ya no está en el archivo se borra", report["deleted"] == 1, str(report["deleted"]))
+        check("la repetición se inserta con otra clave", report["inserted"] == 1, str(report["inserted"]))
+        check("el inválido se informa y se conserva", report["invalid"] == 1 and report["expected"] == len(records),
+              f"{report['invalid']} {report['expected']}")
+        check("el resto queda igual", report["unchanged"] == len(records) - 3, str(report["unchanged"]))
+
+
+class _ExpiryCollection:
+    """Colección en memoria con lo que usa `expire_agreements`; cada operación cede el control."""
+
+    def __init__(self, documents):
+        self.name = "convocatorias"
+        self.documents = documents
+        self.increments = []
+        self.updates = 0
+        self.database = self
+
+    def get_collection(self, name):
+        return self
+
+    def _matches(self, document, query):
+        for field, condition in query.items():
+            value = document
+            for part in field.split("."):
+                value = (value or {}).get(part)
+            if isinstance(condition, dict):
+                if not value < condition["$lt"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    async def aggregate(self, pipeline):
+        await asyncio.sleep(0)
+        match, group = pipeline[0]["$match"], pipeline[1]["$group"]
+        counts = Counter(doc["expiry"]["previousState"] for doc in self.documents if self._matches(doc, match))
+        check("se agrupa por el estado anterior", group["_id"] == "$expiry.previousState", str(group))
+        for state, count in counts.items():
+            yield {"_id": state, "count": count}
+
+    async def update_many(self, query, update):
+        # Pipeline de un `$set`: los valores "$campo" se leen del documento antes de cambiarlo
+        await asyncio.sleep(0)
+        self.updates += 1
+        matched = [doc for doc in self.documents if self._matches(doc, query)]
+        changes = update[0]["$set"]
+        for doc in matched:
+            doc["expiry"] = {key: doc[value[1:]] if isinstance(value, str) and value.startswith("$") else value
+                             for key, value in changes["expiry"].items()}
+            doc["state"] = changes["state"]
+            doc["norm"]["state"] = changes["norm.state"]
+        return SimpleNamespace(modified_count=len(matched))
+
+    async def update_one(self, query, update, upsert=False):
+        self.increments.append(update["$inc"])
+
+
+async def run_expiry() -> None:
+    from app import catalog
+    from app.expiry import expire_agreements
+
+    print("🧪 Vencimiento programado en dos réplicas a la vez")
+    past, future = datetime(2020, 1, 1), datetime(2999, 1, 1)
+    documents = [{"state": state, "norm": {"state": "vigente"}, "validUntil": until}
+                 for state, until in [("Vigente", past), ("Vigente", past), ("vigente", past), ("Vigente", future)]]
+    collection = _ExpiryCollection(documents)
+    published = []
+    catalog.on_bulk_change(lambda operation, count: published.append((operation, count)))
+    results = await asyncio.gather(expire_agreements(collection), expire_agreements(collection))
+    totals = Counter()
+    for increments in collection.increments:
+        totals.update(increments)
+    check("entre las dos réplicas vencen 3 convenios", sum(results) == 3, str(results))
+    check("una sola escritura por corrida", collection.updates == 2, str(collection.updates))
+    check("los vencidos pasan a No Vigente y guardan su estado anterior",
+          [(doc["state"], doc["norm"]["state"], doc.get("expiry", {}).get("previousState")) for doc in documents]
+          == [("No Vigente", "no vigente", "Vigente")] * 2 + [("No Vigente", "no vigente", "vigente"),
+                                                               ("Vigente", "vigente", None)],
+          str(documents))
+    check("las estadísticas descuentan cada convenio una sola vez",
+          totals.get("byState.No Vigente") == 3 and totals.get("byState.Vigente") == -2
+          and totals.get("byState.vigente") == -1, str(dict(totals)))
+    check("se anuncia el cambio masivo para reconstruir las cachés",
+          sum(count for operation, count in published if operation == "expire") == 3, str(published))
+
+
+async def run_saved_search_matching() -> None:
+    from itertools import product
+
+    from app.loader import DEFAULT_FILE, iter_json_records
+    from app.models import ConvocatoriaFilters
+    from app.saved_searches import SavedSearchIndex
+    from app.sqlite_repository import SqliteRepository
+
+    print("🧪 Búsquedas guardadas: coincidencias al revés")
+    records = list(iter_json_records(DEFAULT_FILE))
+    # Combinaciones de filtros del listado, con y sin filtros residuales
+    searches = [
+        ConvocatoriaFilters(**{key: value for key, value in zip(
+            ("country", "language", "state", "agreement_type", "subscription_level", "valid_after"), combo)
+            if value is not None})
+        for combo in product(
+            (None, "Colombia", "alemania", "Francia"),
+            (None, "Inglés", "espanol"),
+            (None, "Vigente", "no vigente"),
+            (None, "Intercambio", "Marco+Intercambio"),
+            (None, "Universidad Nacional", "Facultad de Ciencias"),
+            (None, date(2025, 1, 1)),
+        )
+    ]
+    index = SavedSearchIndex()
+    for number, filters in enumerate(searches):
+        index.add(f"s{number}", "ana", filters)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = SqliteRepository(os.path.join(tmp, "matching.db"))
+        await repository.prepare()
+        await repository.replace_all([prepare_document(dict(record)) for record in records[:200]])
+        try:
+            # Lo que devolvería el listado con los filtros de cada búsqueda es la referencia
+            expected: Dict[str, set] = {}
+            for number, filters in enumerate(searches):
+                for doc in await repository.list(filters, 0, 1000):
+                    expected.setdefault(str(doc["_id"]), set()).add(f"s{number}")
+            documents = await repository.list(ConvocatoriaFilters(), 0, 1000)
+        finally:
+            await repository.close()
+    wrong = [str(doc["_id"]) for doc in documents
+             if {subscription.id for subscription in index.match(doc)} != expected.get(str(doc["_id"]), set())]
+    check(f"cada documento encuentra las mismas búsquedas que el listado ({len(searches)} búsquedas)", not wrong,
+          str(wrong[:5]))
+
+    document = documents[0]
+    matched = index.match(document)
+    check("una edición que ya cumplía no vuelve a avisar", index.newly_matching(document, document) == [])
+    check("un alta avisa a todas las que cumple", len(index.newly_matching(None, document)) == len(matched) > 0)
+    for subscription in matched:
+        index.remove(subscription.id)
+    check("las búsquedas eliminadas dejan de coincidir", index.match(document) == [])
+
+    index = SavedSearchIndex()
+    index.add("q", "ana", ConvocatoriaFilters(q="Ingeniería civil"))
+    check("q coincide con alguna de sus palabras en los campos de texto",
+          [s.id for s in index.match({"institution": "Facultad de Ingeniería", "country": "Chile"})] == ["q"])
+    check("y no coincide sin ninguna", index.match({"institution": "Facultad de Artes", "country": "Chile"}) == [])
+
+
+async def run_saved_searches() -> None:
+    from app import main, saved_searches
+    from app.models import ConvocatoriaFilters, ConvocatoriaUpdate
+    from app.repository import set_repository
+    from app.routes.convocatorias import _update_data, update_convocatorias
+    from app.security import TokenData
+    from app.sqlite_repository import SqliteRepository
+
+    print("🧪 Búsquedas guardadas en ediciones masivas")
+    with tempfile.TemporaryDirectory() as tmp:
+        repository = SqliteRepository(os.path.join(tmp, "saved.db"))
+        await repository.prepare()
+        documents = [dict(doc, agreementType="Práctica") for doc in SAMPLE[:3]] + [dict(SAMPLE[3], country="Francia")]
+        await repository.replace_all([prepare_document(doc) for doc in documents])
+        set_repository(repository)
+        index, outbox = saved_searches.index, saved_searches.outbox
+        reads, iterate = [], repository.iterate
+
+        def counted(filters, *args, **kwargs):
+            reads.append(filters)
+            return iterate(filters, *args, **kwargs)
+
+        repository.iterate = counted
+        limit = saved_searches.BULK_NOTIFY_LIMIT
+        try:
+            index.apply({"_id": "s1", "owner": "ana", "filters": {"country": "Alemania", "agreement_type": "Intercambio"}})
+            index.apply({"_id": "s2", "owner": "luis", "filters": {"country": "Francia", "agreement_type": "Intercambio"}})
+            index.ready = True
+            admin = TokenData(sub="admin", role="admin")
+            germany = ConvocatoriaFilters(country="Alemania")
+            candidates = saved_searches.bulk_candidates(germany, _update_data(ConvocatoriaUpdate(agreementType="Intercambio")))
+            check("solo es candidata la búsqueda compatible con los filtros y el $set", [c.id for c in candidates] == ["s1"],
+                  str(candidates))
+            result = await update_convocatorias(ConvocatoriaUpdate(agreementType="Intercambio"), germany,
+                                                dry_run=False, current_user=admin)
+            check("la edición masiva coincide con 3 convocatorias", result["matched"] == 3, str(result))
+            check("avisa a la búsqueda que empiezan a cumplir", len(outbox) == 3, str(len(outbox)))
+            await update_convocatorias(ConvocatoriaUpdate(validity="May - 2031"), germany, dry_run=False, current_user=admin)
+            check("no repite el aviso si ya la cumplían", len(outbox) == 3, str(len(outbox)))
+            check("sin búsquedas que lean los campos editados no se leen documentos", len(reads) == 1, str(len(reads)))
+
+            index.apply({"_id": "s3", "owner": "eva", "filters": {"agreement_type": "Convenio marco"}})
+            saved_searches.BULK_NOTIFY_LIMIT = 2
+            await update_convocatorias(ConvocatoriaUpdate(agreementType="Convenio marco"), germany,
+                                       dry_run=False, current_user=admin)
+            check("los avisos de una edición masiva tienen tope", len(outbox) == 5, str(len(outbox)))
+        finally:
+            saved_searches.BULK_NOTIFY_LIMIT = limit
+            for search_id in ("s1", "s2", "s3"):
+                index.remove(search_id)
+            index.ready = False
+            outbox._pending.clear()
+            # Las ediciones masivas recalculan las cachés en segundo plano sobre este repositorio
+            await asyncio.gather(*main._background_tasks, return_exceptions=True)
+            await repository.close()
+
+class _JobsCollection:
+    """Colección `jobs` sin tareas colgadas, para la pasada periódica del runner."""
+
+    async def update_many(self, query, update):
+        return SimpleNamespace(modified_count=0)
+
+
+async def run_exports() -> None:
+    from app import jobs
+
+    print("🧪 Limpieza de exportaciones")
+    with tempfile.TemporaryDirectory() as tmp:
+        old = datetime.now().timestamp() - (jobs.JOB_RETENTION_DAYS + 1) * 86400
+        def write(*names, modified=None):
+            for name in names:
+                with open(os.path.join(tmp, name), "w") as f:
+                    f.write("{}\n")
+                if modified:
+                    os.utime(os.path.join(tmp, name), (modified, modified))
+
+        write("convocatorias_nuevo.ndjson")
+        write("convocatorias_viejo.ndjson", "convocatorias_muerto.ndjson.part", "otro.txt", modified=old)
+        runner, export_dir = jobs.JobRunner(prune_interval=3600), jobs.EXPORT_DIR
+        jobs.EXPORT_DIR = tmp
+        try:
+            await runner._fail_stale(_JobsCollection())
+            check("revisar tareas colgadas no recorre la carpeta", len(os.listdir(tmp)) == 4)
+            await runner._prune_exports()
+            remaining = sorted(os.listdir(tmp))
+            check("se borran las exportaciones vencidas (también las que quedaron a medias)",
+                  remaining == ["convocatorias_nuevo.ndjson", "otro.txt"], str(remaining))
+            write("convocatorias_otro.ndjson", modified=old)
+            check("antes del intervalo no se vuelve a revisar", await runner._prune_exports() == 0
+                  and "convocatorias_otro.ndjson" in os.listdir(tmp))
+            runner._pruned_at -= 3600
+            check("pasado el intervalo sí", await runner._prune_exports() == 1)
+        finally:
+            jobs.EXPORT_DIR = export_dir
+            await runner.stop()
+    check("sin carpeta de exportaciones no hay nada que borrar", jobs.prune_exports(0, os.path.join(tmp, "no-existe")) == 0)
+
+    print("🧪 Exportaciones que fallan")
+    from bson import ObjectId
+
+    import app.repository
+
+    class _Repository:
+        fail = True
+
+        def __init__(self, get_collection):
+            pass
+
+        async def count(self, filters):
+            return 3
+
+        async def iterate(self, filters, skip, limit, batch_size):
+            for doc in SAMPLE[:2]:
+                yield {**prepare_document(dict(doc)), "_id": ObjectId()}
+            if _Repository.fail:
+                raise RuntimeError("se cortó la conexión")
+            yield {**prepare_document(dict(SAMPLE[2])), "_id": ObjectId()}
+
+    async def in_thread(fn, *args):
+        return fn(*args)
+
+    async def progress(*args):
+        pass
+
+    context = SimpleNamespace(id="falla", in_thread=in_thread, progress=progress)
+    with tempfile.TemporaryDirectory() as tmp:
+        originals = app.repository.MongoRepository, jobs._active_collection, jobs.EXPORT_DIR
+        app.repository.MongoRepository, jobs._active_collection, jobs.EXPORT_DIR = _Repository, lambda: None, tmp
+        try:
+            try:
+                await jobs._handlers["export"](context, {})
+                check("la exportación con error falla", False)
+            except RuntimeError:
+                pass
+            check("una exportación que falla no deja archivo", os.listdir(tmp) == [], str(os.listdir(tmp)))
+            _Repository.fail = False
+            result = await jobs._handlers["export"](context, {})
+            check("la que termina queda con su nombre final",
+                  os.listdir(tmp) == ["convocatorias_falla.ndjson"] and result["count"] == 3, str(os.listdir(tmp)))
+        finally:
+            app.repository.MongoRepository, jobs._active_collection, jobs.EXPORT_DIR = originals
+
+
+async def run_recommender() -> None:
+    from app.recommender import Recommender, profile_terms
+
+    print("🧪 Recomendador: escrituras incrementales")
+
+    def doc(doc_id, props, state="Vigente"):
+        return {"_id": doc_id, "Props": props, "languages": ["Inglés"], "country": "Alemania", "state": state}
+
+    medicine, art = profile_terms(["Medicina"], [], []), profile_terms(["Arte y diseño"], [], [])
+    index = Recommender()
+    index.build([doc("a", "Medicina\nSalud pública"), doc("b", "Arte y diseño\nArquitectura"),
+                 doc("c", "Ingeniería civil")])
+    check("recomienda por contenido", [i for i, _ in index.recommend(medicine, 2)] == ["a"],
+          str(index.recommend(medicine, 2)))
+
+    index.apply_change(doc("a", "Medicina\nSalud pública"), doc("a", "Arte y diseño\nHistoria del arte"))
+    check("una edición reemplaza la fila anterior", index.recommend(medicine, 3) == []
+          and {i for i, _ in index.recommend(art, 3)} == {"a", "b"}, str(index.recommend(art, 3)))
+    index.apply_change(None, doc("d", "Medicina"))
+    index.apply_change(None, doc("e", "Medicina", state="No Vigente"))
+    check("una alta se agrega sin reconstruir", [i for i, _ in index.recommend(medicine, 3)] == ["d"])
+    check("las no vigentes solo aparecen si se piden",
+          {i for i, _ in index.recommend(medicine, 3, only_active=False)} == {"d", "e"})
+    index.apply_change(doc("d", "Medicina"), None)
+    check("un borrado la quita", [i for i, _ in index.recommend(medicine, 3)] == [], str(index.recommend(medicine, 3)))
+
+    # Una escritura durante la reconstrucción se vuelve a aplicar sobre la matriz nueva
+    index.rebuilding = True
+    state = index.compute([doc("a", "Arte y diseño"), doc("g", "Medicina\nCirugía")])
+    index.apply_change(None, doc("f", "Medicina"))
+    index.install(state)
+    check("la escritura durante la reconstrucción no se pierde",
+          [i for i, _ in index.recommend(medicine, 3)] == ["f", "g"], str(index.recommend(medicine, 3)))
+
+
+async def run_similarity() -> None:
+    import numpy as np
+
+    from app import similarity
+    from app.recommender import document_terms, tfidf_matrix
+
+    print("🧪 Tabla de similares")
+    documents = [{**prepare_document(dict(doc)), "_id": f"d{i}"} for i, doc in enumerate(SAMPLE[:40])]
+    documents.append({"_id": "sola", "Props": "Astronomía", "country": "Atlántida", "agreementType": "Otro"})
+    block_size = similarity.BLOCK_SIZE
+    # Bloques pequeños: los vecinos deben ser los mismos aunque el cálculo se corte en varios
+    similarity.BLOCK_SIZE = 7
+    try:
+        table = similarity.NeighbourTable()
+        table.install(table.compute(documents))
+    finally:
+        similarity.BLOCK_SIZE = block_size
+
+    matrix, _, _ = tfidf_matrix([document_terms(doc, include_type=True) for doc in documents])
+    exact = (matrix @ matrix.T).toarray()
+    np.fill_diagonal(exact, -np.inf)
+    wrong = []
+    for row, doc in enumerate(documents[:-1]):
+        found = table.similar(doc["_id"])
+        scores = [score for _, score in found]
+        best = np.sort(exact[row][exact[row] > 0])[::-1][:similarity.NEIGHBOURS]
+        if doc["_id"] in {i for i, _ in found} or scores != sorted(scores, reverse=True) \
+                or not np.allclose(scores, best, atol=1e-5):
+            wrong.append(doc["_id"])
+    check("cada fila tiene sus vecinos más cercanos, ordenados y sin sí misma", not wrong, str(wrong))
+    check("k acota la respuesta", len(table.similar("d0", 3)) == 3)
+    check("sin términos en común no hay vecinos", table.similar("sola") == [], str(table.similar("sola")))
+    check("un id desconocido no está en la tabla", table.similar("otro") is None)
+    small = similarity.NeighbourTable()
+    small.install(small.compute(documents[:2]))
+    check("con menos documentos que vecinos", [i for i, _ in small.similar("d0")] == ["d1"], str(small.similar("d0")))
+
+
+async def run_stats() -> None:
+    from app import stats
+
+    print("🧪 Estadísticas incrementales")
+    check("claves válidas para MongoDB", [stats.bucket_key(v) for v in ("U. Nac.", "$x", None, "", 2024)]
+          == ["U· Nac·", "x", stats.MISSING, stats.MISSING, "2024"])
+    check("una edición mueve el conteo de un valor a otro",
+          stats.delta({"country": "Chile", "state": "Vigente"}, {"country": "Perú", "state": "Vigente"})
+          == {"byCountry.Perú": 1, "byCountry.Chile": -1})
+    check("un alta suma el total", stats.delta(None, {"country": "Chile"})["total"] == 1)
+    check("una edición sin cambios de dimensiones no escribe nada",
+          stats.delta({"country": "Chile", "Props": "a"}, {"country": "Chile", "Props": "b"}) == {})
+
+    # Una serie de escrituras aplicada con deltas coincide con contar el resultado desde cero
+    documents = {i: {"country": doc.get("country"), "subscriptionYear": doc.get("subscriptionYear"),
+                     "agreementType": doc.get("agreementType"), "state": doc.get("state")}
+                 for i, doc in enumerate(SAMPLE[:30])}
+    counts = Counter()
+    for doc in documents.values():
+        counts.update(stats.document_counts(doc))
+    for i in range(0, 30, 3):
+        after = {**documents[i], "country": "Austria", "state": "No Vigente"}
+        counts.update(stats.delta(documents[i], after))
+        documents[i] = after
+    for i in (1, 4):
+        counts.update(stats.delta(documents.pop(i), None))
+    groups = Counter(tuple(sorted(doc.items())) for doc in documents.values())
+    counts.update(stats.bulk_delta([(dict(values), n) for values, n in groups.items()], {"agreementType": "Marco"}))
+    for doc in documents.values():
+        doc["agreementType"] = "Marco"
+    expected = Counter()
+    for doc in documents.values():
+        expected.update(stats.document_counts(doc))
+    check("los deltas acumulados igualan un recálculo", +counts == +expected,
+          str((+counts - +expected) + (+expected - +counts)))
+    check("un borrado masivo resta cada grupo",
+          stats.bulk_delta([({"country": "Chile", "state": "Vigente"}, 3)], None)
+          == {"total": -3, "byCountry.Chile": -3, "byState.Vigente": -3,
+              f"byYear.{stats.MISSING}": -3, f"byType.{stats.MISSING}": -3})
+
+    presented = stats.present({"total": 3, "byCountry": {"Chile": 1, "Perú": 2, "Austria": 0},
+                               "byYear": {"2021": 1, "2019": 2}})
+    check("la respuesta omite los ceros y ordena", list(presented["byCountry"]) == ["Perú", "Chile"]
+          and list(presented["byYear"]) == ["2019", "2021"], str(presented))
+
+
+async def run_dedupe() -> None:
+    from app.dedupe import DuplicateIndex
+
+    print("🧪 Duplicados")
+    documents = [
+        {"_id": "a", "country": "Alemania", "institution": "", "Props": ""},
+        {"_id": "b", "country": "Alemania", "institution": None, "Props": "Medicina"},
+        {"_id": "c", "country": "Alemania", "institution": "Universität Wien", "Props": ""},
+        {"_id": "d", "country": "Alemania", "institution": "Universitat Wien", "Props": ""},
+    ]
+    duplicates = DuplicateIndex()
+    duplicates.build(documents)
+    check("las convocatorias sin institución no se agrupan entre sí",
+          [cluster["ids"] for cluster in duplicates.clusters] == [["c", "d"]], str(duplicates.clusters))
+    check("una convocatoria nueva sin institución no tiene duplicados",
+          duplicates.find({"country": "Alemania", "institution": "", "Props": ""}) == [])
+    duplicates.build(documents[:2])
+    check("un catálogo sin instituciones no tiene grupos", duplicates.clusters == [], str(duplicates.clusters))
+
+    # Misma institución (mismo grupo LSH en todas las bandas): solo las `Props` distinguen a la primera
+    documents = [
+        {"_id": "x", "country": "Chile", "institution": "Universidad de Chile", "Props": "Derecho"},
+        {"_id": "y", "country": "Chile", "institution": "Universidad de Chile", "Props": "Medicina\nOdontología"},
+        {"_id": "z", "country": "Chile", "institution": "Universidad de Chile", "Props": "Medicina\nOdontología"},
+    ]
+    clusters = DuplicateIndex.compute(documents, threshold=0.9)["clusters"]
+    check("se agrupan dos duplicados aunque no se parezcan al primero del grupo LSH",
+          [cluster["ids"] for cluster in clusters] == [["y", "z"]], str(clusters))
+
+
+async def run_rebuilds() -> None:
+    from app import main
+
+    print("🧪 Recálculo de similares tras escrituras")
+    calls, started, release = [], asyncio.Event(), asyncio.Event()
+
+    async def rebuild(repository):
+        calls.append(len(calls))
+        started.set()
+        await release.wait()
+
+    main._rebuild_later(rebuild, "prueba", delay=0.01)
+    main._rebuild_later(rebuild, "prueba", delay=0.01)
+    await started.wait()
+    # Escritura mientras se recalcula: el cálculo en curso ya leyó el catálogo
+    main._rebuild_later(rebuild, "prueba", delay=0.01)
+    release.set()
+    await main._pending_rebuilds["prueba"]
+    check("una ráfaga antes de calcular se recalcula una vez y la escritura durante el cálculo otra más",
+          len(calls) == 2, str(calls))
+    main._rebuild_later(rebuild, "prueba", delay=0.01)
+    await main._pending_rebuilds["prueba"]
+    check("sin escrituras durante el cálculo no se repite", len(calls) == 3, str(calls))
+
+
+async def mongo_database():
+    """Base de pruebas en MongoDB (`MONGO_URI`), o None si no hay un servidor al alcance."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.getenv("MONGO_URI") or "mongodb://localhost:27017", serverSelectionTimeoutMS=1000)
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        client.close()
+        print("   ⏭️  Sin MongoDB: se omiten las verificaciones contra la base")
+        return None
+    return client[f"services_test_{os.getpid()}"]
+
+
+async def run_planner() -> None:
+    from app.models import ConvocatoriaFilters
+    from app.query_planner import explain_filter_combinations, explain_sort_orders, plan_query
+    from app.sorting import resolve_sort
+
+    print("🧪 Planificador de consultas")
+    plan = plan_query(ConvocatoriaFilters(country="  ALEMANIA ", state="Vigente"))
+    check("los filtros de igualdad van contra los campos normalizados",
+          plan.filter == {"norm.country": "alemania", "norm.state": "vigente"}, str(plan.filter))
+    check("estado y país usan el índice compuesto", plan.hint == "norm_state_country_index", str(plan.hint))
+    check("solo país usa su índice", plan_query(ConvocatoriaFilters(country="Chile")).hint == "norm_country_index")
+    check("idioma y estado usan el índice compuesto",
+          plan_query(ConvocatoriaFilters(language="Inglés", state="Vigente")).hint == "norm_languages_state_index")
+    plan = plan_query(ConvocatoriaFilters(subscription_level="Facultad (Ing.*"))
+    check("el nivel se busca por prefijo escapado",
+          plan.filter == {"norm.subscriptionLevel": {"$regex": r"^facultad\ \(ing\.\*"}}, str(plan.filter))
+    check("las fechas usan el índice de vigencia",
+          plan_query(ConvocatoriaFilters(valid_after=date(2030, 1, 1))).hint == "validUntil_index")
+    plan = plan_query(ConvocatoriaFilters(q="ingeniería", country="Chile"))
+    check("con texto no hay hint", plan.hint is None and "$text" in plan.filter, str(plan))
+    plan = plan_query(ConvocatoriaFilters(state="Vigente"), resolve_sort((("country", -1),), text=False))
+    check("un orden (aun invertido) usa su índice", plan.hint == "sort_country_institution_index", str(plan.hint))
+    plan = plan_query(ConvocatoriaFilters(state="Vigente"), resolve_sort((("validUntil", 1),), text=False))
+    check("el orden por vigencia aprovecha la igualdad de estado", plan.hint == "norm_state_validUntil_index",
+          str(plan.hint))
+
+    database = await mongo_database()
+    if database is None:
+        return
+    from app.indexes import ensure_indexes
+
+    collection = database.get_collection("planner")
+    try:
+        await collection.insert_many([prepare_document(dict(doc)) for doc in SAMPLE[:50]])
+        await ensure_indexes(collection)
+        explained = {**await explain_filter_combinations(collection), **await explain_sort_orders(collection)}
+        bad = {combo: stages for combo, stages in explained.items() if "COLLSCAN" in stages or "SORT" in stages}
+        check("explain(): ninguna combinación hace COLLSCAN ni SORT", not bad, str(bad))
+    finally:
+        await database.client.drop_database(database.name)
+        database.client.close()
+
+
+async def run_preprocessing() -> None:
+    print("🧪 Pre-procesamiento por columnas")
+    import json
+
+    from app.preprocessing import InstitutionCanonicalizer, encode_rows, process_batch
+
+    records = [
+        {"institution": "Universidad Técnica de Múnich", "country": "Alemania", "languages": "Alemán / Inglés",
+         "validity": "March - 2024", "state": "Vigente"},
+        # Misma institución con otra escritura, idiomas ya en lista y vigencia indefinida
+        {"institution": "UNIVERSIDAD TECNICA DE MUNICH", "country": "Alemania", "languages": ["Alemán", "Inglés"],
+         "validity": "Indefinida", "state": "No Vigente"},
+        {"institution": "", "country": "Chile"},
+    ]
+    institutions = InstitutionCanonicalizer()
+    columns, skipped = process_batch(records, date(2025, 1, 1), institutions)
+    check("los registros sin institución se omiten", skipped == 1 and len(columns["country"]) == 2)
+    check("las variantes de la institución se unifican",
+          set(columns["institution"]) == {"Universidad Técnica de Múnich"} and institutions.variants == 1)
+    check("los idiomas en texto o en lista dan lo mismo",
+          columns["languages"] == [["Alemán", "Inglés"], ["Alemán", "Inglés"]], str(columns["languages"]))
+    check("la vigencia vencida deriva el estado", columns["validUntil"] == ["2024-03-31", None]
+          and columns["state"] == ["No Vigente", "Vigente"], f"{columns['validUntil']} {columns['state']}")
+
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    lines = encode_rows(columns, encode)
+    expected = [{key: values[i] for key, values in columns.items() if values[i] is not None} for i in range(2)]
+    check("cada fila es el JSON de sus valores no nulos", [json.loads(line) for line in lines] == expected, lines[0])
+
+
+class _IndexedCollection:
+    """Colección falsa con índices: basta para comparar el registro con lo que hay en la base."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.dropped, self.created = [], []
+
+    async def index_information(self):
+        return {name: dict(info) for name, info in self.indexes.items()}
+
+    async def drop_index(self, name):
+        self.dropped.append(name)
+        del self.indexes[name]
+
+    async def create_indexes(self, models):
+        for model in models:
+            document = dict(model.document)
+            self.created.append(document["name"])
+            self.indexes[document.pop("name")] = {**document, "key": list(document["key"].items())}
+
+
+async def run_indexes() -> None:
+    print("🧪 Registro de índices")
+    from app.indexes import INDEXES, ensure_indexes
+
+    collection = _IndexedCollection({"_id_": {"key": [("_id", 1)]}})
+    report = await ensure_indexes(collection)
+    check("sin índices se crean todos", len(report["created"]) == len(INDEXES), str(report))
+    report = await ensure_indexes(collection)
+    check("una segunda pasada no cambia nada", not report["created"] and not report["recreated"], str(report))
+
+    # Mismas claves, otras opciones: un sourceKey que dejó de ser único o sin filtro parcial no sirve
+    collection.indexes["sourceKey_index"].pop("unique")
+    collection.indexes["norm_state_index"]["partialFilterExpression"] = {"state": {"$exists": True}}
+    collection.indexes["validUntil_index"]["expireAfterSeconds"] = 3600
+    collection.created.clear()
+    report = await ensure_indexes(collection)
+    drifted = {"sourceKey_index", "norm_state_index", "validUntil_index"}
+    check("las opciones distintas se detectan", set(report["recreated"]) == drifted, str(report["recreated"]))
+    check("y el índice se vuelve a crear", set(collection.dropped) == set(collection.created) == drifted,
+          f"{collection.dropped} {collection.created}")
+    check("con las opciones del registro", collection.indexes["sourceKey_index"].get("unique") is True
+          and "expireAfterSeconds" not in collection.indexes["validUntil_index"])
+
+    collection.indexes["norm_country_index"]["key"] = [("country", 1)]
+    collection.indexes["viejo_index"] = {"key": [("viejo", 1)]}
+    report = await ensure_indexes(collection)
+    check("las claves distintas también", report["recreated"] == ["norm_country_index"], str(report))
+    check("los no registrados solo se informan", report["unmanaged"] == ["viejo_index"], str(report))
+    report = await ensure_indexes(collection, prune=True)
+    check("con prune se eliminan", report["dropped"] == ["viejo_index"] and "viejo_index" not in collection.indexes)
+
+
+def _matches(document, query) -> bool:
+    """Subconjunto de los filtros de MongoDB que usa el puntero del catálogo."""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(document, option) for option in condition):
+                return False
+            continue
+        if "." in field:
+            array, key = field.split(".", 1)
+            if not any(item.get(key) == condition for item in document.get(array, [])):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if "$exists" in condition and (field in document) != condition["$exists"]:
+                return False
+            if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class _MetaCollection:
+    """`catalog_meta` en memoria: las operaciones del puntero en `app.catalog`."""
+
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one(self, query, projection=None):
+        return next((dict(doc) for doc in self.documents.values() if _matches(doc, query)), None)
+
+    def _update(self, document, update, inserted):
+        for field, value in {**update.get("$set", {}), **(update.get("$setOnInsert", {}) if inserted else {})}.items():
+            if field.startswith("writers.$."):
+                continue
+            document[field] = value
+        for field in update.get("$unset", {}):
+            document.pop(field, None)
+        for field, value in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + value
+        for field, value in update.get("$push", {}).items():
+            document[field] = document.get(field, []) + (value["$each"] if isinstance(value, dict) and "$each" in value else [value])
+        for field, condition in update.get("$pull", {}).items():
+            document[field] = [item for item in document.get(field, []) if not _matches(item, condition)]
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        from pymongo.errors import DuplicateKeyError
+
+        for document in self.documents.values():
+            if _matches(document, query):
+                self._update(document, update, False)
+                return dict(document)
+        if not upsert:
+            return None
+        if query["_id"] in self.documents:
+            raise DuplicateKeyError("E11000 duplicate key")
+        document = self.documents[query["_id"]] = {"_id": query["_id"]}
+        self._update(document, update, True)
+        return dict(document)
+
+    async def update_one(self, query, update, upsert=False):
+        await self.find_one_and_update(query, update, upsert=upsert)
+
+
+class _Database:
+    def __init__(self, **collections):
+        self.meta = _MetaCollection()
+        self.collections = collections
+
+    def get_collection(self, name):
+        return self.collections.get(name, self.meta)
+
+
+class _LinkCollection:
+    """Catálogo o caché `link_checks` en memoria: `find` y `bulk_write` de `UpdateOne` con `$set`."""
+
+    def __init__(self, documents, database=None):
+        self.documents = {doc["_id"]: doc for doc in documents}
+        self.database = database
+        self.writes = 0
+
+    def find(self, query, projection=None):
+        ids = query.get("_id", {}).get("$in")
+        return _Cursor([dict(doc) for key, doc in self.documents.items() if ids is None or key in ids])
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.writes += 1
+            document = self.documents.setdefault(operation._filter["_id"], {"_id": operation._filter["_id"]})
+            document.update(operation._doc["$set"])
+
+
+async def run_catalog_writes() -> None:
+    from app import catalog
+
+    print("🧪 Permisos de escritura durante una recarga blue/green")
+    # Sin los suscriptores de la app (reconstruirían cachés sobre repositorios ya cerrados)
+    listeners, bulk_listeners = catalog._listeners[:], catalog._bulk_change_listeners[:]
+    catalog._listeners.clear()
+    catalog._bulk_change_listeners.clear()
+    try:
+        await _check_catalog_writes(catalog)
+    finally:
+        catalog._listeners[:], catalog._bulk_change_listeners[:] = listeners, bulk_listeners
+
+    process = await asyncio.create_subprocess_exec(sys.executable, "load_data.py", "--dry-run", "--blue-green",
+                                                   stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    _, stderr = await process.communicate()
+    check("load_data.py rechaza --dry-run con --blue-green", process.returncode == 2, stderr.decode()[-200:])
+
+
+async def _check_catalog_writes(catalog) -> None:
+    database = _Database()
+    pointer = database.meta.documents
+    async with catalog.write_lease(database):
+        check("sin recarga se da el permiso", len(pointer[catalog.POINTER_ID]["writers"]) == 1, str(pointer))
+    check("el permiso se devuelve al terminar", pointer[catalog.POINTER_ID]["writers"] == [])
+
+    release = asyncio.Event()
+
+    async def slow_write():
+        async with catalog.write_lease(database):
+            await release.wait()
+
+    writer = asyncio.create_task(slow_write())
+    await asyncio.sleep(0)
+    await catalog.begin_build(database, "convocatorias_v2")
+    waiting = asyncio.create_task(catalog.wait_for_writers(database, interval=0.01))
+    await asyncio.sleep(0.05)
+    check("la recarga espera a la escritura que empezó antes", not waiting.done())
+    release.set()
+    await writer
+    await asyncio.wait_for(waiting, 1)
+    check("y copia cuando termina", waiting.done() and waiting.exception() is None)
+
+    # Un proceso que no llegó a refrescar la marca igual recibe el rechazo de la base
+    catalog._set_building({})
+    try:
+        async with catalog.write_lease(database):
+            pass
+        blocked = False
+    except catalog.WritesBlocked:
+        blocked = True
+    check("durante la recarga no se da el permiso aunque la marca local no esté al día", blocked)
+    check("y el proceso aprende la marca", catalog.writes_blocked())
+
+    await catalog.publish(database, "convocatorias_v2")
+    async with catalog.write_lease(database):
+        check("activada la versión nueva se vuelve a escribir", not catalog.writes_blocked())
+
+    print("🧪 Cambios masivos de otros procesos")
+    announced = []
+    listener = catalog.on_bulk_change(lambda operation, count: announced.append((operation, count)))
+    try:
+        await catalog.refresh(database)
+        await catalog.publish_bulk_change("load", 10, database)
+        await catalog.refresh(database)
+        check("quien anuncia se avisa una sola vez", announced == [("load", 10)], str(announced))
+        # Otro proceso (p. ej. load_data.py) registra una carga en el puntero
+        pointer[catalog.POINTER_ID]["revision"] += 1
+        await catalog.refresh(database)
+        check("los demás procesos la ven al refrescar el puntero", announced[-1] == ("remote", 1), str(announced))
+    finally:
+        catalog._bulk_change_listeners.remove(listener)
+        await catalog._apply(catalog.BASE_COLLECTION, 0)
+        catalog._revision = None
+
+
+
+async def run_link_cache() -> None:
+    import httpx
+
+    from app import catalog
+    from app.links import LINK_CHECKS_COLLECTION, LinkChecker, check_catalogue
+
+    print("🧪 Caché de la verificación de enlaces")
+    requests = []
+
+    def respond(request):
+        requests.append((request.url.path, request.headers.get("if-none-match")))
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, headers={"etag": '"v1"'})
+
+    cache = _LinkCollection([])
+    database = _Database(**{LINK_CHECKS_COLLECTION: cache})
+    collection = _LinkCollection([
+        {"_id": "d1", "dreLink": "http://example.org/ok", "agreementLink": "http://example.org/missing"},
+        {"_id": "d2", "dreLink": "http://example.org/ok", "internationalLink": "no es una URL"},
+    ], database)
+    checker = LinkChecker(client=httpx.AsyncClient(transport=httpx.MockTransport(respond)))
+    try:
+        report = await check_catalogue(collection, checker)
+        check("la primera vez se verifica cada URL distinta una vez", report["checked"] == 2 and len(requests) == 2,
+              str(requests))
+        check("el estado queda en cada documento", collection.documents["d1"]["hasBrokenLinks"] is True
+              and collection.documents["d2"]["hasBrokenLinks"] is False
+              and set(collection.documents["d2"]["links"]) == {"dreLink"})
+
+        requests.clear()
+        report = await check_catalogue(collection, checker)
+        check("con la caché vigente no hay peticiones", report["checked"] == 0 and report["cached"] == 2
+              and not requests, str(report))
+        check("ni escrituras de documentos sin cambios", report["documentsUpdated"] == 0)
+
+        cache.documents["http://example.org/ok"]["expiresAt"] = datetime(2000, 1, 1)
+        report = await check_catalogue(collection, checker)
+        check("solo se vuelve a verificar la vencida", report["checked"] == 1, str(report))
+        check("con una petición condicional", requests[-1] == ("/ok", '"v1"'), str(requests))
+        check("un 304 la mantiene sana y renueva su vencimiento", report["broken"] == 1
+              and cache.documents["http://example.org/ok"]["expiresAt"].year > 2000)
+
+        report = await check_catalogue(collection, checker, force=True)
+        check("force verifica todo", report["checked"] == 2, str(report))
+
+        # Durante una recarga blue/green se actualiza la caché pero no el catálogo
+        database.meta.documents[catalog.POINTER_ID] = {"_id": catalog.POINTER_ID, "building": "convocatorias_v2",
+                                                       "buildStartedAt": datetime.now(timezone.utc)}
+        cache.documents["http://example.org/missing"]["expiresAt"] = datetime(2000, 1, 1)
+        collection.documents["d1"]["hasBrokenLinks"] = None
+        writes = collection.writes
+        report = await check_catalogue(collection, checker)
+        check("sin permiso de escritura no se tocan los documentos", report["documentsUpdated"] == 0
+              and collection.writes == writes and report["checked"] == 1, str(report))
+    finally:
+        catalog._set_building({})
+        await checker.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_admission())
+    asyncio.run(run_rate_limit())
+    asyncio.run(run_singleflight())
+    asyncio.run(run_circuit())
+    asyncio.run(run_links())
+    asyncio.run(run_link_cache())
+    asyncio.run(run_loader())
+    asyncio.run(run_expiry())
+    asyncio.run(run_saved_search_matching())
+    asyncio.run(run_saved_searches())
+    asyncio.run(run_exports())
+    asyncio.run(run_recommender())
+    asyncio.run(run_similarity())
+    asyncio.run(run_stats())
+    asyncio.run(run_dedupe())
+    asyncio.run(run_rebuilds())
+    asyncio.run(run_preprocessing())
+    asyncio.run(run_indexes())
+    asyncio.run(run_planner())
+    asyncio.run(run_catalog_writes())
+    print("\n✅ Todas las verificaciones pasaron" if not failures else f"\n❌ {failures} verificaciones fallidas")
+    sys.exit(1 if failures else 0)